@@ -0,0 +1,222 @@
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, event, false, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Report, ReportLocation
+from regions import get_region_index, region_filter, report_regions
+from utils import logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LOCATION_K = int(os.environ.get('LOCATION_K', 5))
+LOCATION_BASE_DEGREES = float(os.environ.get('LOCATION_BASE_DEGREES', 0.01))
+LOCATION_LEVELS = 10
+LOCATION_WRITE_BATCH = 5000
+
+def cell_size(level: int) -> float:
+    return LOCATION_BASE_DEGREES * (2 ** level)
+
+def _cell_indexes(latitudes, longitudes, level: int):
+    size = cell_size(level)
+    return np.floor(longitudes / size).astype(np.int64), np.floor(latitudes / size).astype(np.int64)
+
+def _cell_keys(latitudes, longitudes, level: int):
+    ix, iy = _cell_indexes(latitudes, longitudes, level)
+    return (ix << 32) | (iy & 0xFFFFFFFF)
+
+def top_cell(latitude: float, longitude: float) -> str:
+    size = cell_size(LOCATION_LEVELS - 1)
+    return f'{int(longitude // size)}:{int(latitude // size)}'
+
+def assign_levels(latitudes, longitudes, k: int = LOCATION_K):
+    # Top-down over a nested grid where each level doubles the cell size.
+    # When a cell splits, children with at least k reports move down a level.
+    # The rest stay published at the parent cell. If that leftover would be
+    # 1..k-1 reports, the smallest qualifying child stays with it, so every
+    # published cell holds at least k reports. Points whose coarsest cell
+    # has fewer than k reports are suppressed (-1).
+    count = len(latitudes)
+    levels = np.full(count, -1, dtype=np.int8)
+    if not count:
+        return levels
+
+    _, inverse, counts = np.unique(_cell_keys(latitudes, longitudes, LOCATION_LEVELS - 1),
+                                   return_inverse=True, return_counts=True)
+    active = counts[inverse] >= k
+
+    for level in range(LOCATION_LEVELS - 1, 0, -1):
+        positions = np.flatnonzero(active)
+        if not len(positions):
+            break
+
+        lat, lng = latitudes[positions], longitudes[positions]
+        parents, parent_inverse = np.unique(_cell_keys(lat, lng, level), return_inverse=True)
+        _, first, child_inverse, child_counts = np.unique(_cell_keys(lat, lng, level - 1), return_index=True,
+                                                          return_inverse=True, return_counts=True)
+        child_parent = parent_inverse[first]
+
+        small = child_counts < k
+        leftover = np.bincount(child_parent, weights=child_counts * small, minlength=len(parents))
+        short = (leftover > 0) & (leftover < k)
+
+        pulled = np.zeros(len(child_counts), dtype=bool)
+        candidates = np.flatnonzero(~small & short[child_parent])
+        if len(candidates):
+            order = candidates[np.lexsort((child_counts[candidates], child_parent[candidates]))]
+            first_per_parent = np.r_[True, child_parent[order][1:] != child_parent[order][:-1]]
+            pulled[order[first_per_parent]] = True
+
+        stop = positions[(small | pulled)[child_inverse.ravel()]]
+        levels[stop] = level
+        active[stop] = False
+
+    levels[active] = 0
+    return levels
+
+def published_coordinates(latitudes, longitudes, levels):
+    published_lat = np.full(len(levels), np.nan)
+    published_lng = np.full(len(levels), np.nan)
+
+    for level in np.unique(levels[levels >= 0]):
+        mask = levels == level
+        ix, iy = _cell_indexes(latitudes[mask], longitudes[mask], int(level))
+        size = cell_size(int(level))
+        published_lng[mask] = np.round((ix + 0.5) * size, 6)
+        published_lat[mask] = np.round((iy + 0.5) * size, 6)
+
+    return published_lat, published_lng
+
+def _assign(rows: List[Tuple[str, float, float]]) -> List[Dict[str, Any]]:
+    ids = [row[0] for row in rows]
+    latitudes = np.fromiter((row[1] for row in rows), dtype=float, count=len(rows))
+    longitudes = np.fromiter((row[2] for row in rows), dtype=float, count=len(rows))
+
+    levels = assign_levels(latitudes, longitudes)
+    published_lat, published_lng = published_coordinates(latitudes, longitudes, levels)
+
+    now = datetime.utcnow()
+    return [{
+        'report_id': report_id,
+        'top_cell': top_cell(latitudes[i], longitudes[i]),
+        'level': int(levels[i]) if levels[i] >= 0 else None,
+        'latitude': None if np.isnan(published_lat[i]) else float(published_lat[i]),
+        'longitude': None if np.isnan(published_lng[i]) else float(published_lng[i]),
+        'updated_at': now
+    } for i, report_id in enumerate(ids)]
+
+def _write(rows: List[Dict[str, Any]]) -> None:
+    statement = sqlite_insert(ReportLocation)
+    upsert = statement.on_conflict_do_update(
+        index_elements=['report_id'],
+        set_={column: statement.excluded[column] for column in ('top_cell', 'level', 'latitude', 'longitude', 'updated_at')}
+    )
+    for start in range(0, len(rows), LOCATION_WRITE_BATCH):
+        db.session.execute(upsert, rows[start:start + LOCATION_WRITE_BATCH])
+
+def record_verified_locations(report_ids: List[str]) -> int:
+    if not report_ids:
+        return 0
+
+    if np is None:
+        logger.warning('numpy is not installed; verified reports are published without coordinates')
+        return 0
+
+    new_rows = db.session.query(Report.id, Report.latitude, Report.longitude) \
+        .filter(Report.id.in_(report_ids)).all()
+    cells = {top_cell(latitude, longitude) for _, latitude, longitude in new_rows}
+
+    # Assignments in different top-level cells are independent, so only the
+    # cells that gained reports need to be recomputed.
+    existing = db.session.query(
+        Report.id, Report.latitude, Report.longitude,
+        ReportLocation.level, ReportLocation.latitude, ReportLocation.longitude
+    ).join(ReportLocation, ReportLocation.report_id == Report.id) \
+        .filter(ReportLocation.top_cell.in_(cells), Report.status == 'verified').all()
+
+    current = {row[0]: (row[3], row[4], row[5]) for row in existing}
+    rows = [row[:3] for row in existing] + [row for row in new_rows if row[0] not in current]
+
+    changed = [row for row in _assign(rows)
+               if current.get(row['report_id']) != (row['level'], row['latitude'], row['longitude'])]
+    _write(changed)
+    # Reports that were already published moved to a different cell; the
+    # newly verified ones get their upsert from the caller.
+    _record_moved([row['report_id'] for row in changed if row['report_id'] in current])
+    return len(changed)
+
+def _record_moved(report_ids: List[str]) -> None:
+    # changes imports this module for published_locations.
+    from changes import record_report_changes, CHANGE_UPSERT
+
+    record_report_changes(report_ids, CHANGE_UPSERT)
+
+def rebuild_locations() -> int:
+    if np is None:
+        logger.warning('numpy is not installed; published locations were not rebuilt')
+        return 0
+
+    rows = db.session.query(Report.id, Report.latitude, Report.longitude) \
+        .filter(Report.status == 'verified').all()
+    current = {report_id: (level, latitude, longitude) for report_id, level, latitude, longitude in
+               db.session.query(ReportLocation.report_id, ReportLocation.level,
+                                ReportLocation.latitude, ReportLocation.longitude)}
+
+    assigned = _assign(rows) if rows else []
+    db.session.execute(delete(ReportLocation))
+    _write(assigned)
+    _record_moved([row['report_id'] for row in assigned
+                   if current.get(row['report_id']) != (row['level'], row['latitude'], row['longitude'])])
+    db.session.commit()
+    return len(rows)
+
+def published_locations(report_ids: List[str]) -> Dict[str, Tuple[Optional[float], Optional[float], Optional[float]]]:
+    if not report_ids:
+        return {}
+
+    rows = db.session.query(ReportLocation.report_id, ReportLocation.latitude,
+                            ReportLocation.longitude, ReportLocation.level) \
+        .filter(ReportLocation.report_id.in_(report_ids))
+    return {report_id: (latitude, longitude, cell_size(level) if level is not None else None)
+            for report_id, latitude, longitude, level in rows}
+
+def _region_visible(span: float, size: Optional[float]) -> bool:
+    # A region smaller than the published cell would place the report more
+    # precisely than its published coordinates do.
+    return size is not None and span >= size
+
+def public_report_regions(locations: Dict[str, Tuple[Optional[float], Optional[float], Optional[float]]]) \
+        -> Dict[str, List[str]]:
+    index = get_region_index()
+    if not index:
+        return {}
+
+    visible = {}
+    for report_id, region_ids in report_regions(list(locations)).items():
+        size = locations[report_id][2]
+        visible[report_id] = [region_id for region_id in region_ids
+                              if region_id in index.regions and _region_visible(index.regions[region_id].span, size)]
+    return visible
+
+def public_region_filter(region_id: str):
+    index = get_region_index()
+    region = index.regions.get(region_id) if index else None
+    if region is None:
+        return false()
+
+    levels = [level for level in range(LOCATION_LEVELS) if _region_visible(region.span, cell_size(level))]
+    if not levels:
+        return false()
+
+    return and_(region_filter(region_id), Report.id.in_(
+        select(ReportLocation.report_id).where(ReportLocation.level <= max(levels))
+    ))
+
+@event.listens_for(Report, 'after_delete')
+def _remove_report_location(mapper, connection, target):
+    connection.execute(delete(ReportLocation).where(ReportLocation.report_id == target.id))
@@ -1,75 +1,164 @@
 import os
 from datetime import datetime
 from flask import Flask, jsonify, request
+from flask.cli import ScriptInfo
 from flask_cors import CORS
-from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_caching import Cache
+import click
 
 from models import db
 from routes import api
+from commands import register_commands
+from tasks import register_task, start_background_tasks
+from leases import expire_stale_leases
+from events import poll_events, prune_events
+from changes import compact_changes
+from utils import cleanup_expired_downloads
+from rollups import rebuild_rollups, quote_cache_stats
+from payments import process_payment_events, payment_queue_depth
+from refcodes import refill_reference_codes, code_pool, permutation_key
+from dedup import prune_lsh_buckets, index_pending_reports
+from anonymity import rebuild_locations
+from metrics import instrument_blueprint, register_collector, flush_metrics, metrics_response, \
+    METRICS_FLUSH_SECONDS
+from tracking import tracking_cache_stats
+from profiler import profile_blueprint
+from health import refresh_health, HEALTH_REFRESH_SECONDS
+from uploads import sweep_uploads
+from schema import init_schema
+
+DEFAULT_RATE_LIMIT = "1000 per hour"
 
 def create_app():
     app = Flask(__name__)
 
     app.config['SECRET_KEY'] = 'dev-secret-key-hardcoded'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///civicvoice.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///civicvoice.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TESTING'] = os.environ.get('TESTING', 'false').lower() == 'true'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    }
+    app.config['BACKGROUND_TASKS'] = os.environ.get('BACKGROUND_TASKS', 'true').lower() == 'true'
+    app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+
+    # Refuse to start rather than hand out enumerable reference codes.
+    permutation_key()
 
     db.init_app(app)
     CORS(app, origins=['*'])
-    migrate = Migrate(app, db)
+
+    cli = click.get_current_context(silent=True)
+    if cli is not None and cli.find_object(ScriptInfo) is not None:
+        # Alembic takes longer to import than the rest of the app together and
+        # only the `flask db` commands use it.
+        from flask_migrate import Migrate
+        Migrate(app, db)
 
     limiter = Limiter(
         key_func=get_remote_address,
         app=app,
-        default_limits=["1000 per hour"],
+        default_limits=[DEFAULT_RATE_LIMIT],
         storage_uri="memory://"
     )
 
     cache = Cache(app, config={'CACHE_TYPE': 'simple'})
 
+    instrument_blueprint(api)
+    profile_blueprint(api)
     app.register_blueprint(api, url_prefix='/api')
-
-    with app.app_context():
-        db.create_all()
-
+    register_commands(app)
+
+    # Orchestrator probes poll far more often than any client limit allows.
+    limiter.exempt(app.view_functions['api.health_check'])
+    limiter.exempt(app.view_functions['api.readiness_check'])
+
+    register_task('expire_moderation_leases', 60, expire_stale_leases)
+    register_task('poll_moderation_events', 1, poll_events)
+    register_task('prune_moderation_events', 3600, prune_events)
+    register_task('compact_report_changes', 3600, compact_changes)
+    register_task('cleanup_expired_downloads', 3600, cleanup_expired_downloads)
+    register_task('rebuild_report_rollups', 24 * 3600, rebuild_rollups)
+    register_task('process_payment_events', 2, process_payment_events)
+    register_task('refill_reference_codes', 5, refill_reference_codes)
+    register_task('prune_lsh_buckets', 24 * 3600, prune_lsh_buckets)
+    register_task('index_duplicate_candidates', 5, index_pending_reports, exclusive=True)
+    register_task('rebuild_published_locations', 24 * 3600, rebuild_locations)
+    register_task('flush_metrics', METRICS_FLUSH_SECONDS, flush_metrics)
+    register_task('refresh_health', HEALTH_REFRESH_SECONDS, refresh_health, dedicated=True)
+    register_task('sweep_orphan_uploads', 6 * 3600, sweep_uploads)
+
+    register_collector('quote', quote_cache_stats)
+    register_collector('tracking', tracking_cache_stats)
+
+    @app.before_request
+    def ensure_background_tasks():
+        start_background_tasks(app)
+
+    register_app_routes(app)
+
+    # Schema changes are applied by `flask init-db`, never as an import side effect.
     return app
 
-app = create_app()
-
-@app.route('/')
-def index():
-    return jsonify({
-        'name': 'CivicVoice API',
-        'version': '1.0.0',
-        'status': 'running',
-        'timestamp': datetime.utcnow().isoformat(),
-        'endpoints': {
-            'health': '/api/health',
-            'login': '/api/auth/login',
-            'register': '/api/auth/register',
-            'reports': '/api/reports'
-        }
-    })
-
-@app.route('/favicon.ico')
-def favicon():
-    return '', 204
-
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({'error': 'Not found'}), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    db.session.rollback()
-    return jsonify({'error': 'Internal server error'}), 500
+def register_app_routes(app):
+    @app.route('/')
+    def index():
+        return jsonify({
+            'name': 'CivicVoice API',
+            'version': '1.0.0',
+            'status': 'running',
+            'timestamp': datetime.utcnow().isoformat(),
+            'endpoints': {
+                'health': '/api/health',
+                'login': '/api/auth/login',
+                'register': '/api/auth/register',
+                'reports': '/api/reports'
+            }
+        })
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return metrics_response({
+            'payment_queue_depth': payment_queue_depth(),
+            'reference_code_pool': len(code_pool)
+        })
+
+    @app.route('/favicon.ico')
+    def favicon():
+        return '', 204
+
+    @app.errorhandler(404)
+    def not_found(error):
+        return jsonify({'error': 'Not found'}), 404
+
+    @app.errorhandler(500)
+    def internal_error(error):
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+_app = None
+
+def __getattr__(name):
+    # `from app import app`, gunicorn's app:app and the flask CLI all still
+    # work, but only the first access pays for building the app.
+    global _app
+
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '127.0.0.1')
     debug = True
 
+    app = create_app()
+    with app.app_context():
+        init_schema()
     app.run(host=host, port=port, debug=debug)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Match, Router
+
+import app as app_module
+from async_routes import startup, shutdown, ASYNC_ROUTES
+from tasks import start_background_tasks
+from utils import MAX_FILE_SIZE
+
+# ASGI entry point: `uvicorn asgi:application`, or `SERVER_MODE=asgi gunicorn`
+# to keep the preforked workers. Routes that mostly wait run as coroutines;
+# everything else is the unchanged Flask app on a thread pool.
+ASGI_SYNC_THREADS = int(os.environ.get('ASGI_SYNC_THREADS', 8))
+# Room for the largest attachment plus the other multipart fields.
+ASGI_MAX_BODY_BYTES = MAX_FILE_SIZE + 1024 * 1024
+
+flask_app = app_module.app
+wsgi_bridge = WSGIMiddleware(flask_app, workers=ASGI_SYNC_THREADS)
+
+def buffer_body(app):
+    # a2wsgi lets the view read the body straight off the socket, parking a
+    # pool thread for as long as a slow upload takes. Receive it on the
+    # event loop instead and replay it once a thread picks the request up.
+    async def buffered(scope, receive, send):
+        if scope['type'] != 'http':
+            await app(scope, receive, send)
+            return
+
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > ASGI_MAX_BODY_BYTES:
+                await JSONResponse({'error': 'Request body too large'}, status_code=413)(scope, receive, send)
+                return
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+
+        pending = [{'type': 'http.request', 'body': b''.join(chunks), 'more_body': False}]
+
+        async def replay():
+            return pending.pop() if pending else await receive()
+
+        await app(scope, replay, send)
+    return buffered
+
+@asynccontextmanager
+async def lifespan(router):
+    await startup(flask_app, wsgi_bridge)
+    # Flask only starts the scheduler from its first request, which may be
+    # a long way off when the async routes take the traffic.
+    start_background_tasks(flask_app)
+    try:
+        yield
+    finally:
+        await shutdown()
+
+sync_app = buffer_body(wsgi_bridge)
+async_app = CORSMiddleware(
+    Router(routes=ASYNC_ROUTES, lifespan=lifespan),
+    allow_origins=['*'],
+    allow_methods=['*'],
+    allow_headers=['*']
+)
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and not any(route.matches(scope)[0] != Match.NONE for route in ASYNC_ROUTES):
+        await sync_app(scope, receive, send)
+    else:
+        await async_app(scope, receive, send)
@@ -0,0 +1,43 @@
+import os
+from typing import Any, List, Optional
+
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 5))
+ASYNC_DB_POOL_TIMEOUT = float(os.environ.get('ASYNC_DB_POOL_TIMEOUT', 30))
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite'}
+
+_engine: Optional[AsyncEngine] = None
+
+def open_async_engine(url: URL) -> AsyncEngine:
+    global _engine
+
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    if driver is None:
+        raise RuntimeError(f'No async driver configured for {url.drivername}')
+
+    # Each aiosqlite connection runs on its own thread, so the pool size is
+    # what bounds those threads, however many requests are waiting.
+    _engine = create_async_engine(
+        url.set(drivername=driver),
+        pool_size=ASYNC_DB_POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=ASYNC_DB_POOL_TIMEOUT
+    )
+    return _engine
+
+async def close_async_engine() -> None:
+    global _engine
+
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+async def fetch_one(statement) -> Optional[Any]:
+    async with _engine.connect() as connection:
+        return (await connection.execute(statement)).first()
+
+async def fetch_all(statement) -> List[Any]:
+    async with _engine.connect() as connection:
+        return (await connection.execute(statement)).all()
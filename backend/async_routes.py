@@ -0,0 +1,351 @@
+import asyncio
+import contextvars
+import json
+import os
+import re
+import time
+from datetime import datetime
+from functools import wraps
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from limits import parse
+from limits.aio.storage import MemoryStorage
+from limits.aio.strategies import FixedWindowRateLimiter
+from sqlalchemy import select
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import http_date, parse_etags
+
+from models import db, DataPurchase, User
+from async_db import open_async_engine, close_async_engine, fetch_all, fetch_one
+from events import broker, events_after, format_sse, poll_events, serialize_event, AsyncEventFeed, \
+    EVENT_BACKLOG_BATCHES, SSE_KEEPALIVE_SECONDS, SSE_RETRY_MS, SSE_STREAM_SECONDS
+from exports import export_format_available, export_cache_key, download_artifact, artifact_path, \
+    filters_hash, start_download, record_download_progress, EXPORT_FORMATS
+from metrics import start_request, finish_request, abandon_request
+from payments import get_gateway, fulfil_purchase, purchase_idempotency_key, quote_purchase, intent_metadata, \
+    PaymentError, PaymentUnavailable, PAYMENT_PROVIDER, PURCHASE_MODES
+from utils import logger
+
+_app = None
+_sync_app = None
+_executor = None
+_feed: Optional[AsyncEventFeed] = None
+_limiter: Optional[FixedWindowRateLimiter] = None
+_rate_limit = None
+
+async def startup(app, wsgi_bridge) -> None:
+    global _app, _sync_app, _executor, _feed, _limiter, _rate_limit
+    from app import DEFAULT_RATE_LIMIT
+
+    _app = app
+    _sync_app = wsgi_bridge
+    _executor = wsgi_bridge.executor
+    _feed = AsyncEventFeed(broker, asyncio.get_running_loop())
+    broker.subscribe(_feed.notify)
+
+    if app.config.get('RATELIMIT_ENABLED', True):
+        _limiter = FixedWindowRateLimiter(MemoryStorage())
+        _rate_limit = parse(DEFAULT_RATE_LIMIT)
+
+    with app.app_context():
+        open_async_engine(db.engine.url)
+        if PAYMENT_PROVIDER == 'fake':
+            # Built here so the fake provider captures the app for its
+            # worker-thread queries.
+            get_gateway()
+
+async def shutdown() -> None:
+    await close_async_engine()
+
+async def run_sync(func: Callable[..., Any], *args) -> Any:
+    # Writes and the shared domain helpers stay synchronous; they run on the
+    # WSGI bridge's threads for the few milliseconds they need, not for the
+    # whole request.
+    def call():
+        with _app.app_context():
+            return func(*args)
+
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor, context.run, call)
+
+def _error(message: str, status: int) -> JSONResponse:
+    return JSONResponse({'error': message}, status_code=status)
+
+class SyncFallback:
+    # Returned by a handler that leaves this request to the Flask view.
+    async def __call__(self, scope, receive, send):
+        await _sync_app(scope, receive, send)
+
+def role_required(role):
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(request):
+            import jwt
+
+            token = request.headers.get('Authorization')
+            if not token:
+                return _error('Token is missing', 401)
+
+            try:
+                if token.startswith('Bearer '):
+                    token = token[7:]
+                data = jwt.decode(token, os.environ.get('SECRET_KEY'), algorithms=['HS256'])
+                current_user = await fetch_one(select(User.id, User.role).where(User.id == data['user_id']))
+                if not current_user or current_user.role != role:
+                    return _error('Insufficient permissions', 403)
+            except jwt.ExpiredSignatureError:
+                return _error('Token has expired', 401)
+            except jwt.InvalidTokenError:
+                return _error('Invalid token', 401)
+
+            return await f(current_user, request)
+        return decorated_function
+    return decorator
+
+def _instrument(rule: str, handler):
+    @wraps(handler)
+    async def instrumented(request):
+        start_request()
+        try:
+            client = request.client.host if request.client else ''
+            if _limiter and not await _limiter.hit(_rate_limit, 'asgi', client):
+                response = _error('Rate limit exceeded', 429)
+            else:
+                response = await handler(request)
+        except Exception as e:
+            logger.error(f"Async route {rule} error: {str(e)}")
+            response = _error('Internal server error', 500)
+
+        if isinstance(response, SyncFallback):
+            # The Flask view records its own metrics.
+            abandon_request()
+        else:
+            finish_request(rule, request.method, response.status_code)
+        return response
+    return instrumented
+
+@role_required('researcher')
+async def purchase_data(current_user, request):
+    data = await request.json()
+
+    filters = data.get('filters', {})
+    mode = data.get('mode', 'full')
+
+    if mode not in PURCHASE_MODES:
+        return _error(f'mode must be one of: {", ".join(PURCHASE_MODES)}', 400)
+
+    quote = await run_sync(quote_purchase, current_user.id, filters, mode)
+
+    if quote['total_amount'] == 0:
+        if mode == 'delta':
+            return _error('No new reports since your last purchase of these filters', 400)
+        return _error('No reports match the specified criteria', 400)
+
+    idempotency_key = purchase_idempotency_key(
+        current_user.id, filters_hash(quote['filters']), quote['total_amount'], quote['dataset_version'],
+        request.headers.get('Idempotency-Key')
+    )
+
+    try:
+        intent = await get_gateway().create_intent_async(
+            quote['total_amount'],
+            intent_metadata(current_user.id, quote),
+            idempotency_key
+        )
+    except PaymentUnavailable as e:
+        logger.warning(f"Payment provider unavailable: {str(e)}")
+        return _error('Payment provider unavailable, please retry shortly', 503)
+    except PaymentError as e:
+        return _error(str(e), 400)
+
+    return JSONResponse({
+        'client_secret': intent['client_secret'],
+        'mode': mode,
+        'filters': quote['filters'],
+        'report_count': quote['report_count'],
+        'total_amount': quote['total_amount'] / 100,
+        'payment_intent_id': intent['id']
+    })
+
+def _fulfil(intent: Dict[str, Any]) -> SimpleNamespace:
+    purchase = fulfil_purchase(intent)
+    return SimpleNamespace(id=purchase.id, user_id=purchase.user_id, expires_at=purchase.expires_at)
+
+@role_required('researcher')
+async def confirm_purchase(current_user, request):
+    data = await request.json()
+    payment_intent_id = data.get('payment_intent_id')
+
+    if not payment_intent_id:
+        return _error('Payment intent ID is required', 400)
+
+    purchase = await fetch_one(
+        select(DataPurchase.id, DataPurchase.user_id, DataPurchase.expires_at)
+        .where(DataPurchase.stripe_payment_intent_id == payment_intent_id)
+    )
+
+    if not purchase:
+        try:
+            intent = await get_gateway().retrieve_intent_async(payment_intent_id)
+        except PaymentUnavailable as e:
+            logger.warning(f"Payment provider unavailable: {str(e)}")
+            return _error('Payment provider unavailable, please retry shortly', 503)
+        except PaymentError as e:
+            return _error(str(e), 400)
+
+        if intent['status'] != 'succeeded':
+            return _error('Payment not completed', 400)
+
+        if intent['metadata'].get('user_id') != current_user.id:
+            return _error('Unauthorized', 403)
+
+        purchase = await run_sync(_fulfil, intent)
+
+    if purchase.user_id != current_user.id:
+        return _error('Unauthorized', 403)
+
+    return JSONResponse({
+        'message': 'Purchase confirmed successfully',
+        'download_token': purchase.id,
+        'expires_at': purchase.expires_at.isoformat()
+    })
+
+def _claim_artifact(purchase_id: str, filters: Dict[str, Any], export_format: str) -> Optional[SimpleNamespace]:
+    _, _, cache_key = export_cache_key(filters, export_format)
+    artifact = download_artifact(purchase_id, export_format, cache_key)
+    if not artifact:
+        return None
+
+    claimed = SimpleNamespace(cache_key=artifact.cache_key, path=artifact_path(artifact),
+                              created_at=artifact.created_at)
+    start_download(purchase_id, export_format, artifact.cache_key, artifact.file_size)
+    return claimed
+
+class TrackedFileResponse(FileResponse):
+    def __init__(self, purchase_id: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.purchase_id = purchase_id
+
+    async def __call__(self, scope, receive, send):
+        delivered = {'offset': 0, 'sent': 0}
+
+        async def counting_send(message):
+            if message['type'] == 'http.response.start':
+                content_range = dict(message['headers']).get(b'content-range')
+                if content_range:
+                    delivered['offset'] = int(content_range.split(b' ')[1].split(b'-')[0])
+            elif message['type'] == 'http.response.body':
+                delivered['sent'] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await super().__call__(scope, receive, counting_send)
+        finally:
+            await run_sync(record_download_progress, self.purchase_id, delivered['offset'] + delivered['sent'])
+
+@role_required('researcher')
+async def download_data(current_user, request):
+    export_format = request.query_params.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return _error(f'format must be one of: {", ".join(EXPORT_FORMATS)}', 400)
+
+    if not export_format_available(export_format):
+        return _error(f'{export_format} export is not available on this server', 501)
+
+    purchase = await fetch_one(
+        select(DataPurchase.id, DataPurchase.expires_at, DataPurchase.filters)
+        .where(DataPurchase.id == request.path_params['download_token'], DataPurchase.user_id == current_user.id)
+    )
+
+    if not purchase:
+        return _error('Invalid download token', 404)
+
+    if purchase.expires_at < datetime.utcnow():
+        return _error('Download link has expired', 410)
+
+    artifact = await run_sync(_claim_artifact, purchase.id, json.loads(purchase.filters), export_format)
+    if not artifact:
+        # A cache miss builds the export from the database while it streams,
+        # which is sync work, so the Flask view serves it.
+        return SyncFallback()
+
+    etag = f'"{artifact.cache_key}"'
+    if parse_etags(request.headers.get('If-None-Match')).contains(artifact.cache_key):
+        return Response(status_code=304, headers={'ETag': etag})
+
+    filename = f'civic_reports_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.{EXPORT_FORMATS[export_format]["extension"]}'
+
+    return TrackedFileResponse(
+        purchase.id,
+        artifact.path,
+        media_type=EXPORT_FORMATS[export_format]['mimetype'],
+        filename=filename,
+        headers={'ETag': etag, 'Last-Modified': http_date(artifact.created_at)}
+    )
+
+async def _event_stream(cursor: int, backlog: List[Dict[str, Any]]):
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+
+    for event in backlog:
+        yield format_sse(event)
+
+    deadline = time.monotonic() + SSE_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        if broker.missing_after(cursor):
+            # Fell behind the in-memory buffer; the client reconnects
+            # with Last-Event-ID and catches up from the table.
+            return
+
+        events = await _feed.wait_for(cursor, SSE_KEEPALIVE_SECONDS)
+        if not events:
+            yield ": keepalive\n\n"
+            continue
+
+        for event in events:
+            yield format_sse(event)
+            cursor = event['id']
+
+@role_required('moderator')
+async def moderation_event_stream(current_user, request):
+    last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return _error('Invalid Last-Event-ID', 400)
+
+    if not broker.primed:
+        await run_sync(poll_events)
+
+    backlog = []
+    if last_id is None:
+        last_id = broker.last_id
+    else:
+        for _ in range(EVENT_BACKLOG_BATCHES):
+            if last_id >= broker.last_id:
+                break
+            batch = [serialize_event(row) for row in await fetch_all(events_after(last_id))]
+            if not batch:
+                last_id = broker.last_id
+                break
+            backlog.extend(batch)
+            last_id = batch[-1]['id']
+
+    return StreamingResponse(
+        _event_stream(last_id, backlog),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _route(path: str, handler, methods: List[str]) -> Route:
+    # Metrics use Flask's rule syntax so both servers report the same series.
+    rule = re.sub(r'{(\w+)}', r'<\1>', path)
+    return Route(path, _instrument(rule, handler), methods=methods)
+
+ASYNC_ROUTES = [
+    _route('/api/data/purchase', purchase_data, ['POST']),
+    _route('/api/data/confirm-purchase', confirm_purchase, ['POST']),
+    _route('/api/data/download/{download_token}', download_data, ['GET']),
+    _route('/api/moderator/events', moderation_event_stream, ['GET'])
+]
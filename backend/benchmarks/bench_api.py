@@ -0,0 +1,416 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+CATEGORIES = ['corruption', 'infrastructure', 'healthcare', 'education', 'environment',
+              'public_safety', 'transportation', 'housing', 'employment', 'other']
+CITY_CENTRES = [(6.5244, 3.3792), (9.0765, 7.3986), (5.6037, -0.1870), (-1.2921, 36.8219), (14.7167, -17.4677)]
+WORKLOAD_WEIGHTS = {
+    'submit': 15,
+    'submit_attachment': 5,
+    'track': 30,
+    'public_reports': 30,
+    'moderate': 15,
+    'export': 5
+}
+EXPECTED_STATUS = {
+    'submit': (201,),
+    'submit_attachment': (201,),
+    'track': (200,),
+    'public_reports': (200,),
+    'moderator_reports': (200,),
+    # Concurrent moderators race for the same pending reports.
+    'moderator_verify': (200, 400, 409),
+    'export': (200, 206)
+}
+BENCH_PASSWORD = 'Bench-passw0rd!'
+MODERATOR_EMAIL = 'bench-moderator@civicvoice.test'
+RESEARCHER_EMAIL = 'bench-researcher@civicvoice.test'
+PUBLIC_PAGE_SIZE = 50
+TRACK_SAMPLE = 2000
+COMPARED_LATENCIES = ('p50_ms', 'p95_ms', 'p99_ms')
+
+def tiny_png() -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+            chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff')) + chunk(b'IEND', b''))
+
+def multipart(fields: Dict[str, str], files: Dict[str, Tuple[str, str, bytes]]) -> Tuple[bytes, str]:
+    boundary = f'bench{random.getrandbits(64):016x}'
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content_type, payload) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode() + payload + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def configure_environment(workdir: str, database: str) -> None:
+    # Module-level settings are read at import time, so everything has to be
+    # in place before the app is imported.
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(database)}'
+    os.environ.setdefault('SECRET_KEY', 'civicvoice-benchmark-secret-key-not-for-production')
+    os.environ['BACKGROUND_TASKS'] = 'false'
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['EXPORT_FOLDER'] = os.path.join(workdir, 'exports')
+    os.environ['METRICS_SPOOL_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ.setdefault('SQL_SLOW_LOG', os.path.join(workdir, 'slow_queries.log'))
+
+def seed_database(flask_app, reports: int, seed: int) -> Dict[str, Any]:
+    from anonymity import rebuild_locations
+    from changes import backfill_changes
+    from models import db, DataPurchase, Report, User
+    from rollups import rebuild_rollups
+    from schema import init_schema
+    from seeding import seed_dataset
+    from utils import create_moderator_account, create_researcher_account
+
+    with flask_app.app_context():
+        init_schema()
+        seed_dataset(reports, seed, moderators=10, researchers=50)
+
+        create_moderator_account(MODERATOR_EMAIL, BENCH_PASSWORD, 'Benchmark')
+        create_researcher_account(RESEARCHER_EMAIL, BENCH_PASSWORD, 'Benchmark')
+        researcher = User.query.filter_by(email=RESEARCHER_EMAIL).first()
+
+        purchase = DataPurchase(
+            id=f'{seed:08x}-0000-4000-8000-000000000000',
+            user_id=researcher.id,
+            stripe_payment_intent_id=f'pi_bench_{seed}',
+            amount=0,
+            report_count=0,
+            filters=json.dumps({'category': 'corruption'}),
+            expires_at=datetime.utcnow() + timedelta(days=365)
+        )
+        db.session.add(purchase)
+        db.session.commit()
+
+        backfill_changes()
+        rebuild_rollups()
+        rebuild_locations()
+
+        track = db.session.query(Report.reference_code, Report.passphrase) \
+            .order_by(Report.created_at.desc()).limit(TRACK_SAMPLE).all()
+        return {
+            'reports': reports,
+            'verified': Report.query.filter_by(status='verified').count(),
+            'seed': seed,
+            'track': [list(row) for row in track],
+            'purchase_token': purchase.id,
+            'moderator': MODERATOR_EMAIL,
+            'researcher': RESEARCHER_EMAIL,
+            'password': BENCH_PASSWORD
+        }
+
+class InProcessClient:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        response = self.client.open(path, method=method, data=body, headers=headers or {})
+        try:
+            return response.status_code, response.get_data()
+        finally:
+            response.close()
+
+class HttpClient:
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.connection = None
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, self.prefix + path, body=body, headers=headers or {})
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection; reconnect once.
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+def json_request(client, method: str, path: str, payload: Dict[str, Any],
+                 headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+    return client.request(method, path, json.dumps(payload).encode(),
+                          dict(headers or {}, **{'Content-Type': 'application/json'}))
+
+def login(client, email: str, password: str) -> Dict[str, str]:
+    status, body = json_request(client, 'POST', '/api/auth/login', {'email': email, 'password': password})
+    if status != 200:
+        raise RuntimeError(f'Login as {email} failed with HTTP {status}')
+    return {'Authorization': f'Bearer {json.loads(body)["token"]}'}
+
+class Worker:
+    def __init__(self, client, manifest: Dict[str, Any], seed: int):
+        self.client = client
+        self.manifest = manifest
+        self.rng = random.Random(seed)
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.recording = False
+        self.moderator = login(client, manifest['moderator'], manifest['password'])
+        self.researcher = login(client, manifest['researcher'], manifest['password'])
+        self.attachment = tiny_png()
+
+    def timed(self, endpoint: str, method: str, path: str, body: Optional[bytes] = None,
+              headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        started = time.perf_counter()
+        try:
+            status, payload = self.client.request(method, path, body, headers)
+        except Exception:
+            status, payload = 0, b''
+        elapsed = time.perf_counter() - started
+
+        if self.recording:
+            self.samples.setdefault(endpoint, []).append(elapsed)
+            if status not in EXPECTED_STATUS[endpoint]:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return status, payload
+
+    def submit(self, with_attachment: bool) -> None:
+        latitude, longitude = self.rng.choice(CITY_CENTRES)
+        fields = {
+            'title': f'Benchmark submission {self.rng.getrandbits(32)}',
+            'category': self.rng.choice(CATEGORIES),
+            'description': ' '.join(self.rng.choice(CATEGORIES) for _ in range(self.rng.randint(5, 40))),
+            'latitude': f'{latitude + self.rng.gauss(0, 0.05):.6f}',
+            'longitude': f'{longitude + self.rng.gauss(0, 0.05):.6f}',
+            'language': 'en'
+        }
+        files = {'attachment': ('evidence.png', 'image/png', self.attachment)} if with_attachment else {}
+        body, content_type = multipart(fields, files)
+        self.timed('submit_attachment' if with_attachment else 'submit', 'POST', '/api/reports',
+                   body, {'Content-Type': content_type})
+
+    def track(self) -> None:
+        reference_code, passphrase = self.rng.choice(self.manifest['track'])
+        self.timed('track', 'POST', '/api/reports/track',
+                   json.dumps({'reference_code': reference_code, 'passphrase': passphrase}).encode(),
+                   {'Content-Type': 'application/json'})
+
+    def public_reports(self) -> None:
+        # Uniform over every page, so most requests land deep in the dataset.
+        pages = max(1, self.manifest['verified'] // PUBLIC_PAGE_SIZE)
+        self.timed('public_reports', 'GET',
+                   f'/api/public/reports?page={self.rng.randint(1, pages)}&per_page={PUBLIC_PAGE_SIZE}')
+
+    def moderate(self) -> None:
+        status, body = self.timed('moderator_reports', 'GET',
+                                  f'/api/moderator/reports?status=pending&page={self.rng.randint(1, 5)}&per_page=10',
+                                  headers=self.moderator)
+        if status != 200:
+            return
+
+        reports = json.loads(body).get('reports', [])
+        if not reports:
+            return
+
+        report = self.rng.choice(reports)
+        action = 'verified' if self.rng.random() < 0.85 else 'rejected'
+        self.timed('moderator_verify', 'POST', f'/api/moderator/reports/{report["id"]}/verify',
+                   json.dumps({'action': action, 'notes': 'benchmark'}).encode(),
+                   dict(self.moderator, **{'Content-Type': 'application/json'}))
+
+    def export(self) -> None:
+        self.timed('export', 'GET', f'/api/data/download/{self.manifest["purchase_token"]}?format=csv',
+                   headers=self.researcher)
+
+    def run_once(self) -> None:
+        operation = self.rng.choices(list(WORKLOAD_WEIGHTS), list(WORKLOAD_WEIGHTS.values()))[0]
+        if operation == 'submit':
+            self.submit(False)
+        elif operation == 'submit_attachment':
+            self.submit(True)
+        else:
+            getattr(self, operation)()
+
+def percentile(sorted_samples: List[float], fraction: float) -> float:
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+def summarize(samples: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'throughput_per_s': round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+def run_workload(make_client, manifest: Dict[str, Any], operations: int, threads: int,
+                 warmup: int, seed: int) -> Dict[str, Any]:
+    workers = [Worker(make_client(), manifest, seed * 1000 + i) for i in range(threads)]
+    for worker in workers:
+        for _ in range(warmup):
+            worker.run_once()
+        worker.recording = True
+
+    share = [operations // threads + (1 if i < operations % threads else 0) for i in range(threads)]
+    runners = [threading.Thread(target=lambda w=worker, n=count: [w.run_once() for _ in range(n)])
+               for worker, count in zip(workers, share)]
+
+    started = time.perf_counter()
+    for runner in runners:
+        runner.start()
+    for runner in runners:
+        runner.join()
+    elapsed = time.perf_counter() - started
+
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for worker in workers:
+        for endpoint, values in worker.samples.items():
+            samples.setdefault(endpoint, []).extend(values)
+        for endpoint, count in worker.errors.items():
+            errors[endpoint] = errors.get(endpoint, 0) + count
+
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'endpoints': {endpoint: summarize(values, errors.get(endpoint, 0), elapsed)
+                      for endpoint, values in sorted(samples.items())},
+        'total': summarize([value for values in samples.values() for value in values],
+                           sum(errors.values()), elapsed)
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    rows = []
+    for endpoint, stats in sorted(current['endpoints'].items()):
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if not before:
+            continue
+
+        for metric in COMPARED_LATENCIES + ('throughput_per_s',):
+            old, new = before.get(metric), stats.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -tolerance if metric == 'throughput_per_s' else change > tolerance
+            rows.append({
+                'endpoint': endpoint,
+                'metric': metric,
+                'baseline': old,
+                'current': new,
+                'change_pct': round(change * 100, 1),
+                'regression': regressed
+            })
+
+    return {
+        'tolerance_pct': round(tolerance * 100, 1),
+        'regressions': sum(1 for row in rows if row['regression']),
+        'metrics': rows
+    }
+
+def load_json(path: str) -> Dict[str, Any]:
+    with open(path) as handle:
+        return json.load(handle)
+
+def main():
+    parser = argparse.ArgumentParser(description='Mixed-workload latency and throughput benchmark for the API')
+    parser.add_argument('--reports', type=int, default=20000, help='reports to seed')
+    parser.add_argument('--operations', type=int, default=2000, help='measured requests across all threads')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured operations per thread')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', help='seeded database path; a temporary one is used when omitted')
+    parser.add_argument('--seed-only', action='store_true',
+                        help='seed --database, write its manifest next to it and exit')
+    parser.add_argument('--url', help='benchmark a running server seeded with --seed-only instead of in-process')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    parser.add_argument('--baseline', help='compare against a previous JSON report')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative change before flagging')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='civicvoice-bench-')
+    try:
+        if args.url:
+            if not args.database:
+                parser.error('--url needs --database pointing at the seeded database the server uses')
+            manifest = load_json(f'{args.database}.json')
+            make_client = lambda: HttpClient(args.url)
+            mode = 'http'
+        else:
+            database = args.database or os.path.join(workdir, 'bench.db')
+            configure_environment(workdir, database)
+
+            from app import app as flask_app
+
+            manifest_path = f'{database}.json'
+            if os.path.exists(database) and os.path.exists(manifest_path):
+                manifest = load_json(manifest_path)
+            else:
+                started = time.perf_counter()
+                manifest = seed_database(flask_app, args.reports, args.seed)
+                manifest['seed_seconds'] = round(time.perf_counter() - started, 2)
+                with open(manifest_path, 'w') as handle:
+                    json.dump(manifest, handle)
+
+            if args.seed_only:
+                print(json.dumps({key: value for key, value in manifest.items() if key != 'track'}, indent=2))
+                return
+
+            make_client = lambda: InProcessClient(flask_app)
+            mode = 'in_process'
+
+        result = run_workload(make_client, manifest, args.operations, args.threads, args.warmup, args.seed)
+        result['meta'] = {
+            'mode': mode,
+            'reports': manifest['reports'],
+            'operations': args.operations,
+            'threads': args.threads,
+            'seed': args.seed,
+            'workload': WORKLOAD_WEIGHTS,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started_at': datetime.utcnow().isoformat()
+        }
+
+        exit_code = 0
+        if args.baseline:
+            result['comparison'] = compare(result, load_json(args.baseline), args.tolerance)
+            exit_code = 1 if result['comparison']['regressions'] else 0
+
+        report = json.dumps(result, indent=2)
+        print(report)
+        if args.output:
+            with open(args.output, 'w') as handle:
+                handle.write(report + '\n')
+        sys.exit(exit_code)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
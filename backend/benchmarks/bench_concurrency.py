@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bench_api import BACKEND_DIR, CATEGORIES, configure_environment, load_json, seed_database, summarize
+
+SERVER_MODES = ('wsgi', 'asgi')
+
+class Connection:
+    # Minimal keep-alive HTTP/1.1 client; one coroutine per connection lets a
+    # single process hold hundreds of them open.
+    def __init__(self, port: int):
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def _read_head(self) -> Tuple[int, Dict[str, str]]:
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Server closed the connection')
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return int(status_line.split()[1]), headers
+
+    async def _read_body(self, headers: Dict[str, str]) -> bytes:
+        if headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    return b''.join(chunks)
+                chunks.append(chunk[:-2])
+        return await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+    async def send(self, method: str, path: str, body: bytes = b'', headers: Optional[Dict[str, str]] = None) -> None:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        lines = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+    async def request(self, method: str, path: str, body: bytes = b'',
+                      headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        for attempt in range(2):
+            reused = self.writer is not None
+            try:
+                await self.send(method, path, body, headers)
+                status, response_headers = await self._read_head()
+                payload = await self._read_body(response_headers)
+                if response_headers.get('connection', '').lower() == 'close':
+                    self.close()
+                return status, payload
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # An idle keep-alive connection was closed; reconnect once.
+                self.close()
+                if attempt or not reused:
+                    raise
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(mode: str, port: int, args, log_path: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        'SERVER_MODE': mode,
+        'BIND': f'127.0.0.1:{port}',
+        'WEB_CONCURRENCY': str(args.workers),
+        'WEB_THREADS': str(args.threads),
+        'ASGI_SYNC_THREADS': str(args.threads),
+        'MAX_REQUESTS': '0',
+        'GRACEFUL_TIMEOUT': '5',
+        'ACCESS_LOG': os.devnull,
+        'TESTING': 'true',
+        'PAYMENT_PROVIDER': 'fake',
+        'FAKE_PAYMENT_LATENCY': str(args.payment_latency)
+    })
+    with open(log_path, 'ab') as log:
+        return subprocess.Popen([sys.executable, '-m', 'gunicorn'], cwd=BACKEND_DIR, env=env,
+                                stdout=log, stderr=log)
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.terminate()
+    try:
+        server.wait(15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+async def wait_until_idle(port: int, timeout: float = 120.0, quick: float = 0.5) -> None:
+    # Requests abandoned by timed-out clients are still queued in a sync
+    # server; let it drain so they do not leak into the next measurement.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = Connection(port)
+        try:
+            started = time.perf_counter()
+            status, _ = await asyncio.wait_for(connection.request('GET', '/api/health/live'), timeout)
+            if status == 200 and time.perf_counter() - started < quick:
+                return
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            await asyncio.sleep(0.2)
+        finally:
+            connection.close()
+    raise RuntimeError(f'Server on port {port} did not become idle')
+
+async def token_headers(port: int, email: str, password: str) -> Dict[str, str]:
+    connection = Connection(port)
+    try:
+        status, body = await connection.request('POST', '/api/auth/login',
+                                                json.dumps({'email': email, 'password': password}).encode(),
+                                                {'Content-Type': 'application/json'})
+    finally:
+        connection.close()
+    if status != 200:
+        raise RuntimeError(f'Login as {email} failed with HTTP {status}')
+    return {'Authorization': f'Bearer {json.loads(body)["token"]}'}
+
+async def run_clients(port: int, concurrency: int, duration: float, timeout: float,
+                      make_request: Callable[[Connection, int], Awaitable[Tuple[int, bytes]]]) -> Dict[str, Any]:
+    samples: List[float] = []
+    failures = {'errors': 0, 'timeouts': 0}
+    deadline = time.monotonic() + duration
+
+    async def client(index: int) -> None:
+        connection = Connection(port)
+        try:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    status, _ = await asyncio.wait_for(make_request(connection, index), timeout)
+                except asyncio.TimeoutError:
+                    failures['timeouts'] += 1
+                    connection.close()
+                    continue
+                except (OSError, asyncio.IncompleteReadError):
+                    failures['errors'] += 1
+                    connection.close()
+                    await asyncio.sleep(0.05)
+                    continue
+                if status == 200:
+                    samples.append(time.perf_counter() - started)
+                else:
+                    failures['errors'] += 1
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = summarize(samples, failures['errors'] + failures['timeouts'], elapsed) if samples else \
+        {'count': 0, 'errors': failures['errors'] + failures['timeouts'], 'throughput_per_s': 0.0}
+    result.update(concurrency=concurrency, timeouts=failures['timeouts'])
+    attempts = result['count'] + result['errors']
+    result['error_rate'] = round(result['errors'] / attempts, 4) if attempts else 1.0
+    return result
+
+async def payment_scenario(port: int, manifest: Dict[str, Any], args) -> List[Dict[str, Any]]:
+    # The fake provider sleeps like a Stripe round trip, so this measures how
+    # many purchases can be waiting on the provider at once.
+    headers = dict(await token_headers(port, manifest['researcher'], manifest['password']),
+                   **{'Content-Type': 'application/json'})
+
+    async def purchase(connection: Connection, index: int) -> Tuple[int, bytes]:
+        body = json.dumps({'filters': {'category': CATEGORIES[index % len(CATEGORIES)]}}).encode()
+        return await connection.request('POST', '/api/data/purchase', body, headers)
+
+    levels = []
+    for concurrency in args.levels:
+        await wait_until_idle(port)
+        levels.append(await run_clients(port, concurrency, args.duration, args.timeout, purchase))
+    return levels
+
+async def open_stream(port: int, headers: Dict[str, str], timeout: float) -> Optional[Connection]:
+    connection = Connection(port)
+    try:
+        await connection.send('GET', '/api/moderator/events', headers=headers)
+        status, _ = await asyncio.wait_for(connection._read_head(), timeout)
+        if status == 200:
+            return connection
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        pass
+    connection.close()
+    return None
+
+async def streams_scenario(port: int, manifest: Dict[str, Any], args) -> Dict[str, Any]:
+    # Idle SSE subscribers are the extreme case of a waiting request: they
+    # hold their connection for minutes. Probe a plain sync route meanwhile.
+    headers = await token_headers(port, manifest['moderator'], manifest['password'])
+    streams = await asyncio.gather(*(open_stream(port, headers, args.timeout) for _ in range(args.streams)))
+
+    async def probe(connection: Connection, index: int) -> Tuple[int, bytes]:
+        return await connection.request('GET', '/api/public/reports?per_page=20')
+
+    try:
+        result = await run_clients(port, args.probes, args.duration, args.timeout, probe)
+    finally:
+        for stream in streams:
+            if stream is not None:
+                stream.close()
+
+    result['streams_requested'] = args.streams
+    result['streams_open'] = sum(1 for stream in streams if stream is not None)
+    return result
+
+def capacity(levels: List[Dict[str, Any]], slo_ms: float, max_error_rate: float) -> int:
+    served = [level['concurrency'] for level in levels
+              if level['error_rate'] <= max_error_rate and level.get('p99_ms', float('inf')) <= slo_ms]
+    return max(served, default=0)
+
+async def bench_mode(mode: str, manifest: Dict[str, Any], args, log_path: str) -> Dict[str, Any]:
+    result = {}
+    for name, scenario in (('payment', payment_scenario), ('streams', streams_scenario)):
+        # A fresh server per scenario keeps one scenario's held threads or
+        # queued work from skewing the next.
+        port = free_port()
+        server = start_server(mode, port, args, log_path)
+        try:
+            await wait_until_idle(port, timeout=60, quick=5.0)
+            result[name] = await scenario(port, manifest, args)
+        finally:
+            stop_server(server)
+    result['capacity'] = capacity(result['payment'], args.slo_ms, args.max_error_rate)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare how many concurrent waiting connections the sync and ASGI servers can carry')
+    parser.add_argument('--reports', type=int, default=5000, help='reports to seed')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', help='seeded database path; a temporary one is used when omitted')
+    parser.add_argument('--modes', default=','.join(SERVER_MODES))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='gthread threads, and the ASGI sync pool size')
+    parser.add_argument('--levels', default='8,32,128,512', help='concurrent purchase clients per step')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per step')
+    parser.add_argument('--timeout', type=float, default=10.0, help='per-request client timeout')
+    parser.add_argument('--payment-latency', type=float, default=0.25, help='simulated provider round trip')
+    parser.add_argument('--streams', type=int, default=64, help='idle SSE subscribers to hold open')
+    parser.add_argument('--probes', type=int, default=4, help='clients hitting a sync route while streams are open')
+    parser.add_argument('--slo-ms', type=float, default=2000.0, help='p99 a step must stay under to count')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='civicvoice-concurrency-')
+    try:
+        database = args.database or os.path.join(workdir, 'bench.db')
+        configure_environment(workdir, database)
+
+        manifest_path = f'{database}.json'
+        if os.path.exists(database) and os.path.exists(manifest_path):
+            manifest = load_json(manifest_path)
+        else:
+            from app import app as flask_app
+
+            manifest = seed_database(flask_app, args.reports, args.seed)
+            with open(manifest_path, 'w') as handle:
+                json.dump(manifest, handle)
+
+        log_path = os.path.join(workdir, 'servers.log')
+        result = {'servers': {}}
+        for mode in args.modes.split(','):
+            result['servers'][mode] = asyncio.run(bench_mode(mode, manifest, args, log_path))
+        result['capacity'] = {mode: server['capacity'] for mode, server in result['servers'].items()}
+        result['meta'] = {
+            'reports': manifest['reports'],
+            'workers': args.workers,
+            'threads': args.threads,
+            'levels': args.levels,
+            'duration_s': args.duration,
+            'payment_latency_s': args.payment_latency,
+            'slo_ms': args.slo_ms,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'started_at': datetime.utcnow().isoformat()
+        }
+
+        report = json.dumps(result, indent=2)
+        print(report)
+        if args.output:
+            with open(args.output, 'w') as handle:
+                handle.write(report + '\n')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
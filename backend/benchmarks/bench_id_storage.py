@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+
+SCHEMA = """
+CREATE TABLE reports (
+    id {id_type} NOT NULL PRIMARY KEY,
+    title VARCHAR(200) NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    status VARCHAR(20),
+    created_at DATETIME
+);
+CREATE TABLE verification_logs (
+    id {id_type} NOT NULL PRIMARY KEY,
+    report_id {id_type} NOT NULL REFERENCES reports (id),
+    user_id {id_type} NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    created_at DATETIME
+);
+CREATE INDEX idx_verification_logs_report_id ON verification_logs (report_id);
+"""
+
+def make_id(version: str, storage: str):
+    utils.ID_VERSION = version
+    value = utils.generate_id()
+    return uuid.UUID(value).bytes if storage == 'binary' else value
+
+def run_case(storage: str, version: str, rows: int, batch: int) -> dict:
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+
+    try:
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA.format(id_type='BLOB' if storage == 'binary' else 'VARCHAR(36)'))
+        moderator = make_id(version, storage)
+
+        started = time.perf_counter()
+        for offset in range(0, rows, batch):
+            count = min(batch, rows - offset)
+            reports = [(make_id(version, storage), f'Report {offset + i}',
+                        random.choice(['corruption', 'healthcare', 'education']), 'verified',
+                        '2025-01-01 00:00:00') for i in range(count)]
+            logs = [(make_id(version, storage), report[0], moderator, 'verified', '2025-01-01 00:00:00')
+                    for report in reports]
+            with conn:
+                conn.executemany('INSERT INTO reports VALUES (?, ?, ?, ?, ?)', reports)
+                conn.executemany('INSERT INTO verification_logs VALUES (?, ?, ?, ?, ?)', logs)
+        elapsed = time.perf_counter() - started
+
+        conn.execute('VACUUM')
+        conn.close()
+
+        return {
+            'storage': storage,
+            'id_version': version,
+            'rows': rows,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed),
+            'db_bytes': os.path.getsize(path)
+        }
+    finally:
+        os.remove(path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare UUID key storage formats on SQLite')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = [run_case(storage, version, args.rows, args.batch)
+               for storage in ('text', 'binary') for version in ('4', '7')]
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Blueprint, Flask, jsonify
+
+import metrics
+
+def make_app(instrumented: bool) -> Flask:
+    app = Flask(__name__)
+    blueprint = Blueprint(f'bench_{instrumented}', __name__)
+
+    @blueprint.route('/ping/<item_id>')
+    def ping(item_id):
+        return jsonify({'id': item_id})
+
+    if instrumented:
+        metrics.instrument_blueprint(blueprint)
+    app.register_blueprint(blueprint, url_prefix='/api')
+    return app
+
+def time_requests(app: Flask, requests: int) -> float:
+    client = app.test_client()
+    for i in range(200):
+        client.get(f'/api/ping/{i}')
+
+    started = time.perf_counter()
+    for i in range(requests):
+        client.get(f'/api/ping/{i}')
+    return (time.perf_counter() - started) / requests
+
+def time_hooks(requests: int) -> float:
+    app = make_app(False)
+    with app.test_request_context('/api/ping/1'):
+        response = app.response_class('{}')
+        started = time.perf_counter()
+        for _ in range(requests):
+            metrics._start_request()
+            metrics._finish_request(response)
+        return (time.perf_counter() - started) / requests
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-request overhead of the metrics hooks')
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    metrics.METRICS_SPOOL_DIR = tempfile.mkdtemp(prefix='civicvoice-metrics-')
+
+    plain = time_requests(make_app(False), args.requests)
+    instrumented = time_requests(make_app(True), args.requests)
+    hooks = time_hooks(args.requests)
+
+    started = time.perf_counter()
+    metrics.flush_metrics()
+    flush = time.perf_counter() - started
+
+    print(json.dumps({
+        'requests': args.requests,
+        'plain_us': round(plain * 1e6, 2),
+        'instrumented_us': round(instrumented * 1e6, 2),
+        'overhead_us': round((instrumented - plain) * 1e6, 2),
+        'hooks_only_us': round(hooks * 1e6, 2),
+        'flush_ms': round(flush * 1e3, 3)
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES_SCRIPT = '''
+import json, os, sys, time
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+flask_app = app_module.app
+created = time.perf_counter()
+modules_before = set(sys.modules)
+response = flask_app.test_client().get('/api/health/live')
+response.close()
+first_request = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (first_request - created) * 1000,
+    'modules': len(modules_before),
+    'modules_loaded_by_first_request': sorted(set(sys.modules) - modules_before)[:20],
+    'status': response.status_code,
+    'database_created': os.path.exists(os.environ['BENCH_DATABASE'])
+}))
+'''
+
+FORK_SCRIPT = '''
+import json, os, sys, time
+import app as app_module
+flask_app = app_module.app
+flask_app.test_client().get('/api/health/live').close()
+
+results = []
+for _ in range(int(sys.argv[1])):
+    read_fd, write_fd = os.pipe()
+    started = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        forked = time.perf_counter()
+        flask_app.test_client().get('/api/health/live').close()
+        os.write(write_fd, json.dumps([forked - started, time.perf_counter() - started]).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as handle:
+        fork_seconds, ready_seconds = json.loads(handle.read())
+    os.waitpid(pid, 0)
+    results.append({'fork_ms': fork_seconds * 1000, 'first_response_ms': ready_seconds * 1000})
+print(json.dumps(results))
+'''
+
+def bench_env(workdir: str) -> dict:
+    database = os.path.join(workdir, 'startup.db')
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f'sqlite:///{database}',
+        'BENCH_DATABASE': database,
+        'SECRET_KEY': env.get('SECRET_KEY', 'civicvoice-benchmark-secret-key-not-for-production'),
+        'BACKGROUND_TASKS': 'false',
+        'METRICS_SPOOL_DIR': os.path.join(workdir, 'metrics'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'EXPORT_FOLDER': os.path.join(workdir, 'exports')
+    })
+    return env
+
+def run_python(args, env: dict) -> str:
+    result = subprocess.run([sys.executable] + args, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return result.stdout
+
+def import_profile(env: dict, top: int) -> list:
+    # -X importtime writes "self | cumulative | module" lines to stderr.
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # Nesting is two spaces per level; keep what app.py imports directly
+        # so nested modules are not double counted.
+        if len(name) - len(name.lstrip()) == 3:
+            modules.append({'module': name.strip(), 'cumulative_ms': int(parts[1]) / 1000})
+    return sorted(modules, key=lambda row: row['cumulative_ms'], reverse=True)[:top]
+
+def wall_ms(args, env: dict, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run_python(args, env)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold start, app creation and per-worker fork cost')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--forks', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10, help='heaviest top-level imports to list')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='civicvoice-startup-') as workdir:
+        env = bench_env(workdir)
+
+        phases = [json.loads(run_python(['-c', PHASES_SCRIPT], env)) for _ in range(args.repeats)]
+        forks = json.loads(run_python(['-c', FORK_SCRIPT, str(args.forks)], env)) if hasattr(os, 'fork') else []
+
+        result = {
+            'interpreter_ms': wall_ms(['-c', 'pass'], env, args.repeats),
+            'cold_start_wall_ms': wall_ms(['-c', 'import app; app.app'], env, args.repeats),
+            'cli_routes_wall_ms': wall_ms(['-m', 'flask', '--app', 'app', 'routes'], env, args.repeats),
+            'import_ms': statistics.median(row['import_ms'] for row in phases),
+            'create_app_ms': statistics.median(row['create_app_ms'] for row in phases),
+            'first_request_ms': statistics.median(row['first_request_ms'] for row in phases),
+            'modules_after_create': phases[0]['modules'],
+            'modules_loaded_by_first_request': phases[0]['modules_loaded_by_first_request'],
+            'database_touched_at_startup': any(row['database_created'] for row in phases),
+            'fork_ms': statistics.median(row['fork_ms'] for row in forks) if forks else None,
+            'fork_first_response_ms': statistics.median(row['first_response_ms'] for row in forks) if forks else None,
+            'heaviest_imports': import_profile(env, args.top),
+            'python': sys.version.split()[0]
+        }
+
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
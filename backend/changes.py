@@ -0,0 +1,129 @@
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import event, func, insert, literal, select
+
+from models import db, Report, ReportChange, ReportVerifiedSeq
+from anonymity import published_locations
+
+CHANGE_UPSERT = 'upsert'
+CHANGE_DELETE = 'delete'
+DEFAULT_CHANGE_LIMIT = 500
+MAX_CHANGE_LIMIT = 5000
+
+PUBLIC_REPORT_FIELDS = ['id', 'title', 'category', 'description', 'latitude', 'longitude',
+                        'created_at', 'language']
+
+def record_report_changes(report_ids: List[str], change_type: str) -> None:
+    if not report_ids:
+        return
+
+    now = datetime.utcnow()
+    db.session.execute(insert(ReportChange), [{
+        'report_id': report_id,
+        'change_type': change_type,
+        'created_at': now
+    } for report_id in report_ids])
+
+@event.listens_for(Report, 'after_delete')
+def _record_report_delete(mapper, connection, target):
+    if target.status == 'verified':
+        connection.execute(insert(ReportChange).values(
+            report_id=target.id,
+            change_type=CHANGE_DELETE,
+            created_at=datetime.utcnow()
+        ))
+
+def public_report_row(report: Report, location: tuple) -> List[Any]:
+    return [
+        report.id, report.title, report.category, report.description,
+        location[0], location[1], report.created_at.isoformat(), report.language
+    ]
+
+def latest_seq() -> int:
+    return db.session.query(func.max(ReportChange.seq)).scalar() or 0
+
+def record_verified_seqs(report_ids: List[str]) -> None:
+    # Pins the seq of a report's first verification. Unlike its change rows
+    # this survives compaction and later upserts, so a report lands in
+    # exactly one delta window.
+    if not report_ids:
+        return
+
+    first = select(ReportChange.report_id, func.max(ReportChange.seq)) \
+        .where(ReportChange.report_id.in_(report_ids), ReportChange.change_type == CHANGE_UPSERT) \
+        .group_by(ReportChange.report_id)
+    db.session.execute(
+        insert(ReportVerifiedSeq).from_select(['report_id', 'seq'], first)
+        .prefix_with('OR IGNORE', dialect='sqlite')
+    )
+
+def verified_report_ids(since: int, until: int):
+    return select(ReportVerifiedSeq.report_id).where(
+        ReportVerifiedSeq.seq > since,
+        ReportVerifiedSeq.seq <= until
+    )
+
+def changes_since(since: int, limit: int = DEFAULT_CHANGE_LIMIT) -> Dict[str, Any]:
+    rows = db.session.query(ReportChange.seq, ReportChange.report_id, ReportChange.change_type) \
+        .filter(ReportChange.seq > since) \
+        .order_by(ReportChange.seq.asc()) \
+        .limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for seq, report_id, change_type in rows:
+        latest[report_id] = change_type
+
+    upsert_ids = [report_id for report_id, change_type in latest.items() if change_type == CHANGE_UPSERT]
+    reports = {}
+    if upsert_ids:
+        reports = {report.id: report for report in Report.query.filter(
+            Report.id.in_(upsert_ids), Report.status == 'verified'
+        )}
+
+    locations = published_locations(list(reports))
+    upserts = [public_report_row(reports[report_id], locations.get(report_id, (None, None)))
+               for report_id in upsert_ids if report_id in reports]
+    deletes = [report_id for report_id, change_type in latest.items()
+               if change_type == CHANGE_DELETE or (change_type == CHANGE_UPSERT and report_id not in reports)]
+
+    return {
+        'since': since,
+        'next_since': rows[-1][0] if rows else since,
+        'has_more': has_more,
+        'fields': PUBLIC_REPORT_FIELDS,
+        'upserts': upserts,
+        'deletes': deletes
+    }
+
+def compact_changes() -> int:
+    # A client only needs the newest change per report, so superseded
+    # entries can go; the newest seq per report is never removed, which
+    # keeps every cursor a client may hold valid.
+    newest = select(func.max(ReportChange.seq)).group_by(ReportChange.report_id)
+    removed = ReportChange.query.filter(ReportChange.seq.not_in(newest)) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+def backfill_changes() -> int:
+    logged = select(ReportChange.report_id)
+    missing = select(Report.id, literal(CHANGE_UPSERT), Report.updated_at) \
+        .where(Report.status == 'verified', Report.id.not_in(logged)) \
+        .order_by(Report.updated_at.asc())
+
+    result = db.session.execute(
+        insert(ReportChange).from_select(['report_id', 'change_type', 'created_at'], missing)
+    )
+
+    unpinned = select(ReportChange.report_id, func.max(ReportChange.seq)) \
+        .join(Report, Report.id == ReportChange.report_id) \
+        .where(Report.status == 'verified', ReportChange.change_type == CHANGE_UPSERT,
+               ReportChange.report_id.not_in(select(ReportVerifiedSeq.report_id))) \
+        .group_by(ReportChange.report_id)
+    db.session.execute(insert(ReportVerifiedSeq).from_select(['report_id', 'seq'], unpinned))
+    db.session.commit()
+    return result.rowcount
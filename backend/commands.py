@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import uuid
+
+import click
+
+from models import db, UUIDType
+from changes import backfill_changes
+from rollups import rebuild_rollups
+from refcodes import reference_code_report
+from dedup import index_pending_reports
+from regions import backfill_regions
+from anonymity import rebuild_locations
+from seeding import seed_dataset, SEED_PASSWORD
+from uploads import sweep_uploads
+from schema import init_schema
+
+def uuid_columns() -> dict:
+    columns = {}
+    for table in db.metadata.sorted_tables:
+        names = [column.name for column in table.columns if isinstance(column.type, UUIDType)]
+        if names:
+            columns[table.name] = names
+    return columns
+
+def _to_blob(value):
+    if isinstance(value, str):
+        try:
+            return uuid.UUID(value).bytes
+        except ValueError:
+            return value
+    return value
+
+def _to_text(value):
+    if isinstance(value, bytes) and len(value) == 16:
+        return str(uuid.UUID(bytes=value))
+    return value
+
+def convert_id_storage(db_path: str, target: str) -> dict:
+    size_before = os.path.getsize(db_path)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.create_function('convert_id', 1, _to_blob if target == 'binary' else _to_text, deterministic=True)
+        conn.execute('PRAGMA foreign_keys = OFF')
+
+        converted = 0
+        with conn:
+            for table, names in uuid_columns().items():
+                exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                ).fetchone()
+                if not exists:
+                    continue
+
+                assignments = ', '.join(f'"{name}" = convert_id("{name}")' for name in names)
+                cursor = conn.execute(f'UPDATE "{table}" SET {assignments}')
+                converted += cursor.rowcount
+
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    return {
+        'rows': converted,
+        'size_before': size_before,
+        'size_after': os.path.getsize(db_path)
+    }
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    def init_database():
+        """Create missing tables, columns and indexes, and rebuild tables that need AUTOINCREMENT."""
+        result = init_schema()
+        if result['rebuilt']:
+            click.echo(f"Rebuilt {len(result['rebuilt'])} tables: {', '.join(result['rebuilt'])}")
+        click.echo(f"Created {len(result['tables'])} tables: {', '.join(result['tables']) or 'none'}")
+        click.echo(f"Added {len(result['columns'])} columns: {', '.join(result['columns']) or 'none'}")
+        click.echo(f"Created {len(result['indexes'])} indexes: {', '.join(result['indexes']) or 'none'}")
+
+    @app.cli.command('convert-ids')
+    @click.argument('target', type=click.Choice(['binary', 'text']))
+    def convert_ids(target):
+        """Rewrite stored UUID keys as 16-byte blobs or 36-char text in place."""
+        db_path = db.engine.url.database
+        result = convert_id_storage(db_path, target)
+
+        click.echo(f"Converted {result['rows']} rows to {target} ids")
+        click.echo(f"Database size: {result['size_before']} -> {result['size_after']} bytes")
+        click.echo(f"Set ID_STORAGE={target} before starting the app against {db_path}")
+
+    @app.cli.command('backfill-changes')
+    def backfill_change_log():
+        """Seed the change feed and delta keys for verified reports not yet in them."""
+        click.echo(f"Added {backfill_changes()} verified reports to the change feed")
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_report_rollups():
+        """Recompute the per-day, per-category verified report counts."""
+        click.echo(f"Rebuilt {rebuild_rollups()} daily rollup rows")
+
+    @app.cli.command('index-duplicates')
+    def index_duplicates():
+        """Compute near-duplicate signatures for pending reports that lack one."""
+        click.echo(f"Indexed {index_pending_reports()} pending reports")
+
+    @app.cli.command('backfill-regions')
+    def backfill_report_regions():
+        """Re-tag every report with the regions from the boundary GeoJSON."""
+        result = backfill_regions()
+        click.echo(f"Tagged {result['reports']} reports with {result['tags']} region assignments")
+
+    @app.cli.command('rebuild-locations')
+    def rebuild_published_locations():
+        """Recompute the k-anonymous published cell for every verified report."""
+        click.echo(f"Assigned published locations for {rebuild_locations()} verified reports")
+
+    @app.cli.command('reference-codes')
+    def report_reference_codes():
+        """Show reference code space usage and collision probabilities."""
+        for name, value in reference_code_report().items():
+            click.echo(f"{name}: {value:.3e}" if isinstance(value, float) else f"{name}: {value}")
+
+    @app.cli.command('sweep-uploads')
+    @click.option('--dry-run', is_flag=True, help='Report what would change without moving or deleting anything.')
+    def sweep_orphan_uploads(dry_run):
+        """Quarantine orphaned upload files, purge old quarantine and flag attachments whose file is gone."""
+        result = sweep_uploads(dry_run)
+        if not result:
+            click.echo('Upload folder does not exist; nothing to sweep')
+            return
+        for name, value in result.items():
+            click.echo(f"{name}: {value}")
+
+    @app.cli.command('seed-data')
+    @click.option('--reports', type=int, default=100000, show_default=True)
+    @click.option('--seed', type=int, default=0, show_default=True)
+    @click.option('--moderators', type=int, default=50, show_default=True)
+    @click.option('--researchers', type=int, default=500, show_default=True)
+    @click.option('--purchases-per-researcher', type=float, default=2.0, show_default=True)
+    @click.option('--attachment-rate', type=float, default=0.2, show_default=True)
+    @click.option('--days', type=int, default=730, show_default=True, help='Span of report timestamps.')
+    @click.option('--skip-derived', is_flag=True, help='Do not rebuild the change feed, rollups and locations.')
+    def seed_data(reports, seed, moderators, researchers, purchases_per_researcher, attachment_rate, days,
+                  skip_derived):
+        """Bulk-generate a deterministic synthetic dataset for benchmarking and capacity planning."""
+        try:
+            result = seed_dataset(reports, seed, moderators, researchers, purchases_per_researcher,
+                                  attachment_rate, days)
+        except (RuntimeError, ValueError) as e:
+            raise click.ClickException(str(e))
+
+        click.echo(f"Seeded {result['reports']} reports, {result['verification_logs']} verification logs, "
+                   f"{result['attachments']} attachments, {result['users']} users and "
+                   f"{result['purchases']} purchases in {result['seconds']}s "
+                   f"({result['reports_per_second']} reports/s)")
+        click.echo(f"Seeded accounts use the password {SEED_PASSWORD}")
+
+        if not skip_derived:
+            click.echo(f"Added {backfill_changes()} verified reports to the change feed")
+            click.echo(f"Rebuilt {rebuild_rollups()} daily rollup rows")
+            click.echo(f"Assigned published locations for {rebuild_locations()} verified reports")
@@ -0,0 +1,195 @@
+import hashlib
+import math
+import os
+import random
+import re
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, event, insert, tuple_, update
+
+from models import db, Report, ReportSignature, ReportLshBucket
+from utils import generate_id
+
+DEDUP_PERMUTATIONS = 64
+DEDUP_BANDS = 16
+DEDUP_ROWS = DEDUP_PERMUTATIONS // DEDUP_BANDS
+DEDUP_SHINGLE_SIZE = 5
+DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', 0.5))
+DEDUP_CELL_DEGREES = float(os.environ.get('DEDUP_CELL_DEGREES', 0.01))
+DEDUP_WINDOW_DAYS = int(os.environ.get('DEDUP_WINDOW_DAYS', 30))
+MAX_CLUSTER_CANDIDATES = 20
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORDS = re.compile(r'\w+')
+
+# Fixed seed: every worker and every restart must agree on the permutations,
+# otherwise stored signatures stop being comparable.
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(DEDUP_PERMUTATIONS)]
+
+def shingles(text: str) -> set:
+    normalized = ' '.join(_WORDS.findall(text.lower()))
+    if len(normalized) <= DEDUP_SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + DEDUP_SHINGLE_SIZE] for i in range(len(normalized) - DEDUP_SHINGLE_SIZE + 1)}
+
+def minhash(text: str) -> Optional[List[int]]:
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return [min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in hashes)
+            for a, b in _PERMUTATIONS]
+
+def pack_signature(signature: List[int]) -> bytes:
+    return struct.pack(f'<{DEDUP_PERMUTATIONS}I', *signature)
+
+def unpack_signature(data: bytes) -> List[int]:
+    return list(struct.unpack(f'<{DEDUP_PERMUTATIONS}I', data))
+
+def similarity(first: List[int], second: List[int]) -> float:
+    return sum(1 for a, b in zip(first, second) if a == b) / DEDUP_PERMUTATIONS
+
+def geo_cell(latitude: float, longitude: float) -> tuple:
+    return math.floor(latitude / DEDUP_CELL_DEGREES), math.floor(longitude / DEDUP_CELL_DEGREES)
+
+def _cell_key(cell: tuple) -> str:
+    return f'{cell[0]}:{cell[1]}'
+
+def _neighbour_cells(cell: tuple) -> List[tuple]:
+    return [(cell[0] + dy, cell[1] + dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+def band_keys(signature: List[int], cell: tuple) -> List[str]:
+    # The geo cell is part of every bucket key, so only reports that share a
+    # band and sit in the same coarse cell ever meet.
+    keys = []
+    for band in range(DEDUP_BANDS):
+        values = signature[band * DEDUP_ROWS:(band + 1) * DEDUP_ROWS]
+        raw = f'{_cell_key(cell)}|{band}|' + ','.join(map(str, values))
+        keys.append(hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest())
+    return keys
+
+def find_candidates(signature: List[int], cell: tuple, exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+    keys = [key for neighbour in _neighbour_cells(cell) for key in band_keys(signature, neighbour)]
+    query = db.session.query(ReportSignature).join(
+        ReportLshBucket, ReportLshBucket.report_id == ReportSignature.report_id
+    ).filter(ReportLshBucket.bucket.in_(keys)).distinct()
+    if exclude:
+        query = query.filter(ReportSignature.report_id != exclude)
+
+    candidates = []
+    for row in query:
+        score = similarity(signature, unpack_signature(row.minhash))
+        if score >= DEDUP_THRESHOLD:
+            candidates.append({'report_id': row.report_id, 'cluster_id': row.cluster_id, 'similarity': score})
+
+    candidates.sort(key=lambda candidate: candidate['similarity'], reverse=True)
+    return candidates
+
+def index_report(report: Report) -> Optional[str]:
+    signature = minhash(f'{report.title} {report.description or ""}')
+    if signature is None:
+        return None
+
+    cell = geo_cell(report.latitude, report.longitude)
+    candidates = find_candidates(signature, cell, exclude=report.id)
+
+    cluster_id = None
+    if candidates:
+        cluster_id = next((candidate['cluster_id'] for candidate in candidates if candidate['cluster_id']), None) \
+            or generate_id()
+
+        # Join the best existing cluster and fold any other matched clusters
+        # (and unclustered matches) into it.
+        merged = {candidate['cluster_id'] for candidate in candidates
+                  if candidate['cluster_id'] and candidate['cluster_id'] != cluster_id}
+        loose = [candidate['report_id'] for candidate in candidates if not candidate['cluster_id']]
+        if merged:
+            db.session.execute(update(ReportSignature).where(ReportSignature.cluster_id.in_(merged))
+                               .values(cluster_id=cluster_id))
+        if loose:
+            db.session.execute(update(ReportSignature).where(ReportSignature.report_id.in_(loose))
+                               .values(cluster_id=cluster_id))
+
+    now = datetime.utcnow()
+    db.session.add(ReportSignature(
+        report_id=report.id,
+        minhash=pack_signature(signature),
+        geo_cell=_cell_key(cell),
+        cluster_id=cluster_id,
+        created_at=now
+    ))
+    db.session.execute(insert(ReportLshBucket), [
+        {'bucket': key, 'report_id': report.id, 'created_at': now} for key in band_keys(signature, cell)
+    ])
+    return cluster_id
+
+def cluster_members(cluster_ids: List[str], status: str = 'pending') -> Dict[str, List[str]]:
+    if not cluster_ids:
+        return {}
+
+    rows = db.session.query(ReportSignature.cluster_id, ReportSignature.report_id) \
+        .join(Report, Report.id == ReportSignature.report_id) \
+        .filter(ReportSignature.cluster_id.in_(cluster_ids), Report.status == status) \
+        .order_by(Report.created_at.asc()).all()
+
+    members = {}
+    for cluster_id, report_id in rows:
+        members.setdefault(cluster_id, []).append(report_id)
+    return members
+
+def duplicate_info(report_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    if not report_ids:
+        return {}
+
+    clusters = dict(db.session.query(ReportSignature.report_id, ReportSignature.cluster_id)
+                    .filter(ReportSignature.report_id.in_(report_ids), ReportSignature.cluster_id.isnot(None)))
+    members = cluster_members(list(set(clusters.values())))
+
+    return {report_id: {
+        'duplicate_cluster_id': cluster_id,
+        'duplicate_candidates': [member for member in members.get(cluster_id, [])
+                                 if member != report_id][:MAX_CLUSTER_CANDIDATES]
+    } for report_id, cluster_id in clusters.items()}
+
+def prune_lsh_buckets() -> int:
+    # Old reports keep their signature and cluster but leave the index, which
+    # bounds its size by the dedup window rather than the whole corpus.
+    cutoff = datetime.utcnow() - timedelta(days=DEDUP_WINDOW_DAYS)
+    pruned = ReportLshBucket.query.filter(ReportLshBucket.created_at < cutoff) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return pruned
+
+def index_pending_reports(batch_size: int = 500) -> int:
+    indexed = 0
+    after = None
+    while True:
+        query = Report.query.filter(
+            Report.status == 'pending',
+            ~Report.id.in_(db.session.query(ReportSignature.report_id))
+        )
+        # Reports with no usable text never get a signature, so page past
+        # them instead of fetching them again.
+        if after is not None:
+            query = query.filter(tuple_(Report.created_at, Report.id) > after)
+        reports = query.order_by(Report.created_at.asc(), Report.id.asc()).limit(batch_size).all()
+
+        if not reports:
+            return indexed
+
+        for report in reports:
+            index_report(report)
+            db.session.flush()
+        db.session.commit()
+        indexed += len(reports)
+        after = (reports[-1].created_at, reports[-1].id)
+
+@event.listens_for(Report, 'after_delete')
+def _remove_report_signature(mapper, connection, target):
+    connection.execute(delete(ReportLshBucket).where(ReportLshBucket.report_id == target.id))
+    connection.execute(delete(ReportSignature).where(ReportSignature.report_id == target.id))
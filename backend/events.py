@@ -0,0 +1,206 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import insert, select
+
+from models import db, ModerationEvent
+from utils import logger
+
+EVENT_BUFFER_SIZE = 1000
+EVENT_BACKLOG_LIMIT = 500
+EVENT_BACKLOG_BATCHES = 10
+EVENT_RETENTION_HOURS = 24
+SSE_RETRY_MS = 3000
+SSE_KEEPALIVE_SECONDS = 15
+SSE_STREAM_SECONDS = 300
+
+class EventBroker:
+    def __init__(self, size: int = EVENT_BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._condition = threading.Condition()
+        self.last_id = 0
+        self.primed = False
+        self._subscribers = []
+
+    def subscribe(self, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        self._subscribers.append(callback)
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        with self._condition:
+            for event in events:
+                if event['id'] > self.last_id:
+                    self._events.append(event)
+                    self.last_id = event['id']
+            self._condition.notify_all()
+
+        for callback in self._subscribers:
+            try:
+                callback(events)
+            except Exception as e:
+                logger.error(f"Event subscriber error: {str(e)}")
+
+    def missing_after(self, after_id: int) -> bool:
+        # Events newer than after_id exist but the buffer cannot supply all
+        # of them: they were published before priming or already evicted.
+        with self._condition:
+            if self.last_id <= after_id:
+                return False
+            return not self._events or self._events[0]['id'] > after_id + 1
+
+    def wait_for(self, after_id: int, timeout: float) -> List[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.last_id <= after_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(remaining)
+            return [event for event in self._events if event['id'] > after_id]
+
+class AsyncEventFeed:
+    # Lets coroutines wait on the broker without holding a thread. Publishes
+    # come from request and task threads, so wake-ups hop onto the loop.
+    def __init__(self, source: EventBroker, loop: asyncio.AbstractEventLoop):
+        self._source = source
+        self._loop = loop
+        self._changed = asyncio.Event()
+
+    def notify(self, events: List[Dict[str, Any]]) -> None:
+        if events and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for(self, after_id: int, timeout: float) -> List[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            # Take the event before reading the broker so a publish in
+            # between still wakes us.
+            changed = self._changed
+            events = self._source.wait_for(after_id, 0)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+broker = EventBroker()
+_poll_lock = threading.Lock()
+
+def record_events(event_type: str, payloads: List[Dict[str, Any]]) -> None:
+    if not payloads:
+        return
+
+    now = datetime.utcnow()
+    db.session.execute(insert(ModerationEvent), [{
+        'event_type': event_type,
+        'report_id': payload['report_id'],
+        'payload': json.dumps(payload),
+        'created_at': now
+    } for payload in payloads])
+
+def serialize_event(event: ModerationEvent) -> Dict[str, Any]:
+    return {
+        'id': event.id,
+        'event': event.event_type,
+        'report_id': event.report_id,
+        'data': event.payload
+    }
+
+def events_after(after_id: int, limit: int = EVENT_BACKLOG_LIMIT):
+    return select(ModerationEvent).where(ModerationEvent.id > after_id) \
+        .order_by(ModerationEvent.id.asc()).limit(limit)
+
+def load_events(after_id: int, limit: int = EVENT_BACKLOG_LIMIT) -> List[Dict[str, Any]]:
+    return [serialize_event(event) for event in db.session.execute(events_after(after_id, limit)).scalars()]
+
+def poll_events() -> int:
+    # Every worker runs this against the shared table, which is how events
+    # committed in one process reach SSE clients connected to another.
+    if not _poll_lock.acquire(blocking=False):
+        return 0
+    try:
+        if not broker.primed:
+            broker.last_id = db.session.query(db.func.max(ModerationEvent.id)).scalar() or 0
+            broker.primed = True
+            return 0
+
+        events = load_events(broker.last_id)
+        broker.publish(events)
+        return len(events)
+    finally:
+        _poll_lock.release()
+
+def dispatch_events() -> None:
+    try:
+        poll_events()
+    except Exception as e:
+        logger.error(f"Event dispatch error: {str(e)}")
+
+def prune_events() -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=EVENT_RETENTION_HOURS)
+    pruned = ModerationEvent.query.filter(ModerationEvent.created_at < cutoff) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return pruned
+
+def stream_events(last_id: Optional[int]):
+    poll_events()
+
+    backlog = []
+    if last_id is None:
+        last_id = broker.last_id
+    else:
+        # Capped so Last-Event-ID: 0 does not load the whole table; a client
+        # further behind gets the rest on its next reconnect.
+        for _ in range(EVENT_BACKLOG_BATCHES):
+            if last_id >= broker.last_id:
+                break
+            batch = load_events(last_id)
+            if not batch:
+                # Nothing newer is left in the table to replay.
+                last_id = broker.last_id
+                break
+            backlog.extend(batch)
+            last_id = batch[-1]['id']
+
+    # Live events come from the broker; the DB connection is not needed
+    # again for the lifetime of the stream.
+    db.session.close()
+
+    def generate():
+        cursor = last_id
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+
+        for event in backlog:
+            yield format_sse(event)
+
+        deadline = time.monotonic() + SSE_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            if broker.missing_after(cursor):
+                # Behind the in-memory buffer; the client reconnects with
+                # Last-Event-ID and catches up from the table.
+                return
+
+            events = broker.wait_for(cursor, SSE_KEEPALIVE_SECONDS)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+
+            for event in events:
+                yield format_sse(event)
+                cursor = event['id']
+
+    return generate()
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {event['data']}\n\n"
@@ -0,0 +1,420 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Report, ReportLocation, ExportArtifact, DownloadProgress, PurchaseWatermark, UUIDType
+from changes import latest_seq, verified_report_ids
+from regions import region_filter
+from utils import generate_id, logger, optional_import
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+EXPORT_BATCH_SIZE = 5000
+EXPORT_FOLDER = os.environ.get('EXPORT_FOLDER', 'exports')
+EXPORT_CACHE_BUDGET = int(os.environ.get('EXPORT_CACHE_BUDGET_MB', 2048)) * 1024 * 1024
+DELTA_FILTER_KEYS = ('since_seq', 'until_seq')
+EXPORT_FILTER_KEYS = ('category', 'region', 'start_date', 'end_date') + DELTA_FILTER_KEYS
+
+EXPORT_SCHEMA_VERSION = 2
+PUBLISHED_COLUMNS = ('latitude', 'longitude')
+EXPORT_COLUMNS = ['id', 'title', 'category', 'description', 'latitude', 'longitude', 'language', 'created_at']
+EXPORT_HEADERS = ['report_id', 'title', 'category', 'description', 'latitude', 'longitude', 'language', 'created_at']
+
+EXPORT_FORMATS = {
+    'csv': {'mimetype': 'text/csv', 'extension': 'csv'},
+    'csv.gz': {'mimetype': 'application/gzip', 'extension': 'csv.gz'},
+    'ndjson.gz': {'mimetype': 'application/gzip', 'extension': 'ndjson.gz'},
+    'parquet': {'mimetype': 'application/vnd.apache.parquet', 'extension': 'parquet'}
+}
+
+def filtered_reports_query(filters: Dict[str, Any]):
+    query = Report.query.filter_by(status='verified')
+
+    if filters.get('category'):
+        query = query.filter_by(category=filters['category'])
+
+    if filters.get('region'):
+        query = query.filter(region_filter(filters['region']))
+
+    if filters.get('start_date'):
+        start_dt = datetime.fromisoformat(filters['start_date'])
+        query = query.filter(Report.created_at >= start_dt)
+
+    if filters.get('end_date'):
+        end_dt = datetime.fromisoformat(filters['end_date'])
+        query = query.filter(Report.created_at <= end_dt)
+
+    if 'until_seq' in filters:
+        # Delta exports only cover reports first verified inside the
+        # change-feed window, so their cost follows the new data rather than
+        # the history.
+        query = query.filter(Report.id.in_(
+            verified_report_ids(int(filters.get('since_seq') or 0), int(filters['until_seq']))
+        ))
+
+    return query
+
+def export_format_available(export_format: str) -> bool:
+    if export_format not in EXPORT_FORMATS:
+        return False
+    return export_format != 'parquet' or optional_import('pyarrow.parquet') is not None
+
+def _export_table(name: str):
+    # Coordinates come from the precomputed k-anonymous cells, never the
+    # exact point the reporter submitted.
+    return ReportLocation.__table__ if name in PUBLISHED_COLUMNS else Report.__table__
+
+def report_batches(query, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[tuple]]:
+    columns = [_export_table(name).columns[name] for name in EXPORT_COLUMNS]
+    query = query.outerjoin(ReportLocation, ReportLocation.report_id == Report.id)
+    rows = db.session.execute(
+        query.with_entities(*columns).order_by(Report.created_at.asc()).statement
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in rows.partitions(batch_size):
+        yield [tuple(row) for row in partition]
+
+def _csv_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _csv_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(EXPORT_HEADERS)
+    for batch in batches:
+        writer.writerows([_csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def _ndjson_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    for batch in batches:
+        lines = [json.dumps(dict(zip(EXPORT_HEADERS, (_csv_value(value) for value in row))),
+                            separators=(',', ':'))
+                 for row in batch]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def _arrow_type(column):
+    pa = optional_import('pyarrow')
+    column_type = column.type
+    if isinstance(column_type, UUIDType) or isinstance(column_type, (db.String, db.Text)):
+        return pa.string()
+    if isinstance(column_type, db.Float):
+        return pa.float64()
+    if isinstance(column_type, db.Integer):
+        return pa.int64()
+    if isinstance(column_type, db.DateTime):
+        return pa.timestamp('us')
+    if isinstance(column_type, db.Boolean):
+        return pa.bool_()
+    return pa.string()
+
+def export_schema():
+    pa = optional_import('pyarrow')
+    columns = [_export_table(name).columns[name] for name in EXPORT_COLUMNS]
+    return pa.schema([
+        pa.field(header, _arrow_type(column), nullable=column.nullable)
+        for column, header in zip(columns, EXPORT_HEADERS)
+    ])
+
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _parquet_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    pa = optional_import('pyarrow')
+    pq = optional_import('pyarrow.parquet')
+    schema = export_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    try:
+        # One row group per DB batch so memory stays bounded by batch size.
+        for batch in batches:
+            arrays = [pa.array(column, type=field.type) for column, field in zip(zip(*batch), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+
+    yield sink.drain()
+
+def stream_export(query, export_format: str) -> Iterator[bytes]:
+    batches = report_batches(query)
+
+    if export_format == 'csv':
+        return _csv_chunks(batches)
+    if export_format == 'csv.gz':
+        return _gzip_chunks(_csv_chunks(batches))
+    if export_format == 'ndjson.gz':
+        return _gzip_chunks(_ndjson_chunks(batches))
+    if export_format == 'parquet':
+        return _parquet_chunks(batches)
+
+    raise ValueError(f'Unsupported export format: {export_format}')
+
+def normalize_filters(filters: Dict[str, Any]) -> Dict[str, str]:
+    normalized = {}
+    for key in EXPORT_FILTER_KEYS:
+        value = filters.get(key)
+        if not value:
+            continue
+        if key.endswith('_date'):
+            value = datetime.fromisoformat(value).isoformat()
+        elif key in DELTA_FILTER_KEYS:
+            value = int(value)
+        normalized[key] = str(value)
+    return normalized
+
+def filters_hash(filters: Dict[str, Any]) -> str:
+    canonical = json.dumps(normalize_filters(filters), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def base_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in filters.items() if key not in DELTA_FILTER_KEYS}
+
+def purchase_watermark(user_id: str, filters: Dict[str, Any]) -> int:
+    watermark = PurchaseWatermark.query.get((user_id, filters_hash(base_filters(filters))))
+    return watermark.last_seq if watermark else 0
+
+def delta_filters(user_id: str, filters: Dict[str, Any], until: int) -> Dict[str, Any]:
+    return {**base_filters(filters), 'since_seq': purchase_watermark(user_id, filters), 'until_seq': until}
+
+def advance_watermark(user_id: str, filters: Dict[str, Any], seq: int, purchase_id: str) -> None:
+    statement = sqlite_insert(PurchaseWatermark).values(
+        user_id=user_id,
+        filters_hash=filters_hash(base_filters(filters)),
+        last_seq=seq,
+        purchase_id=purchase_id,
+        updated_at=datetime.utcnow()
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['user_id', 'filters_hash'],
+        set_={
+            'last_seq': func.max(PurchaseWatermark.last_seq, statement.excluded.last_seq),
+            'purchase_id': statement.excluded.purchase_id,
+            'updated_at': statement.excluded.updated_at
+        }
+    ))
+
+def artifact_key(filters_digest: str, export_format: str, dataset_version: int) -> str:
+    raw = f'{filters_digest}:{export_format}:{dataset_version}:{EXPORT_SCHEMA_VERSION}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def artifact_path(artifact: ExportArtifact) -> str:
+    return os.path.abspath(os.path.join(EXPORT_FOLDER, artifact.file_path))
+
+def export_cache_key(filters: Dict[str, Any], export_format: str) -> Tuple[str, int, str]:
+    digest = filters_hash(filters)
+    version = latest_seq()
+    return digest, version, artifact_key(digest, export_format, version)
+
+def find_artifact(cache_key: str) -> Optional[ExportArtifact]:
+    artifact = ExportArtifact.query.filter_by(cache_key=cache_key).first()
+
+    if not artifact:
+        return None
+
+    if not os.path.exists(artifact_path(artifact)):
+        db.session.delete(artifact)
+        db.session.commit()
+        return None
+
+    artifact.last_accessed_at = datetime.utcnow()
+    db.session.commit()
+    return artifact
+
+def download_artifact(purchase_id: str, export_format: str, cache_key: str) -> Optional[ExportArtifact]:
+    # An unfinished download stays pinned to the snapshot it started on,
+    # so its ETag holds and the client can resume with If-Range.
+    progress = DownloadProgress.query.get(purchase_id)
+    if progress and progress.export_format == export_format and progress.status != 'completed':
+        artifact = find_artifact(progress.etag)
+        if artifact:
+            return artifact
+
+    return find_artifact(cache_key)
+
+def _register_artifact(key: str, digest: str, export_format: str, version: int,
+                       relative_path: str, size: int) -> None:
+    try:
+        db.session.add(ExportArtifact(
+            id=generate_id(),
+            cache_key=key,
+            filters_hash=digest,
+            export_format=export_format,
+            dataset_version=version,
+            file_path=relative_path,
+            file_size=size
+        ))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+def _build_lock(digest: str, export_format: str):
+    # One builder per filter set and format across threads and workers; a
+    # concurrent miss streams straight from the query instead of racing it.
+    handle = open(os.path.join(EXPORT_FOLDER, f'.{digest}.{export_format}.lock'), 'w')
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+    return handle
+
+def cached_export(filters: Dict[str, Any], export_format: str, digest: str, version: int,
+                  key: str) -> Iterator[bytes]:
+    os.makedirs(EXPORT_FOLDER, exist_ok=True)
+    relative_path = f'{key}.{EXPORT_FORMATS[export_format]["extension"]}'
+    final_path = os.path.join(EXPORT_FOLDER, relative_path)
+
+    lock = _build_lock(digest, export_format)
+    if lock is None or ExportArtifact.query.filter_by(cache_key=key).first() is not None:
+        if lock:
+            lock.close()
+        yield from stream_export(filtered_reports_query(filters), export_format)
+        return
+
+    # Tee the stream: the client gets bytes as they are produced while the
+    # same bytes land in a temp file that becomes the shared artifact.
+    temp_path = f'{final_path}.{generate_id()}.tmp'
+    size = 0
+    try:
+        with open(temp_path, 'wb') as handle:
+            for chunk in stream_export(filtered_reports_query(filters), export_format):
+                handle.write(chunk)
+                size += len(chunk)
+                yield chunk
+
+        # The batches are separate reads, so a change committed while they
+        # ran would leave a file that matches no single version. Only keep
+        # it when nothing moved.
+        if latest_seq() == version:
+            os.replace(temp_path, final_path)
+            _register_artifact(key, digest, export_format, version, relative_path, size)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        lock.close()
+
+def start_download(purchase_id: str, export_format: str, etag: str, total: Optional[int]) -> None:
+    progress = DownloadProgress.query.get(purchase_id)
+    if not progress or progress.etag != etag:
+        if progress:
+            db.session.delete(progress)
+            db.session.flush()
+        progress = DownloadProgress(purchase_id=purchase_id, export_format=export_format, etag=etag,
+                                    bytes_delivered=0, attempts=0)
+        db.session.add(progress)
+
+    progress.attempts += 1
+    progress.total_bytes = total or progress.total_bytes
+    progress.status = 'in_progress'
+    db.session.commit()
+
+def track_download(purchase_id: str, chunks: Iterable[bytes], offset: int = 0) -> Iterator[bytes]:
+    # Counts bytes actually handed to the server and records the furthest
+    # byte delivered once the response finishes or the client disconnects.
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+        record_download_progress(purchase_id, offset + sent)
+
+def record_download_progress(purchase_id: str, delivered: int) -> None:
+    try:
+        progress = DownloadProgress.query.get(purchase_id)
+        if progress:
+            if progress.total_bytes is None:
+                artifact = ExportArtifact.query.filter_by(cache_key=progress.etag).first()
+                progress.total_bytes = artifact.file_size if artifact else None
+            progress.bytes_delivered = max(progress.bytes_delivered or 0, delivered)
+            finished = progress.total_bytes is not None and progress.bytes_delivered >= progress.total_bytes
+            progress.status = 'completed' if finished else 'interrupted'
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Download progress error: {str(e)}")
+
+def evict_artifacts(referenced_hashes: Set[str], pinned_keys: Set[str] = frozenset(),
+                    budget: int = EXPORT_CACHE_BUDGET) -> Dict[str, int]:
+    version = latest_seq()
+    artifacts = ExportArtifact.query.order_by(ExportArtifact.last_accessed_at.desc()).all()
+
+    kept_bytes = 0
+    evicted = []
+    for artifact in artifacts:
+        if artifact.cache_key in pinned_keys:
+            kept_bytes += artifact.file_size
+            continue
+
+        stale = artifact.dataset_version != version
+        referenced = artifact.filters_hash in referenced_hashes
+        if not stale and (referenced or kept_bytes + artifact.file_size <= budget):
+            kept_bytes += artifact.file_size
+            continue
+        evicted.append(artifact)
+
+    reclaimed = 0
+    for artifact in evicted:
+        try:
+            os.remove(artifact_path(artifact))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Export artifact removal error: {str(e)}")
+            continue
+        reclaimed += artifact.file_size
+        db.session.delete(artifact)
+
+    db.session.commit()
+    return {'evicted': len(evicted), 'reclaimed_bytes': reclaimed, 'kept_bytes': kept_bytes}
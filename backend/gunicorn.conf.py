@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+
+# Production entry point: `gunicorn` from this directory picks this file up.
+# `python app.py` remains the single-process development server.
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+wsgi_app = 'app:app'
+bind = os.environ.get('BIND', f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 8000)}")
+
+# One process per core; threads overlap the time requests spend waiting on
+# SQLite, the payment provider and disk.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+if SERVER_MODE == 'asgi':
+    # Each worker runs an event loop for the async routes and hands the
+    # rest of the Flask app to a pool of the same number of threads.
+    wsgi_app = 'asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    os.environ.setdefault('ASGI_SYNC_THREADS', str(threads))
+    threads = int(os.environ['ASGI_SYNC_THREADS'])
+
+# Import once in the master so workers fork with the app already loaded and
+# share its memory copy-on-write. Code changes then need a new master
+# (USR2 followed by WINCH and QUIT on the old one), not HUP.
+preload_app = True
+
+# Recycle workers to cap slow leaks; the jitter keeps them from all
+# restarting at the same moment.
+max_requests = int(os.environ.get('MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', max_requests // 10))
+
+# Stopped or recycled workers finish in-flight requests (exports can stream
+# for a while) before they are killed.
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 60))
+timeout = int(os.environ.get('WORKER_TIMEOUT', 120))
+keepalive = int(os.environ.get('KEEPALIVE', 5))
+
+accesslog = os.environ.get('ACCESS_LOG', '-')
+errorlog = '-'
+
+# Every request thread can hold a connection at once, plus one for the
+# background task thread; overflow only absorbs brief bursts. Set before
+# preload so create_app sees it.
+os.environ.setdefault('DB_POOL_SIZE', str(threads + 1))
+os.environ.setdefault('DB_MAX_OVERFLOW', '2')
+
+def post_fork(server, worker):
+    import app as app_module
+    from models import db
+
+    # Connections opened in the master must never be shared across
+    # processes; each worker starts with an empty pool.
+    with app_module.app.app_context():
+        db.engine.dispose(close=False)
+
+def worker_exit(server, worker):
+    from metrics import flush_metrics
+
+    # Fold this worker's counters into the spool before it goes away so
+    # recycling does not lose requests from /metrics.
+    try:
+        flush_metrics()
+    except Exception as e:
+        server.log.warning(f"Metrics flush on worker exit failed: {str(e)}")
@@ -0,0 +1,157 @@
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+from models import db
+from metrics import collector_stats
+from payments import payment_queue_depth
+from tasks import task_status
+from utils import logger, UPLOAD_FOLDER
+
+HEALTH_REFRESH_SECONDS = float(os.environ.get('HEALTH_REFRESH_SECONDS', 10))
+HEALTH_STALE_SECONDS = float(os.environ.get('HEALTH_STALE_SECONDS', 3 * HEALTH_REFRESH_SECONDS))
+HEALTH_MAX_LOCK_WAIT_MS = float(os.environ.get('HEALTH_MAX_LOCK_WAIT_MS', 1000))
+HEALTH_MAX_QUEUE_DEPTH = int(os.environ.get('HEALTH_MAX_QUEUE_DEPTH', 1000))
+HEALTH_MIN_FREE_BYTES = int(os.environ.get('HEALTH_MIN_FREE_BYTES', 512 * 1024 * 1024))
+HEALTH_LOCK_TIMEOUT_MS = 2000
+
+_state: Dict[str, Any] = {'checked_at': None, 'checked_monotonic': None, 'ready': False, 'checks': {}}
+_refresh_lock = threading.Lock()
+
+def _check_database() -> Dict[str, Any]:
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        started = time.perf_counter()
+        cursor.execute('SELECT 1').fetchone()
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        # Taking and immediately releasing the write lock measures how long
+        # a submission would currently wait behind other writers.
+        busy_timeout = cursor.execute('PRAGMA busy_timeout').fetchone()[0]
+        cursor.execute(f'PRAGMA busy_timeout = {HEALTH_LOCK_TIMEOUT_MS}')
+        try:
+            started = time.perf_counter()
+            cursor.execute('BEGIN IMMEDIATE')
+            lock_wait_ms = (time.perf_counter() - started) * 1000
+            connection.rollback()
+        finally:
+            cursor.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+    finally:
+        connection.close()
+
+    return {
+        'ok': lock_wait_ms <= HEALTH_MAX_LOCK_WAIT_MS,
+        'latency_ms': round(latency_ms, 3),
+        'lock_wait_ms': round(lock_wait_ms, 3)
+    }
+
+def _check_pool() -> Dict[str, Any]:
+    pool = db.engine.pool
+    if not hasattr(pool, 'size'):
+        return {'ok': True, 'type': type(pool).__name__}
+
+    size = pool.size()
+    checked_out = pool.checkedout()
+    capacity = size + max(getattr(pool, '_max_overflow', 0), 0)
+    return {
+        'ok': True,
+        'type': type(pool).__name__,
+        'size': size,
+        'checked_out': checked_out,
+        'overflow': pool.overflow(),
+        'utilization': round(checked_out / capacity, 3) if capacity else None
+    }
+
+def _check_queue() -> Dict[str, Any]:
+    depth = payment_queue_depth()
+    failing = [task['name'] for task in task_status() if task['last_error']]
+    return {
+        'ok': depth <= HEALTH_MAX_QUEUE_DEPTH,
+        'payment_events': depth,
+        'failing_tasks': failing
+    }
+
+def _check_disk() -> Dict[str, Any]:
+    path = UPLOAD_FOLDER if os.path.isdir(UPLOAD_FOLDER) else os.path.dirname(os.path.abspath(UPLOAD_FOLDER))
+    usage = shutil.disk_usage(path)
+    return {
+        'ok': usage.free >= HEALTH_MIN_FREE_BYTES,
+        'path': UPLOAD_FOLDER,
+        'free_bytes': usage.free,
+        'total_bytes': usage.total,
+        'free_ratio': round(usage.free / usage.total, 4) if usage.total else None
+    }
+
+def _check_caches() -> Dict[str, Any]:
+    caches = {}
+    for name, stats in collector_stats().items():
+        hits = sum(value for key, value in stats.items() if key.endswith('hits'))
+        lookups = hits + stats.get('misses', 0)
+        caches[name] = dict(stats, hit_rate=round(hits / lookups, 4) if lookups else None)
+    return {'ok': True, 'caches': caches}
+
+HEALTH_CHECKS = {
+    'database': _check_database,
+    'pool': _check_pool,
+    'queue': _check_queue,
+    'disk': _check_disk,
+    'caches': _check_caches
+}
+
+def refresh_health() -> bool:
+    global _state
+
+    checks = {}
+    for name, check in HEALTH_CHECKS.items():
+        try:
+            checks[name] = check()
+        except Exception as e:
+            checks[name] = {'ok': False, 'error': str(e)}
+
+    ready = all(check['ok'] for check in checks.values())
+    if not ready and _state['ready']:
+        failing = ', '.join(name for name, check in checks.items() if not check['ok'])
+        logger.warning(f"Readiness check failing: {failing}")
+
+    # Swap in a new dict so probes never see a half-updated state.
+    _state = {
+        'checked_at': datetime.utcnow().isoformat(),
+        'checked_monotonic': time.monotonic(),
+        'ready': ready,
+        'checks': checks
+    }
+    return ready
+
+def readiness(refresh_inline: bool = False) -> Dict[str, Any]:
+    state = _state
+    age = None if state['checked_monotonic'] is None else time.monotonic() - state['checked_monotonic']
+
+    # Without the background scheduler nothing else refreshes the state, so
+    # one probe per interval pays for it while the others read the cache.
+    if refresh_inline and (age is None or age >= HEALTH_REFRESH_SECONDS) and _refresh_lock.acquire(blocking=False):
+        try:
+            refresh_health()
+        finally:
+            _refresh_lock.release()
+        state = _state
+        age = 0.0
+
+    if age is None:
+        status = 'starting'
+    elif age > HEALTH_STALE_SECONDS:
+        status = 'stale'
+    else:
+        status = 'ready' if state['ready'] else 'not_ready'
+
+    return {
+        'status': status,
+        'checked_at': state['checked_at'],
+        'age_seconds': round(age, 3) if age is not None else None,
+        'checks': state['checks']
+    }
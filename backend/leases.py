@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import insert, literal, select
+
+from models import db, Report, ModerationLease, UUIDType
+
+DEFAULT_LEASE_SECONDS = 15 * 60
+MAX_LEASE_SECONDS = 60 * 60
+MAX_CLAIM_COUNT = 50
+
+def expire_stale_leases(now: Optional[datetime] = None) -> int:
+    now = now or datetime.utcnow()
+    expired = ModerationLease.query.filter(ModerationLease.expires_at < now) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return expired
+
+def active_leases(user_id: str, now: Optional[datetime] = None) -> List[ModerationLease]:
+    now = now or datetime.utcnow()
+    return ModerationLease.query.join(Report) \
+        .filter(ModerationLease.user_id == user_id, ModerationLease.expires_at >= now) \
+        .order_by(Report.created_at.asc()).all()
+
+def claim_reports(user_id: str, count: int, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> List[ModerationLease]:
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=lease_seconds)
+
+    ModerationLease.query.filter(ModerationLease.expires_at < now) \
+        .delete(synchronize_session=False)
+
+    # Single INSERT ... SELECT so picking and claiming happen in one statement;
+    # the report_id primary key makes a concurrent double claim a no-op.
+    unclaimed = select(
+        Report.id,
+        literal(user_id, UUIDType),
+        literal(now),
+        literal(expires_at)
+    ).outerjoin(ModerationLease, ModerationLease.report_id == Report.id) \
+        .where(Report.status == 'pending', ModerationLease.report_id.is_(None)) \
+        .order_by(Report.created_at.asc()) \
+        .limit(count)
+
+    claimed_ids = db.session.execute(
+        insert(ModerationLease)
+        .from_select(['report_id', 'user_id', 'claimed_at', 'expires_at'], unclaimed)
+        .prefix_with('OR IGNORE', dialect='sqlite')
+        .returning(ModerationLease.report_id)
+    ).scalars().all()
+    db.session.commit()
+
+    if not claimed_ids:
+        return []
+
+    return ModerationLease.query.join(Report) \
+        .filter(ModerationLease.report_id.in_(claimed_ids)) \
+        .order_by(Report.created_at.asc()).all()
+
+def renew_leases(user_id: str, report_ids: List[str], lease_seconds: int = DEFAULT_LEASE_SECONDS) -> int:
+    now = datetime.utcnow()
+    renewed = ModerationLease.query.filter(
+        ModerationLease.user_id == user_id,
+        ModerationLease.report_id.in_(report_ids),
+        ModerationLease.expires_at >= now
+    ).update({'expires_at': now + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    db.session.commit()
+    return renewed
+
+def release_leases(user_id: str, report_ids: Optional[List[str]] = None) -> int:
+    query = ModerationLease.query.filter(ModerationLease.user_id == user_id)
+    if report_ids is not None:
+        query = query.filter(ModerationLease.report_id.in_(report_ids))
+
+    released = query.delete(synchronize_session=False)
+    db.session.commit()
+    return released
@@ -0,0 +1,304 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils import logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+METRICS_SPOOL_DIR = os.environ.get('METRICS_SPOOL_DIR', 'metrics')
+METRICS_FLUSH_SECONDS = 5
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ARCHIVE_FILE = '_archive.json'
+
+_request_stats = ContextVar('request_stats', default=None)
+_lock = threading.Lock()
+_routes = {}
+_statuses = {}
+_in_flight = [0]
+_overhead = [0, 0.0]
+_collectors: Dict[str, Callable[[], Dict[str, int]]] = {}
+_process_token = [None, None]
+_instrumented = set()
+
+def _spool_name() -> str:
+    # Workers forked from a preloaded master must not share its file name.
+    if _process_token[0] != os.getpid():
+        _process_token[:] = [os.getpid(), f'{os.getpid()}-{int(time.time() * 1000)}.json']
+    return _process_token[1]
+
+def register_collector(name: str, func: Callable[[], Dict[str, int]]) -> None:
+    _collectors[name] = func
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[2] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is not None and stats[2]:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - stats[2]
+        stats[2] = 0.0
+
+def _route_label() -> str:
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+def start_request():
+    started = time.perf_counter()
+    # [sql statements, sql seconds, statement start, request start]
+    _request_stats.set([0, 0.0, 0.0, started])
+    with _lock:
+        _in_flight[0] += 1
+        _overhead[1] += time.perf_counter() - started
+
+def finish_request(route: str, method: str, status: int) -> None:
+    finished = time.perf_counter()
+    stats = _request_stats.get()
+    _request_stats.set(None)
+
+    key = (route, method)
+    with _lock:
+        if stats is not None:
+            _in_flight[0] -= 1
+            duration = finished - stats[3]
+            entry = _routes.get(key)
+            if entry is None:
+                entry = _routes[key] = [0, 0.0, [0] * len(LATENCY_BUCKETS), 0, 0.0]
+            entry[0] += 1
+            entry[1] += duration
+            bucket = bisect_left(LATENCY_BUCKETS, duration)
+            if bucket < len(LATENCY_BUCKETS):
+                entry[2][bucket] += 1
+            entry[3] += stats[0]
+            entry[4] += stats[1]
+
+        status_key = key + (status,)
+        _statuses[status_key] = _statuses.get(status_key, 0) + 1
+        _overhead[0] += 1
+        _overhead[1] += time.perf_counter() - finished
+
+def _finish_request(response):
+    finish_request(_route_label(), request.method, response.status_code)
+    return response
+
+def abandon_request(error=None):
+    # after_request does not run when a view raises past the error
+    # handlers; keep the in-flight gauge honest anyway.
+    if _request_stats.get() is not None:
+        _request_stats.set(None)
+        with _lock:
+            _in_flight[0] -= 1
+
+def instrument_blueprint(blueprint) -> None:
+    if blueprint.name in _instrumented:
+        return
+    _instrumented.add(blueprint.name)
+
+    blueprint.before_request(start_request)
+    blueprint.after_request(_finish_request)
+    blueprint.teardown_request(abandon_request)
+
+def collector_stats() -> Dict[str, Dict[str, int]]:
+    caches = {}
+    for name, func in _collectors.items():
+        try:
+            caches[name] = func()
+        except Exception as e:
+            logger.error(f"Metrics collector {name} failed: {str(e)}")
+    return caches
+
+def snapshot() -> Dict[str, Any]:
+    caches = collector_stats()
+
+    with _lock:
+        return {
+            'routes': [[route, method, entry[0], entry[1], list(entry[2]), entry[3], entry[4]]
+                       for (route, method), entry in _routes.items()],
+            'statuses': [[route, method, status, count] for (route, method, status), count in _statuses.items()],
+            'in_flight': _in_flight[0],
+            'overhead': list(_overhead),
+            'caches': caches
+        }
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    temp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as handle:
+        json.dump(data, handle, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+def _process_alive(token: str) -> bool:
+    try:
+        os.kill(int(token.split('-')[0]), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+def _empty() -> Dict[str, Any]:
+    return {'routes': [], 'statuses': [], 'in_flight': 0, 'overhead': [0, 0.0], 'caches': {}}
+
+def _merge(total: Dict[str, Any], part: Dict[str, Any], include_gauges: bool = True) -> Dict[str, Any]:
+    routes = {(row[0], row[1]): row for row in total['routes']}
+    for route, method, count, seconds, buckets, statements, statement_seconds in part.get('routes', []):
+        row = routes.get((route, method))
+        if row is None:
+            routes[(route, method)] = [route, method, count, seconds, list(buckets), statements, statement_seconds]
+        else:
+            row[2] += count
+            row[3] += seconds
+            row[4] = [a + b for a, b in zip(row[4], buckets)]
+            row[5] += statements
+            row[6] += statement_seconds
+
+    statuses = {(row[0], row[1], row[2]): row for row in total['statuses']}
+    for route, method, status, count in part.get('statuses', []):
+        row = statuses.setdefault((route, method, status), [route, method, status, 0])
+        row[3] += count
+
+    caches = total['caches']
+    for name, values in part.get('caches', {}).items():
+        merged = caches.setdefault(name, {})
+        for key, value in values.items():
+            if key != 'size' or include_gauges:
+                merged[key] = merged.get(key, 0) + value
+
+    return {
+        'routes': list(routes.values()),
+        'statuses': list(statuses.values()),
+        'in_flight': total['in_flight'] + (part.get('in_flight', 0) if include_gauges else 0),
+        'overhead': [a + b for a, b in zip(total['overhead'], part.get('overhead', [0, 0.0]))],
+        'caches': caches
+    }
+
+def _archive_dead_processes() -> None:
+    # Counters from exited workers are folded into one archive file so the
+    # fleet totals never go backwards when a worker is recycled.
+    if fcntl is None:
+        return
+
+    with open(os.path.join(METRICS_SPOOL_DIR, '.lock'), 'w') as lock_handle:
+        fcntl.flock(lock_handle, fcntl.LOCK_EX)
+
+        archive_path = os.path.join(METRICS_SPOOL_DIR, ARCHIVE_FILE)
+        archive = None
+        for entry in os.scandir(METRICS_SPOOL_DIR):
+            if not entry.name.endswith('.json') or entry.name == ARCHIVE_FILE:
+                continue
+            if _process_alive(entry.name[:-5]):
+                continue
+
+            if archive is None:
+                archive = _read_json(archive_path) or _empty()
+            archive = _merge(archive, _read_json(entry.path) or _empty(), include_gauges=False)
+            os.remove(entry.path)
+
+        if archive is not None:
+            _write_json(archive_path, archive)
+
+def flush_metrics() -> None:
+    os.makedirs(METRICS_SPOOL_DIR, exist_ok=True)
+    _write_json(os.path.join(METRICS_SPOOL_DIR, _spool_name()), snapshot())
+    _archive_dead_processes()
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def collect_metrics() -> Dict[str, Any]:
+    flush_metrics()
+
+    total = _empty()
+    for entry in os.scandir(METRICS_SPOOL_DIR):
+        if entry.name.endswith('.json'):
+            total = _merge(total, _read_json(entry.path) or _empty())
+    return total
+
+def _labels(**labels) -> str:
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+def render_prometheus(data: Dict[str, Any], gauges: Optional[Dict[str, float]] = None) -> str:
+    lines = [
+        '# HELP civicvoice_http_request_duration_seconds Request latency by route.',
+        '# TYPE civicvoice_http_request_duration_seconds histogram'
+    ]
+    for route, method, count, seconds, buckets, _, _ in sorted(data['routes']):
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+            cumulative += bucket_count
+            lines.append(f'civicvoice_http_request_duration_seconds_bucket'
+                         f'{_labels(route=route, method=method, le=bound)} {cumulative}')
+        lines.append(f'civicvoice_http_request_duration_seconds_bucket'
+                     f'{_labels(route=route, method=method, le="+Inf")} {count}')
+        lines.append(f'civicvoice_http_request_duration_seconds_sum{_labels(route=route, method=method)} {seconds}')
+        lines.append(f'civicvoice_http_request_duration_seconds_count{_labels(route=route, method=method)} {count}')
+
+    lines += ['# HELP civicvoice_http_responses_total Responses by route and status code.',
+              '# TYPE civicvoice_http_responses_total counter']
+    for route, method, status, count in sorted(data['statuses']):
+        lines.append(f'civicvoice_http_responses_total{_labels(route=route, method=method, status=status)} {count}')
+
+    lines += ['# HELP civicvoice_db_statements_total SQL statements executed while serving a route.',
+              '# TYPE civicvoice_db_statements_total counter']
+    for route, method, _, _, _, statements, _ in sorted(data['routes']):
+        lines.append(f'civicvoice_db_statements_total{_labels(route=route, method=method)} {statements}')
+
+    lines += ['# HELP civicvoice_db_statement_seconds_total Time spent in SQL statements per route.',
+              '# TYPE civicvoice_db_statement_seconds_total counter']
+    for route, method, _, _, _, _, statement_seconds in sorted(data['routes']):
+        lines.append(f'civicvoice_db_statement_seconds_total{_labels(route=route, method=method)} {statement_seconds}')
+
+    lines += ['# HELP civicvoice_cache_events_total Cache lookups by cache and outcome.',
+              '# TYPE civicvoice_cache_events_total counter']
+    for name, values in sorted(data['caches'].items()):
+        for key, value in sorted(values.items()):
+            if key != 'size':
+                lines.append(f'civicvoice_cache_events_total{_labels(cache=name, result=key)} {value}')
+
+    lines += ['# HELP civicvoice_cache_entries Entries held in in-process caches, summed over workers.',
+              '# TYPE civicvoice_cache_entries gauge']
+    for name, values in sorted(data['caches'].items()):
+        if 'size' in values:
+            lines.append(f'civicvoice_cache_entries{_labels(cache=name)} {values["size"]}')
+
+    lines += ['# HELP civicvoice_http_requests_in_flight Requests currently being served.',
+              '# TYPE civicvoice_http_requests_in_flight gauge',
+              f'civicvoice_http_requests_in_flight {data["in_flight"]}',
+              '# HELP civicvoice_instrumentation_seconds_total Time spent in the metrics hooks themselves.',
+              '# TYPE civicvoice_instrumentation_seconds_total counter',
+              f'civicvoice_instrumentation_seconds_total {data["overhead"][1]}',
+              '# HELP civicvoice_instrumented_requests_total Requests that passed through the metrics hooks.',
+              '# TYPE civicvoice_instrumented_requests_total counter',
+              f'civicvoice_instrumented_requests_total {data["overhead"][0]}']
+
+    for name, value in sorted((gauges or {}).items()):
+        lines += [f'# TYPE civicvoice_{name} gauge', f'civicvoice_{name} {value}']
+
+    return '\n'.join(lines) + '\n'
+
+def metrics_response(gauges: Optional[Dict[str, float]] = None) -> Response:
+    return Response(render_prometheus(collect_metrics(), gauges),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+atexit.register(lambda: os.path.isdir(METRICS_SPOOL_DIR) and flush_metrics())
@@ -1,13 +1,41 @@
+import os
+import uuid
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash
 
 db = SQLAlchemy()
 
+ID_STORAGE = os.environ.get('ID_STORAGE', 'text')
+
+class UUIDType(db.TypeDecorator):
+    impl = db.String(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if ID_STORAGE == 'binary':
+            return dialect.type_descriptor(db.LargeBinary(16))
+        return dialect.type_descriptor(db.String(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if ID_STORAGE != 'binary':
+            return str(value)
+        try:
+            return uuid.UUID(str(value)).bytes
+        except ValueError:
+            raise ValueError(f"Malformed id: {value!r}")
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return str(uuid.UUID(bytes=value))
+        return value
+
 class User(db.Model):
     __tablename__ = 'users'
 
-    id = db.Column(db.String(36), primary_key=True)
+    id = db.Column(UUIDType, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
     role = db.Column(db.String(20), nullable=False)
@@ -36,7 +64,7 @@ class User(db.Model):
 class Report(db.Model):
     __tablename__ = 'reports'
 
-    id = db.Column(db.String(36), primary_key=True)
+    id = db.Column(UUIDType, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     category = db.Column(db.String(50), nullable=False)
     description = db.Column(db.Text)
@@ -78,8 +106,8 @@ class Report(db.Model):
 class ReportAttachment(db.Model):
     __tablename__ = 'report_attachments'
 
-    id = db.Column(db.String(36), primary_key=True)
-    report_id = db.Column(db.String(36), db.ForeignKey('reports.id'), nullable=False)
+    id = db.Column(UUIDType, primary_key=True)
+    report_id = db.Column(UUIDType, db.ForeignKey('reports.id'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)
@@ -98,9 +126,9 @@ class ReportAttachment(db.Model):
 class VerificationLog(db.Model):
     __tablename__ = 'verification_logs'
 
-    id = db.Column(db.String(36), primary_key=True)
-    report_id = db.Column(db.String(36), db.ForeignKey('reports.id'), nullable=False)
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(UUIDType, primary_key=True)
+    report_id = db.Column(UUIDType, db.ForeignKey('reports.id'), nullable=False)
+    user_id = db.Column(UUIDType, db.ForeignKey('users.id'), nullable=False)
     action = db.Column(db.String(20), nullable=False)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -118,8 +146,8 @@ class VerificationLog(db.Model):
 class DataPurchase(db.Model):
     __tablename__ = 'data_purchases'
 
-    id = db.Column(db.String(36), primary_key=True)
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(UUIDType, primary_key=True)
+    user_id = db.Column(UUIDType, db.ForeignKey('users.id'), nullable=False)
     stripe_payment_intent_id = db.Column(db.String(100), unique=True, nullable=False)
     amount = db.Column(db.Float, nullable=False)
     report_count = db.Column(db.Integer, nullable=False)
@@ -128,6 +156,8 @@ class DataPurchase(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
 
+    download = db.relationship('DownloadProgress', uselist=False, lazy=True)
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -135,13 +165,179 @@ class DataPurchase(db.Model):
             'report_count': self.report_count,
             'status': self.status,
             'created_at': self.created_at.isoformat(),
+            'expires_at': self.expires_at.isoformat(),
+            'download': self.download.to_dict() if self.download else None
+        }
+
+class DownloadProgress(db.Model):
+    __tablename__ = 'download_progress'
+
+    purchase_id = db.Column(UUIDType, db.ForeignKey('data_purchases.id'), primary_key=True)
+    export_format = db.Column(db.String(20), nullable=False)
+    etag = db.Column(db.String(64))
+    bytes_delivered = db.Column(db.Integer, default=0)
+    total_bytes = db.Column(db.Integer)
+    attempts = db.Column(db.Integer, default=0)
+    status = db.Column(db.String(20), default='in_progress')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'format': self.export_format,
+            'etag': self.etag,
+            'bytes_delivered': self.bytes_delivered,
+            'total_bytes': self.total_bytes,
+            'percent': round(100 * self.bytes_delivered / self.total_bytes, 1) if self.total_bytes else None,
+            'attempts': self.attempts,
+            'status': self.status,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ModerationLease(db.Model):
+    __tablename__ = 'moderation_leases'
+
+    report_id = db.Column(UUIDType, db.ForeignKey('reports.id'), primary_key=True)
+    user_id = db.Column(UUIDType, db.ForeignKey('users.id'), nullable=False)
+    claimed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    report = db.relationship('Report', lazy='joined')
+
+    def to_dict(self):
+        return {
+            'report_id': self.report_id,
+            'user_id': self.user_id,
+            'claimed_at': self.claimed_at.isoformat(),
             'expires_at': self.expires_at.isoformat()
         }
 
+class ModerationEvent(db.Model):
+    __tablename__ = 'moderation_events'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event_type = db.Column(db.String(30), nullable=False)
+    report_id = db.Column(UUIDType, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ReportChange(db.Model):
+    __tablename__ = 'report_changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    report_id = db.Column(UUIDType, nullable=False)
+    change_type = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ExportArtifact(db.Model):
+    __tablename__ = 'export_artifacts'
+
+    id = db.Column(UUIDType, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False)
+    filters_hash = db.Column(db.String(64), nullable=False)
+    export_format = db.Column(db.String(20), nullable=False)
+    dataset_version = db.Column(db.Integer, nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ReportDailyCount(db.Model):
+    __tablename__ = 'report_daily_counts'
+
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class PaymentEvent(db.Model):
+    __tablename__ = 'payment_events'
+
+    id = db.Column(db.String(100), primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    payment_intent_id = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending')
+    attempts = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    processed_at = db.Column(db.DateTime)
+
+class FakePaymentIntent(db.Model):
+    __tablename__ = 'fake_payment_intents'
+
+    id = db.Column(db.String(100), primary_key=True)
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(30), nullable=False)
+    intent_metadata = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ReportSignature(db.Model):
+    __tablename__ = 'report_signatures'
+
+    report_id = db.Column(UUIDType, db.ForeignKey('reports.id'), primary_key=True)
+    minhash = db.Column(db.LargeBinary, nullable=False)
+    geo_cell = db.Column(db.String(40), nullable=False)
+    cluster_id = db.Column(UUIDType)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ReportLshBucket(db.Model):
+    __tablename__ = 'report_lsh_buckets'
+
+    bucket = db.Column(db.String(32), primary_key=True)
+    report_id = db.Column(UUIDType, db.ForeignKey('reports.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ReportRegion(db.Model):
+    __tablename__ = 'report_regions'
+
+    report_id = db.Column(UUIDType, db.ForeignKey('reports.id'), primary_key=True)
+    region_id = db.Column(db.String(50), primary_key=True)
+
+class ReportLocation(db.Model):
+    __tablename__ = 'report_locations'
+
+    report_id = db.Column(UUIDType, db.ForeignKey('reports.id'), primary_key=True)
+    top_cell = db.Column(db.String(40), nullable=False)
+    level = db.Column(db.Integer)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PurchaseWatermark(db.Model):
+    __tablename__ = 'purchase_watermarks'
+
+    user_id = db.Column(UUIDType, db.ForeignKey('users.id'), primary_key=True)
+    filters_hash = db.Column(db.String(64), primary_key=True)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+    purchase_id = db.Column(UUIDType, db.ForeignKey('data_purchases.id'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ReportVerifiedSeq(db.Model):
+    __tablename__ = 'report_verified_seqs'
+
+    report_id = db.Column(UUIDType, db.ForeignKey('reports.id'), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
+
+class CodeSequence(db.Model):
+    __tablename__ = 'code_sequences'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class MissingAttachment(db.Model):
+    __tablename__ = 'missing_attachments'
+
+    attachment_id = db.Column(UUIDType, db.ForeignKey('report_attachments.id'), primary_key=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_checked_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class SystemSettings(db.Model):
     __tablename__ = 'system_settings'
 
-    id = db.Column(db.String(36), primary_key=True)
+    id = db.Column(UUIDType, primary_key=True)
     key = db.Column(db.String(100), unique=True, nullable=False)
     value = db.Column(db.Text, nullable=False)
     description = db.Column(db.Text)
@@ -158,6 +354,14 @@ class SystemSettings(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
+class TaskRun(db.Model):
+    __tablename__ = 'task_runs'
+
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(100))
+    leased_until = db.Column(db.DateTime)
+    last_run_at = db.Column(db.DateTime)
+
 db.Index('idx_reports_status', Report.status)
 db.Index('idx_reports_category', Report.category)
 db.Index('idx_reports_created_at', Report.created_at)
@@ -165,5 +369,19 @@ db.Index('idx_reports_reference_code', Report.reference_code)
 db.Index('idx_users_email', User.email)
 db.Index('idx_users_role', User.role)
 db.Index('idx_verification_logs_report_id', VerificationLog.report_id)
+db.Index('idx_verification_logs_report_created_at', VerificationLog.report_id, VerificationLog.created_at)
 db.Index('idx_data_purchases_user_id', DataPurchase.user_id)
-db.Index('idx_data_purchases_expires_at', DataPurchase.expires_at)
\ No newline at end of file
+db.Index('idx_data_purchases_expires_at', DataPurchase.expires_at)
+db.Index('idx_moderation_leases_user_id', ModerationLease.user_id)
+db.Index('idx_moderation_leases_expires_at', ModerationLease.expires_at)
+db.Index('idx_moderation_events_created_at', ModerationEvent.created_at)
+db.Index('idx_report_changes_report_id', ReportChange.report_id)
+db.Index('idx_report_verified_seqs_seq', ReportVerifiedSeq.seq)
+db.Index('idx_export_artifacts_filters_hash', ExportArtifact.filters_hash)
+db.Index('idx_payment_events_status', PaymentEvent.status)
+db.Index('idx_report_signatures_cluster_id', ReportSignature.cluster_id)
+db.Index('idx_report_lsh_buckets_report_id', ReportLshBucket.report_id)
+db.Index('idx_report_lsh_buckets_created_at', ReportLshBucket.created_at)
+db.Index('idx_report_regions_region_id', ReportRegion.region_id, ReportRegion.report_id)
+db.Index('idx_report_locations_top_cell', ReportLocation.top_cell)
+db.Index('idx_report_attachments_file_path', ReportAttachment.file_path)
\ No newline at end of file
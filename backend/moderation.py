@@ -0,0 +1,114 @@
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import and_, exists, insert, update
+
+from models import db, Report, VerificationLog, ModerationLease
+from events import record_events, dispatch_events
+from changes import record_report_changes, record_verified_seqs, CHANGE_UPSERT
+from rollups import record_verified_rollups
+from anonymity import record_verified_locations
+from utils import generate_id
+
+MODERATION_ACTIONS = ('verified', 'rejected')
+MAX_BULK_ITEMS = 500
+
+def _canonical_id(value: Any) -> str:
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return str(value or '')
+
+def moderate_reports(user_id: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    now = datetime.utcnow()
+    results = []
+    by_action = {action: [] for action in MODERATION_ACTIONS}
+    notes = {}
+
+    for item in items:
+        report_id = _canonical_id(item.get('report_id'))
+        action = item.get('action')
+        result = {'report_id': report_id, 'action': action}
+        results.append(result)
+
+        if not report_id or action not in MODERATION_ACTIONS:
+            result['result'] = 'invalid'
+        elif report_id in notes:
+            result['result'] = 'duplicate'
+        else:
+            notes[report_id] = item.get('notes', '')
+            by_action[action].append(report_id)
+
+    leased_elsewhere = exists().where(and_(
+        ModerationLease.report_id == Report.id,
+        ModerationLease.user_id != user_id,
+        ModerationLease.expires_at >= now
+    ))
+
+    updated = set()
+    for action, report_ids in by_action.items():
+        if not report_ids:
+            continue
+
+        rows = db.session.execute(
+            update(Report)
+            .where(Report.id.in_(report_ids), Report.status == 'pending', ~leased_elsewhere)
+            .values(status=action, updated_at=now)
+            .returning(Report.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated.update(row[0] for row in rows)
+
+    pending = [result for result in results if 'result' not in result]
+    logs = []
+    for result in pending:
+        if result['report_id'] in updated:
+            result['result'] = result['action']
+            result['updated_at'] = now.isoformat()
+            logs.append({
+                'id': generate_id(),
+                'report_id': result['report_id'],
+                'user_id': user_id,
+                'action': result['action'],
+                'notes': notes[result['report_id']],
+                'created_at': now
+            })
+
+    if logs:
+        db.session.execute(insert(VerificationLog), logs)
+        ModerationLease.query.filter(ModerationLease.report_id.in_(list(updated))) \
+            .delete(synchronize_session=False)
+
+        verified_ids = [log['report_id'] for log in logs if log['action'] == 'verified']
+        record_report_changes(verified_ids, CHANGE_UPSERT)
+        record_verified_seqs(verified_ids)
+        record_verified_rollups(verified_ids)
+        record_verified_locations(verified_ids)
+
+        for action in MODERATION_ACTIONS:
+            record_events(f'report_{action}', [{
+                'report_id': log['report_id'],
+                'status': action,
+                'timestamp': now.isoformat()
+            } for log in logs if log['action'] == action])
+
+    failed = [result['report_id'] for result in pending if 'result' not in result]
+    if failed:
+        current = dict(db.session.query(Report.id, Report.status).filter(Report.id.in_(failed)).all())
+        for result in pending:
+            if 'result' in result:
+                continue
+            status = current.get(result['report_id'])
+            if status is None:
+                result['result'] = 'not_found'
+            elif status != 'pending':
+                result['result'] = 'already_processed'
+            else:
+                result['result'] = 'claimed'
+
+    db.session.commit()
+    if logs:
+        dispatch_events()
+
+    return results
@@ -0,0 +1,470 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, DataPurchase, PaymentEvent, FakePaymentIntent
+from changes import latest_seq
+from exports import advance_watermark, delta_filters, filtered_reports_query
+from rollups import count_verified_reports
+from utils import generate_id, logger, optional_import
+
+PAYMENT_PROVIDER = os.environ.get('PAYMENT_PROVIDER', 'stripe')
+PAYMENT_TIMEOUT_SECONDS = float(os.environ.get('PAYMENT_TIMEOUT_SECONDS', 5))
+PAYMENT_MAX_RETRIES = int(os.environ.get('PAYMENT_MAX_RETRIES', 2))
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+EVENT_BATCH_SIZE = 50
+EVENT_MAX_ATTEMPTS = 5
+EVENT_CLAIM_TIMEOUT_SECONDS = int(os.environ.get('EVENT_CLAIM_TIMEOUT_SECONDS', 300))
+DOWNLOAD_WINDOW_HOURS = 24
+PURCHASE_MODES = ('full', 'delta')
+PRICE_PER_REPORT = float(os.environ.get('PRICE_PER_REPORT', 0.50))
+
+class PaymentUnavailable(Exception):
+    pass
+
+class PaymentError(Exception):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self.opened_at is None:
+                return
+
+            now = time.monotonic()
+            # Half open lets a single probe through; everyone else keeps
+            # failing fast until it reports back. A probe that never does is
+            # replaced after another reset period.
+            if now - self.opened_at < self.reset_seconds or \
+                    (self._probe_started is not None and now - self._probe_started < self.reset_seconds):
+                raise PaymentUnavailable('Payment provider circuit is open')
+            self._probe_started = now
+
+    def _succeeded(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def _failed(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_started = None
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        self._admit()
+
+        try:
+            result = func(*args, **kwargs)
+        except PaymentError:
+            # The provider answered, it just said no.
+            self._succeeded()
+            raise
+        except Exception as e:
+            self._failed()
+            raise PaymentUnavailable(str(e)) from e
+
+        self._succeeded()
+        return result
+
+    async def call_async(self, func, *args, **kwargs):
+        self._admit()
+
+        try:
+            result = await func(*args, **kwargs)
+        except PaymentError:
+            self._succeeded()
+            raise
+        except Exception as e:
+            self._failed()
+            raise PaymentUnavailable(str(e)) from e
+
+        self._succeeded()
+        return result
+
+def _intent_dict(intent) -> Dict[str, Any]:
+    return {
+        'id': intent['id'],
+        'status': intent['status'],
+        'amount': intent['amount'],
+        'client_secret': intent.get('client_secret'),
+        'metadata': dict(intent.get('metadata') or {})
+    }
+
+class StripeGateway:
+    name = 'stripe'
+
+    def __init__(self):
+        import stripe
+
+        stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+        stripe.max_network_retries = PAYMENT_MAX_RETRIES
+        # RequestsClient keeps one pooled session per process; the ASGI
+        # routes' *_async calls go through httpx instead.
+        async_client = stripe.HTTPXClient(timeout=PAYMENT_TIMEOUT_SECONDS) if optional_import('httpx') else None
+        stripe.default_http_client = stripe.RequestsClient(timeout=PAYMENT_TIMEOUT_SECONDS,
+                                                           async_fallback_client=async_client)
+        self._stripe = stripe
+        self.breaker = CircuitBreaker()
+
+    def _call(self, func, *args, **kwargs):
+        def request():
+            try:
+                return func(*args, **kwargs)
+            except (self._stripe.InvalidRequestError, self._stripe.CardError) as e:
+                # Rejected requests are the caller's problem, not an outage,
+                # so they must not trip the breaker.
+                raise PaymentError(str(e)) from e
+
+        return self.breaker.call(request)
+
+    async def _call_async(self, func, *args, **kwargs):
+        async def request():
+            try:
+                return await func(*args, **kwargs)
+            except (self._stripe.InvalidRequestError, self._stripe.CardError) as e:
+                raise PaymentError(str(e)) from e
+
+        return await self.breaker.call_async(request)
+
+    def create_intent(self, amount: int, metadata: Dict[str, str], idempotency_key: str) -> Dict[str, Any]:
+        intent = self._call(
+            self._stripe.PaymentIntent.create,
+            amount=amount,
+            currency='usd',
+            metadata=metadata,
+            idempotency_key=idempotency_key
+        )
+        return _intent_dict(intent)
+
+    async def create_intent_async(self, amount: int, metadata: Dict[str, str],
+                                  idempotency_key: str) -> Dict[str, Any]:
+        intent = await self._call_async(
+            self._stripe.PaymentIntent.create_async,
+            amount=amount,
+            currency='usd',
+            metadata=metadata,
+            idempotency_key=idempotency_key
+        )
+        return _intent_dict(intent)
+
+    def retrieve_intent(self, intent_id: str) -> Dict[str, Any]:
+        return _intent_dict(self._call(self._stripe.PaymentIntent.retrieve, intent_id))
+
+    async def retrieve_intent_async(self, intent_id: str) -> Dict[str, Any]:
+        return _intent_dict(await self._call_async(self._stripe.PaymentIntent.retrieve_async, intent_id))
+
+    def parse_webhook(self, payload: bytes, signature: Optional[str]) -> Dict[str, Any]:
+        secret = os.environ.get('STRIPE_WEBHOOK_SECRET')
+        if not secret:
+            raise PaymentError('Webhook secret not configured')
+
+        try:
+            event = self._stripe.Webhook.construct_event(payload, signature, secret)
+        except (ValueError, self._stripe.SignatureVerificationError) as e:
+            raise PaymentError('Invalid webhook signature') from e
+
+        return {'id': event['id'], 'type': event['type'], 'intent': _intent_dict(event['data']['object'])}
+
+def _fake_intent_dict(intent: FakePaymentIntent) -> Dict[str, Any]:
+    return {
+        'id': intent.id,
+        'status': intent.status,
+        'amount': intent.amount,
+        'client_secret': f'{intent.id}_secret',
+        'metadata': json.loads(intent.intent_metadata)
+    }
+
+class FakeGateway:
+    # Intents live in the database so every worker sees the same ones.
+    name = 'fake'
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.breaker = CircuitBreaker()
+        # The async paths run their queries on a worker thread, which has no
+        # app context of its own.
+        self._app = current_app._get_current_object()
+
+    def _simulate(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError('Simulated provider failure')
+
+    async def _simulate_async(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError('Simulated provider failure')
+
+    def _in_app(self, func, *args):
+        with self._app.app_context():
+            return func(*args)
+
+    def _store(self, amount, metadata, idempotency_key):
+        existing = FakePaymentIntent.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return _fake_intent_dict(existing)
+
+        intent = FakePaymentIntent(
+            id=f'pi_fake_{generate_id().replace("-", "")}',
+            idempotency_key=idempotency_key,
+            amount=amount,
+            status='requires_payment_method',
+            intent_metadata=json.dumps(metadata)
+        )
+        try:
+            db.session.add(intent)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            intent = FakePaymentIntent.query.filter_by(idempotency_key=idempotency_key).first()
+        return _fake_intent_dict(intent)
+
+    def _lookup(self, intent_id):
+        intent = FakePaymentIntent.query.get(intent_id)
+        if intent is None:
+            raise PaymentError('Unknown payment intent')
+        return _fake_intent_dict(intent)
+
+    def _create(self, amount, metadata, idempotency_key):
+        self._simulate()
+        return self._store(amount, metadata, idempotency_key)
+
+    async def _create_async(self, amount, metadata, idempotency_key):
+        await self._simulate_async()
+        return await asyncio.to_thread(self._in_app, self._store, amount, metadata, idempotency_key)
+
+    def _retrieve(self, intent_id):
+        self._simulate()
+        return self._lookup(intent_id)
+
+    async def _retrieve_async(self, intent_id):
+        await self._simulate_async()
+        return await asyncio.to_thread(self._in_app, self._lookup, intent_id)
+
+    def create_intent(self, amount: int, metadata: Dict[str, str], idempotency_key: str) -> Dict[str, Any]:
+        return self.breaker.call(self._create, amount, metadata, idempotency_key)
+
+    async def create_intent_async(self, amount: int, metadata: Dict[str, str],
+                                  idempotency_key: str) -> Dict[str, Any]:
+        return await self.breaker.call_async(self._create_async, amount, metadata, idempotency_key)
+
+    def retrieve_intent(self, intent_id: str) -> Dict[str, Any]:
+        return self.breaker.call(self._retrieve, intent_id)
+
+    async def retrieve_intent_async(self, intent_id: str) -> Dict[str, Any]:
+        return await self.breaker.call_async(self._retrieve_async, intent_id)
+
+    def complete_payment(self, intent_id: str) -> Dict[str, Any]:
+        completed = FakePaymentIntent.query.filter_by(id=intent_id) \
+            .update({'status': 'succeeded'}, synchronize_session=False)
+        db.session.commit()
+        if not completed:
+            raise PaymentError('Unknown payment intent')
+
+        return {
+            'id': f'evt_fake_{generate_id().replace("-", "")}',
+            'type': 'payment_intent.succeeded',
+            'data': {'object': _fake_intent_dict(FakePaymentIntent.query.get(intent_id))}
+        }
+
+    def parse_webhook(self, payload: bytes, signature: Optional[str]) -> Dict[str, Any]:
+        try:
+            event = json.loads(payload)
+            return {'id': event['id'], 'type': event['type'], 'intent': _intent_dict(event['data']['object'])}
+        except (ValueError, KeyError, TypeError) as e:
+            raise PaymentError('Malformed webhook payload') from e
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_gateway():
+    global _gateway
+
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                if PAYMENT_PROVIDER == 'fake':
+                    # The fake provider completes payments for anyone who
+                    # asks, so it must never be reachable in production.
+                    if not (current_app.testing or current_app.debug):
+                        raise RuntimeError("PAYMENT_PROVIDER=fake is only allowed with TESTING=true or in debug mode")
+                    _gateway = FakeGateway(
+                        latency=float(os.environ.get('FAKE_PAYMENT_LATENCY', 0)),
+                        failure_rate=float(os.environ.get('FAKE_PAYMENT_FAILURE_RATE', 0))
+                    )
+                else:
+                    _gateway = StripeGateway()
+    return _gateway
+
+def purchase_idempotency_key(user_id: str, filters_digest: str, amount: int, dataset_version: int,
+                             client_key: Optional[str] = None) -> str:
+    # A client's own Idempotency-Key is only unique for that client; scope it
+    # to the user so two researchers sending the same key never share an intent.
+    if client_key:
+        raw = f'{user_id}:client:{client_key}'
+    else:
+        raw = f'{user_id}:{filters_digest}:{amount}:{dataset_version}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def quote_purchase(user_id: str, filters: Dict[str, Any], mode: str) -> Dict[str, Any]:
+    dataset_version = latest_seq()
+
+    if mode == 'delta':
+        filters = delta_filters(user_id, filters, dataset_version)
+        report_count = filtered_reports_query(filters).count()
+    elif filters.get('region'):
+        # Daily rollups are not kept per region, so count directly.
+        report_count = filtered_reports_query(filters).count()
+    else:
+        report_count = count_verified_reports(filters)
+
+    return {
+        'filters': filters,
+        'report_count': report_count,
+        'total_amount': int(report_count * PRICE_PER_REPORT * 100),
+        'dataset_version': dataset_version
+    }
+
+def intent_metadata(user_id: str, quote: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'user_id': user_id,
+        'report_count': quote['report_count'],
+        'filters': json.dumps(quote['filters']),
+        'dataset_version': quote['dataset_version']
+    }
+
+def fulfil_purchase(intent: Dict[str, Any]) -> Optional[DataPurchase]:
+    if intent['status'] != 'succeeded':
+        return None
+
+    existing = DataPurchase.query.filter_by(stripe_payment_intent_id=intent['id']).first()
+    if existing:
+        return existing
+
+    metadata = intent['metadata']
+    purchase = DataPurchase(
+        id=generate_id(),
+        user_id=metadata.get('user_id'),
+        stripe_payment_intent_id=intent['id'],
+        amount=intent['amount'] / 100,
+        report_count=int(metadata.get('report_count', 0)),
+        filters=metadata.get('filters', '{}'),
+        expires_at=datetime.utcnow() + timedelta(hours=DOWNLOAD_WINDOW_HOURS)
+    )
+
+    try:
+        db.session.add(purchase)
+        if metadata.get('dataset_version'):
+            db.session.flush()
+            advance_watermark(purchase.user_id, json.loads(purchase.filters),
+                              int(metadata['dataset_version']), purchase.id)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return DataPurchase.query.filter_by(stripe_payment_intent_id=intent['id']).first()
+
+    return purchase
+
+def enqueue_payment_event(event: Dict[str, Any]) -> bool:
+    try:
+        db.session.add(PaymentEvent(
+            id=event['id'],
+            event_type=event['type'],
+            payment_intent_id=event['intent']['id'],
+            payload=json.dumps(event['intent'])
+        ))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+def _release_stale_claims() -> int:
+    # A worker that died or was recycled between claiming an event and
+    # committing its outcome leaves it in 'processing'; hand it back once
+    # the claim is old enough that no live worker can still be on it.
+    cutoff = datetime.utcnow() - timedelta(seconds=EVENT_CLAIM_TIMEOUT_SECONDS)
+    stale = PaymentEvent.query.filter(
+        PaymentEvent.status == 'processing',
+        or_(PaymentEvent.claimed_at.is_(None), PaymentEvent.claimed_at < cutoff)
+    )
+    exhausted = stale.filter(PaymentEvent.attempts >= EVENT_MAX_ATTEMPTS) \
+        .update({'status': 'failed'}, synchronize_session=False)
+    released = stale.update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+
+    if exhausted or released:
+        logger.warning(f"Released {released} stale payment event claims, failed {exhausted}")
+    return released
+
+def process_payment_events() -> int:
+    _release_stale_claims()
+
+    pending = PaymentEvent.query.filter_by(status='pending') \
+        .order_by(PaymentEvent.created_at.asc()).limit(EVENT_BATCH_SIZE).all()
+    pending_ids = [event.id for event in pending]
+    db.session.rollback()
+
+    processed = 0
+    for event_id in pending_ids:
+        # Claim with a guarded update so only one worker handles each event.
+        claimed = PaymentEvent.query.filter_by(id=event_id, status='pending') \
+            .update({'status': 'processing', 'attempts': PaymentEvent.attempts + 1,
+                     'claimed_at': datetime.utcnow()},
+                    synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            continue
+
+        event = PaymentEvent.query.get(event_id)
+        try:
+            if event.event_type == 'payment_intent.succeeded':
+                fulfil_purchase(json.loads(event.payload))
+            event.status = 'processed'
+            event.processed_at = datetime.utcnow()
+            processed += 1
+        except Exception as e:
+            db.session.rollback()
+            event = PaymentEvent.query.get(event_id)
+            event.status = 'failed' if event.attempts >= EVENT_MAX_ATTEMPTS else 'pending'
+            logger.error(f"Payment event {event_id} failed: {str(e)}")
+        db.session.commit()
+
+    return processed
+
+def payment_queue_depth() -> int:
+    return PaymentEvent.query.filter(PaymentEvent.status.in_(['pending', 'processing'])).count()
@@ -0,0 +1,152 @@
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils import logger
+
+SQL_PROFILER = os.environ.get('SQL_PROFILER', 'false').lower() == 'true'
+SQL_SLOW_MS = float(os.environ.get('SQL_SLOW_MS', 100))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+SQL_SLOW_LOG = os.environ.get('SQL_SLOW_LOG', 'slow_queries.log')
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIPPED_FILES = ('profiler.py', 'metrics.py')
+_NORMALIZERS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?...)'),
+    (re.compile(r'\s+'), ' ')
+]
+
+_profile = ContextVar('sql_profile', default=None)
+_profiled = set()
+_slow_logger = None
+
+def normalize_statement(statement: str) -> str:
+    for pattern, replacement in _NORMALIZERS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+def _call_site() -> str:
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PACKAGE_DIR) and 'site-packages' not in filename \
+                and not filename.endswith(_SKIPPED_FILES):
+            return f'{os.path.relpath(filename, _PACKAGE_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+def _get_slow_logger() -> logging.Logger:
+    global _slow_logger
+
+    if _slow_logger is None:
+        slow_logger = logging.getLogger('civicvoice.slow_queries')
+        slow_logger.propagate = False
+        handler = logging.FileHandler(SQL_SLOW_LOG)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_logger.addHandler(handler)
+        slow_logger.setLevel(logging.INFO)
+        _slow_logger = slow_logger
+    return _slow_logger
+
+def _query_plan(cursor, statement: str, parameters) -> List[str]:
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    try:
+        # The raw DBAPI connection bypasses SQLAlchemy events, so the plan
+        # query is neither profiled nor counted.
+        rows = cursor.connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters or ()).fetchall()
+        return [row[-1] for row in rows]
+    except Exception as e:
+        return [f'plan unavailable: {str(e)}']
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _profile.get() is not None:
+        conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile.get()
+    started = conn.info.get('profiler_started')
+    if profile is None or not started:
+        return
+
+    duration_ms = (time.perf_counter() - started.pop()) * 1000
+    entry = {
+        'statement': normalize_statement(statement),
+        'ms': duration_ms,
+        'site': _call_site()
+    }
+    profile['statements'].append(entry)
+
+    if duration_ms >= SQL_SLOW_MS:
+        plan = [] if executemany else _query_plan(cursor, statement, parameters)
+        _get_slow_logger().info(
+            f"{duration_ms:.1f}ms {request.method} {request.path} at {entry['site']}\n"
+            f"  {entry['statement']}\n" + ''.join(f'  plan: {line}\n' for line in plan)
+        )
+
+def summarize(statements: List[Dict[str, Any]]) -> Dict[str, Any]:
+    shapes = Counter(entry['statement'] for entry in statements)
+    repeated = []
+    for shape, count in shapes.most_common():
+        if count < SQL_N_PLUS_ONE_THRESHOLD:
+            break
+        sites = Counter(entry['site'] for entry in statements if entry['statement'] == shape)
+        repeated.append({'statement': shape, 'count': count, 'sites': [site for site, _ in sites.most_common(3)]})
+
+    return {
+        'queries': len(statements),
+        'db_ms': sum(entry['ms'] for entry in statements),
+        'n_plus_one': repeated
+    }
+
+def _start_profile():
+    _profile.set({'statements': [], 'started': time.perf_counter()})
+
+def _finish_profile(response):
+    profile = _profile.get()
+    _profile.set(None)
+    if profile is None:
+        return response
+
+    summary = summarize(profile['statements'])
+    total_ms = (time.perf_counter() - profile['started']) * 1000
+
+    for repeated in summary['n_plus_one']:
+        logger.warning(f"Possible N+1 on {request.method} {request.path}: {repeated['count']}x "
+                       f"{repeated['statement'][:200]} from {', '.join(repeated['sites'])}")
+
+    response.headers['X-SQL-Profile'] = (f"queries={summary['queries']}; db_ms={summary['db_ms']:.2f}; "
+                                         f"total_ms={total_ms:.2f}; n_plus_one={len(summary['n_plus_one'])}")
+    response.headers['Server-Timing'] = f"db;dur={summary['db_ms']:.2f};desc=\"{summary['queries']} queries\""
+    return response
+
+def _discard_profile(error=None):
+    _profile.set(None)
+
+def profile_blueprint(blueprint) -> bool:
+    if not SQL_PROFILER or blueprint.name in _profiled:
+        return False
+    _profiled.add(blueprint.name)
+
+    blueprint.before_request(_start_profile)
+    blueprint.after_request(_finish_profile)
+    blueprint.teardown_request(_discard_profile)
+    logger.info(f"SQL profiler enabled (slow >= {SQL_SLOW_MS}ms logged to {SQL_SLOW_LOG})")
+    return True
+
+def current_profile() -> Optional[Dict[str, Any]]:
+    profile = _profile.get()
+    return summarize(profile['statements']) if profile else None
@@ -0,0 +1,150 @@
+import hmac
+import math
+import os
+import string
+import threading
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Report, CodeSequence
+from utils import generate_passphrase, logger, PASSPHRASE_WORDS
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 8
+CODE_SPACE = len(CODE_ALPHABET) ** CODE_LENGTH
+CODE_SEQUENCE_NAME = 'reference_code'
+CODE_POOL_BATCH = int(os.environ.get('REFERENCE_CODE_BATCH', 256))
+PASSPHRASE_SPACE = len(PASSPHRASE_WORDS) * (len(PASSPHRASE_WORDS) - 1) * (len(PASSPHRASE_WORDS) - 2) * 999
+
+_HALF_BITS = 21
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+
+def permutation_key() -> bytes:
+    # Without a secret the permutation is public and codes can be enumerated
+    # from the sequence number.
+    key = os.environ.get('REFERENCE_CODE_KEY') or os.environ.get('SECRET_KEY')
+    if not key:
+        raise ValueError("REFERENCE_CODE_KEY or SECRET_KEY environment variable is required")
+    return key.encode('utf-8')
+
+def _feistel(value: int, key: bytes) -> int:
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for round_number in range(_ROUNDS):
+        digest = hmac.digest(key, bytes([round_number]) + right.to_bytes(3, 'big'), 'sha256')
+        left, right = right, left ^ (int.from_bytes(digest[:3], 'big') & _HALF_MASK)
+    return (left << _HALF_BITS) | right
+
+def permute_index(index: int, key: bytes) -> int:
+    # A keyed Feistel network is a bijection on 42-bit integers; cycle-walking
+    # until the result falls inside the code space keeps it a bijection there,
+    # so distinct counter values can never produce the same code.
+    value = _feistel(index, key)
+    while value >= CODE_SPACE:
+        value = _feistel(value, key)
+    return value
+
+def encode_code(value: int) -> str:
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, remainder = divmod(value, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+def reserve_indexes(count: int) -> int:
+    with db.engine.begin() as connection:
+        connection.execute(sqlite_insert(CodeSequence).values(name=CODE_SEQUENCE_NAME, value=0)
+                           .on_conflict_do_nothing())
+        end = connection.execute(
+            update(CodeSequence).where(CodeSequence.name == CODE_SEQUENCE_NAME)
+            .values(value=CodeSequence.value + count).returning(CodeSequence.value)
+        ).scalar()
+
+    if end > CODE_SPACE:
+        raise RuntimeError('Reference code space exhausted')
+    return end - count
+
+def allocate_codes(count: int) -> List[str]:
+    start = reserve_indexes(count)
+    key = permutation_key()
+    return [encode_code(permute_index(index, key)) for index in range(start, start + count)]
+
+class ReferenceCodePool:
+    def __init__(self, batch_size: int = CODE_POOL_BATCH):
+        self.batch_size = batch_size
+        self.rejected = 0
+        self._codes = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def _generate(self, count: int) -> List[Tuple[str, str]]:
+        codes = allocate_codes(count)
+
+        # Codes issued by the old random generator, or under a previous key,
+        # can still collide; one bulk check removes them before anyone sees them.
+        taken = set(db.session.execute(
+            select(Report.reference_code).where(Report.reference_code.in_(codes))
+        ).scalars())
+        if taken:
+            self.rejected += len(taken)
+            logger.warning(f"Dropped {len(taken)} reference codes already in use")
+
+        return [(code, generate_passphrase()) for code in codes if code not in taken]
+
+    def refill(self, minimum: int = 0) -> int:
+        added = 0
+        while len(self._codes) < max(minimum, self.batch_size // 2):
+            batch = self._generate(max(self.batch_size, minimum - len(self._codes)))
+            with self._lock:
+                self._codes.extend(batch)
+            added += len(batch)
+        return added
+
+    def take(self, count: int = 1) -> List[Tuple[str, str]]:
+        with self._lock:
+            if len(self._codes) >= count:
+                return [self._codes.popleft() for _ in range(count)]
+
+        # The pool ran dry. Allocate only what this request needs, outside
+        # the lock; batch refills are left to the background task.
+        codes = []
+        while len(codes) < count:
+            codes.extend(self._generate(count - len(codes)))
+        return codes
+
+code_pool = ReferenceCodePool()
+
+def take_reference_codes(count: int = 1) -> List[Tuple[str, str]]:
+    return code_pool.take(count)
+
+def refill_reference_codes() -> int:
+    return code_pool.refill()
+
+def _birthday_probability(items: int, space: int) -> float:
+    return -math.expm1(-items * (items - 1) / (2 * space))
+
+def reference_code_report() -> Dict[str, Any]:
+    reports = db.session.query(func.count(Report.id)).scalar()
+    issued = db.session.query(CodeSequence.value).filter_by(name=CODE_SEQUENCE_NAME).scalar() or 0
+
+    return {
+        'code_space': CODE_SPACE,
+        'reports': reports,
+        'codes_issued': issued,
+        'pool_size': len(code_pool),
+        'rejected_in_use': code_pool.rejected,
+        'occupancy': reports / CODE_SPACE,
+        # Chance a guessed code belongs to some report; the passphrase is
+        # still required on top of it.
+        'guess_hit_probability': reports / CODE_SPACE,
+        # What independent random codes would risk at this size; issued
+        # codes are collision-free by construction.
+        'random_code_collision_probability': _birthday_probability(reports, CODE_SPACE),
+        'passphrase_space': PASSPHRASE_SPACE,
+        'passphrase_repeat_probability': _birthday_probability(reports, PASSPHRASE_SPACE)
+    }
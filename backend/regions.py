@@ -0,0 +1,243 @@
+import json
+import math
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, select
+
+from models import db, Report, ReportRegion
+from utils import logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+REGIONS_GEOJSON = os.environ.get('REGIONS_GEOJSON', 'data/regions.geojson')
+REGION_GRID_DEGREES = float(os.environ.get('REGION_GRID_DEGREES', 0.25))
+REGION_BACKFILL_BATCH = 50000
+
+class Region:
+    def __init__(self, region_id: str, name: str, level: Optional[str], polygons: List[List[List[Tuple[float, float]]]]):
+        self.id = region_id
+        self.name = name
+        self.level = level
+        # Each polygon is [outer ring, *holes]; rings are (lng, lat) pairs.
+        self.polygons = polygons
+        points = [point for polygon in polygons for point in polygon[0]]
+        self.bbox = (
+            min(point[0] for point in points), min(point[1] for point in points),
+            max(point[0] for point in points), max(point[1] for point in points)
+        )
+        self.span = max(self.bbox[2] - self.bbox[0], self.bbox[3] - self.bbox[1])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'name': self.name, 'level': self.level}
+
+def _ring_contains(ring: List[Tuple[float, float]], x: float, y: float) -> bool:
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+def _ring_contains_many(ring, xs, ys):
+    # Crossing-number test for many points at once: one pass over the edges,
+    # each edge tested against every point as an array operation.
+    inside = np.zeros(len(xs), dtype=bool)
+    ring = np.asarray(ring, dtype=float)
+    x1, y1 = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(x1, 1), np.roll(y1, 1)
+    for xi, yi, xj, yj in zip(x1, y1, x2, y2):
+        if yi == yj:
+            continue
+        crosses = (yi > ys) != (yj > ys)
+        inside ^= crosses & (xs < (xj - xi) * (ys - yi) / (yj - yi) + xi)
+    return inside
+
+class RegionIndex:
+    def __init__(self, regions: List[Region], cell_degrees: float = REGION_GRID_DEGREES):
+        self.regions = {region.id: region for region in regions}
+        self.cell_degrees = cell_degrees
+        self._grid = {}
+        for region in regions:
+            min_x, min_y, max_x, max_y = region.bbox
+            for cx in range(self._cell(min_x), self._cell(max_x) + 1):
+                for cy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self._grid.setdefault((cx, cy), []).append(region)
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self.cell_degrees)
+
+    def locate(self, latitude: float, longitude: float) -> List[str]:
+        matches = []
+        for region in self._grid.get((self._cell(longitude), self._cell(latitude)), ()):
+            min_x, min_y, max_x, max_y = region.bbox
+            if not (min_x <= longitude <= max_x and min_y <= latitude <= max_y):
+                continue
+            for polygon in region.polygons:
+                if _ring_contains(polygon[0], longitude, latitude) and \
+                        not any(_ring_contains(hole, longitude, latitude) for hole in polygon[1:]):
+                    matches.append(region.id)
+                    break
+        return matches
+
+    def locate_many(self, latitudes, longitudes) -> List[Tuple[int, str]]:
+        xs = np.asarray(longitudes, dtype=float)
+        ys = np.asarray(latitudes, dtype=float)
+
+        matches = []
+        for region in self.regions.values():
+            min_x, min_y, max_x, max_y = region.bbox
+            candidates = np.flatnonzero((xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y))
+            if not len(candidates):
+                continue
+
+            cx, cy = xs[candidates], ys[candidates]
+            inside = np.zeros(len(candidates), dtype=bool)
+            for polygon in region.polygons:
+                hit = _ring_contains_many(polygon[0], cx, cy)
+                for hole in polygon[1:]:
+                    hit &= ~_ring_contains_many(hole, cx, cy)
+                inside |= hit
+
+            matches.extend((int(position), region.id) for position in candidates[inside])
+        return matches
+
+def _polygons(geometry: Dict[str, Any]) -> List:
+    if geometry['type'] == 'Polygon':
+        coordinates = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        coordinates = geometry['coordinates']
+    else:
+        return []
+    return [[[(float(point[0]), float(point[1])) for point in ring] for ring in polygon]
+            for polygon in coordinates]
+
+def load_regions(path: str) -> List[Region]:
+    with open(path, encoding='utf-8') as handle:
+        collection = json.load(handle)
+
+    regions = []
+    for feature in collection.get('features', []):
+        properties = feature.get('properties') or {}
+        region_id = str(properties.get('id') or feature.get('id') or '')
+        polygons = _polygons(feature.get('geometry') or {'type': None})
+        if not region_id or not polygons:
+            continue
+        regions.append(Region(
+            region_id[:50],
+            properties.get('name') or region_id,
+            str(properties.get('admin_level') or properties.get('level') or '') or None,
+            polygons
+        ))
+    return regions
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_region_index() -> Optional[RegionIndex]:
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if not os.path.exists(REGIONS_GEOJSON):
+                    logger.info(f"No region boundaries at {REGIONS_GEOJSON}; region tagging disabled")
+                    _index = RegionIndex([])
+                else:
+                    _index = RegionIndex(load_regions(REGIONS_GEOJSON))
+                    logger.info(f"Loaded {len(_index.regions)} regions from {REGIONS_GEOJSON}")
+    return _index if _index.regions else None
+
+def tag_report(report: Report) -> List[str]:
+    index = get_region_index()
+    if not index:
+        return []
+
+    region_ids = index.locate(report.latitude, report.longitude)
+    if region_ids:
+        db.session.execute(insert(ReportRegion), [
+            {'report_id': report.id, 'region_id': region_id} for region_id in region_ids
+        ])
+    return region_ids
+
+def backfill_regions(batch_size: int = REGION_BACKFILL_BATCH) -> Dict[str, int]:
+    index = get_region_index()
+    if not index:
+        return {'reports': 0, 'tags': 0}
+
+    if np is None:
+        raise RuntimeError('numpy is required for the region backfill')
+
+    # Every row is re-tagged, so boundary file changes are picked up too.
+    ReportRegion.query.delete(synchronize_session=False)
+
+    reports = tags = 0
+    last_id = None
+    while True:
+        query = db.session.query(Report.id, Report.latitude, Report.longitude).order_by(Report.id)
+        if last_id is not None:
+            query = query.filter(Report.id > last_id)
+        rows = query.limit(batch_size).all()
+        if not rows:
+            break
+
+        ids, latitudes, longitudes = zip(*rows)
+        matches = index.locate_many(latitudes, longitudes)
+        if matches:
+            db.session.execute(insert(ReportRegion), [
+                {'report_id': ids[position], 'region_id': region_id} for position, region_id in matches
+            ])
+
+        reports += len(rows)
+        tags += len(matches)
+        last_id = ids[-1]
+
+    db.session.commit()
+    return {'reports': reports, 'tags': tags}
+
+def region_filter(region_id: str):
+    return Report.id.in_(select(ReportRegion.report_id).where(ReportRegion.region_id == region_id))
+
+def report_regions(report_ids: List[str]) -> Dict[str, List[str]]:
+    if not report_ids:
+        return {}
+
+    regions = {}
+    for report_id, region_id in db.session.query(ReportRegion.report_id, ReportRegion.region_id) \
+            .filter(ReportRegion.report_id.in_(report_ids)):
+        regions.setdefault(report_id, []).append(region_id)
+    return regions
+
+def region_counts(query, level: Optional[str] = None) -> List[Dict[str, Any]]:
+    index = get_region_index()
+    reports = query.with_entities(Report.id, Report.category).subquery()
+
+    rows = db.session.query(ReportRegion.region_id, reports.c.category, func.count()) \
+        .join(reports, reports.c.id == ReportRegion.report_id) \
+        .group_by(ReportRegion.region_id, reports.c.category).all()
+
+    totals = {}
+    for region_id, category, count in rows:
+        region = index.regions.get(region_id) if index else None
+        if level and (not region or region.level != level):
+            continue
+        entry = totals.setdefault(region_id, {
+            **(region.to_dict() if region else {'id': region_id, 'name': None, 'level': None}),
+            'count': 0,
+            'by_category': {}
+        })
+        entry['count'] += count
+        entry['by_category'][category] = count
+
+    return sorted(totals.values(), key=lambda entry: entry['count'], reverse=True)
+
+@event.listens_for(Report, 'after_delete')
+def _remove_report_regions(mapper, connection, target):
+    connection.execute(delete(ReportRegion).where(ReportRegion.report_id == target.id))
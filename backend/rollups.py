@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Report, ReportDailyCount
+from changes import latest_seq
+
+QUOTE_CACHE_SIZE = 1024
+
+_quote_cache = OrderedDict()
+_quote_lock = threading.Lock()
+_quote_stats = {'hits': 0, 'misses': 0}
+
+def _day_counts(report_ids: List[str]):
+    return db.session.query(
+        func.date(Report.created_at),
+        Report.category,
+        func.count(Report.id)
+    ).filter(Report.id.in_(report_ids)).group_by(func.date(Report.created_at), Report.category).all()
+
+def record_verified_rollups(report_ids: List[str]) -> None:
+    if not report_ids:
+        return
+
+    rows = [{'day': datetime.strptime(day, '%Y-%m-%d').date(), 'category': category, 'count': count}
+            for day, category, count in _day_counts(report_ids)]
+
+    statement = sqlite_insert(ReportDailyCount)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['day', 'category'],
+        set_={'count': ReportDailyCount.count + statement.excluded.count}
+    ), rows)
+
+@event.listens_for(Report, 'after_delete')
+def _remove_deleted_report(mapper, connection, target):
+    if target.status == 'verified' and target.created_at:
+        connection.execute(update(ReportDailyCount).where(
+            ReportDailyCount.day == target.created_at.date(),
+            ReportDailyCount.category == target.category
+        ).values(count=ReportDailyCount.count - 1))
+
+def rebuild_rollups() -> int:
+    counts = db.session.query(
+        func.date(Report.created_at),
+        Report.category,
+        func.count(Report.id)
+    ).filter(Report.status == 'verified').group_by(func.date(Report.created_at), Report.category).all()
+
+    ReportDailyCount.query.delete(synchronize_session=False)
+    if counts:
+        db.session.execute(sqlite_insert(ReportDailyCount), [{
+            'day': datetime.strptime(day, '%Y-%m-%d').date(),
+            'category': category,
+            'count': count
+        } for day, category, count in counts])
+    db.session.commit()
+
+    with _quote_lock:
+        _quote_cache.clear()
+
+    return len(counts)
+
+def _midnight(value: datetime) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+def _edge_count(category: Optional[str], start: datetime, end: datetime, end_inclusive: bool) -> int:
+    query = Report.query.filter(Report.status == 'verified', Report.created_at >= start)
+    query = query.filter(Report.created_at <= end if end_inclusive else Report.created_at < end)
+    if category:
+        query = query.filter(Report.category == category)
+    return query.count()
+
+def _rollup_count(category: Optional[str], first_day, end_day) -> int:
+    query = select(func.coalesce(func.sum(ReportDailyCount.count), 0))
+    if category:
+        query = query.where(ReportDailyCount.category == category)
+    if first_day is not None:
+        query = query.where(ReportDailyCount.day >= first_day)
+    if end_day is not None:
+        query = query.where(ReportDailyCount.day < end_day)
+    return db.session.execute(query).scalar()
+
+def _count_verified(category: Optional[str], start: Optional[datetime], end: Optional[datetime]) -> int:
+    if start and end:
+        if start > end:
+            return 0
+        if start.date() == end.date():
+            return _edge_count(category, start, end, True)
+
+    # Whole days come from the rollup table; only the partial days at the
+    # edges of the range touch the reports table.
+    total = 0
+    first_full = None
+    if start:
+        first_full = _midnight(start) if start == _midnight(start) else _midnight(start) + timedelta(days=1)
+        if start < first_full:
+            total += _edge_count(category, start, first_full, False)
+
+    last_full = None
+    if end:
+        last_full = _midnight(end)
+        total += _edge_count(category, last_full, end, True)
+
+    total += _rollup_count(
+        category,
+        first_full.date() if first_full else None,
+        last_full.date() if last_full else None
+    )
+    return total
+
+def count_verified_reports(filters: Dict[str, Any]) -> int:
+    category = filters.get('category') or None
+    start = datetime.fromisoformat(filters['start_date']) if filters.get('start_date') else None
+    end = datetime.fromisoformat(filters['end_date']) if filters.get('end_date') else None
+
+    version = latest_seq()
+    key = (category, start, end)
+
+    with _quote_lock:
+        cached = _quote_cache.get(key)
+        if cached and cached[0] == version:
+            _quote_cache.move_to_end(key)
+            _quote_stats['hits'] += 1
+            return cached[1]
+        _quote_stats['misses'] += 1
+
+    count = _count_verified(category, start, end)
+
+    with _quote_lock:
+        _quote_cache[key] = (version, count)
+        _quote_cache.move_to_end(key)
+        while len(_quote_cache) > QUOTE_CACHE_SIZE:
+            _quote_cache.popitem(last=False)
+
+    return count
+
+def quote_cache_stats() -> Dict[str, int]:
+    with _quote_lock:
+        return {'size': len(_quote_cache), **_quote_stats}
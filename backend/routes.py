@@ -1,27 +1,39 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context
 from uuid import UUID
+from sqlalchemy.orm import selectinload
 
-from models import db, User, Report, VerificationLog, DataPurchase, ReportAttachment
+from models import db, User, Report, VerificationLog, DataPurchase, ReportAttachment, ReportSignature
 from datetime import datetime, timedelta
-import uuid
 from werkzeug.security import check_password_hash
 from functools import wraps
-import jwt
 import os
-from utils import generate_reference_code, generate_passphrase, validate_file_upload, \
-    save_file_upload, logger
-import stripe
-from io import BytesIO
-import csv
+from utils import generate_id, validate_file_upload, \
+    save_file_upload, delete_file_upload, logger
+from events import record_events, dispatch_events, stream_events
+from exports import export_format_available, export_cache_key, download_artifact, artifact_path, \
+    cached_export, filters_hash, filtered_reports_query, start_download, track_download, EXPORT_FORMATS
+from payments import get_gateway, fulfil_purchase, enqueue_payment_event, purchase_idempotency_key, \
+    quote_purchase, intent_metadata, PaymentError, PaymentUnavailable, PURCHASE_MODES
+from changes import changes_since, DEFAULT_CHANGE_LIMIT, MAX_CHANGE_LIMIT
+from moderation import moderate_reports, MODERATION_ACTIONS, MAX_BULK_ITEMS
+from tracking import lookup_tracking
+from refcodes import take_reference_codes
+from dedup import duplicate_info, cluster_members
+from anonymity import published_locations, public_report_regions, public_region_filter
+from regions import get_region_index, tag_report, region_counts
+from health import readiness
+from leases import claim_reports, renew_leases, release_leases, \
+    DEFAULT_LEASE_SECONDS, MAX_LEASE_SECONDS, MAX_CLAIM_COUNT
+import gzip
 import json
 
 api = Blueprint('api', __name__)
 
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
-
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
+        import jwt
+
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({'error': 'Token is missing'}), 401
@@ -45,6 +57,8 @@ def role_required(role):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            import jwt
+
             token = request.headers.get('Authorization')
             if not token:
                 return jsonify({'error': 'Token is missing'}), 401
@@ -67,6 +81,7 @@ def role_required(role):
 
 @api.route('/reports', methods=['POST'])
 def submit_report():
+    file_path = None
     try:
         data = request.form.to_dict()
 
@@ -91,9 +106,8 @@ def submit_report():
         except ValueError:
             return jsonify({'error': 'Invalid coordinate format'}), 400
 
-        report_id = str(uuid.uuid4())
-        reference_code = generate_reference_code()
-        passphrase = generate_passphrase()
+        report_id = generate_id()
+        reference_code, passphrase = take_reference_codes()[0]
 
         new_report = Report(
             id=report_id,
@@ -108,6 +122,7 @@ def submit_report():
         )
 
         db.session.add(new_report)
+        tag_report(new_report)
 
         if 'attachment' in request.files:
             file = request.files['attachment']
@@ -119,7 +134,7 @@ def submit_report():
                 file_path = save_file_upload(file, report_id)
                 if file_path:
                     attachment = ReportAttachment(
-                        id=str(uuid.uuid4()),
+                        id=generate_id(),
                         report_id=report_id,
                         filename=file.filename,
                         file_path=file_path,
@@ -128,7 +143,15 @@ def submit_report():
                     )
                     db.session.add(attachment)
 
+        record_events('report_submitted', [{
+            'report_id': report_id,
+            'title': new_report.title,
+            'category': new_report.category,
+            'status': 'pending',
+            'timestamp': datetime.utcnow().isoformat()
+        }])
         db.session.commit()
+        dispatch_events()
 
         return jsonify({
             'message': 'Report submitted successfully',
@@ -139,6 +162,8 @@ def submit_report():
 
     except Exception as e:
         db.session.rollback()
+        if file_path:
+            delete_file_upload(file_path)
         return jsonify({'error': 'Internal server error'}), 500
 
 @api.route('/reports/track', methods=['POST'])
@@ -149,38 +174,27 @@ def track_report():
         if not data or 'reference_code' not in data or 'passphrase' not in data:
             return jsonify({'error': 'Reference code and passphrase are required'}), 400
 
-        report = Report.query.filter_by(
-            reference_code=data['reference_code'],
-            passphrase=data['passphrase']
-        ).first()
+        entry = lookup_tracking(data['reference_code'], data['passphrase'])
 
-        if not report:
+        if not entry:
             return jsonify({'error': 'Invalid reference code or passphrase'}), 404
 
-        logs = VerificationLog.query.filter_by(report_id=report.id) \
-            .order_by(VerificationLog.created_at.desc()).all()
+        if entry['etag'] in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = jsonify(entry['body'])
 
-        return jsonify({
-            'report': {
-                'id': report.id,
-                'title': report.title,
-                'category': report.category,
-                'status': report.status,
-                'submitted_at': report.created_at.isoformat(),
-                'last_updated': report.updated_at.isoformat()
-            },
-            'status_history': [{
-                'action': log.action,
-                'notes': log.notes,
-                'timestamp': log.created_at.isoformat()
-            } for log in logs]
-        })
+        response.set_etag(entry['etag'])
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
 
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @api.route('/auth/login', methods=['POST'])
 def login():
+    import jwt
+
     try:
         data = request.get_json()
 
@@ -222,14 +236,22 @@ def list_reports_for_moderation():
         per_page = request.args.get('per_page', 10, type=int)
         category = request.args.get('category')
 
-        query = Report.query.filter_by(status=status)
+        cluster_id = request.args.get('duplicate_cluster_id')
+
+        query = Report.query.options(selectinload(Report.attachments)).filter_by(status=status)
 
         if category:
             query = query.filter_by(category=category)
 
+        if cluster_id:
+            query = query.join(ReportSignature, ReportSignature.report_id == Report.id) \
+                .filter(ReportSignature.cluster_id == cluster_id)
+
         reports = query.order_by(Report.created_at.desc()) \
             .paginate(page=page, per_page=per_page, error_out=False)
 
+        duplicates = duplicate_info([report.id for report in reports.items])
+
         return jsonify({
             'reports': [{
                 'id': report.id,
@@ -241,7 +263,9 @@ def list_reports_for_moderation():
                 'language': report.language,
                 'status': report.status,
                 'created_at': report.created_at.isoformat(),
-                'has_attachment': len(report.attachments) > 0
+                'has_attachment': len(report.attachments) > 0,
+                'duplicate_cluster_id': duplicates.get(report.id, {}).get('duplicate_cluster_id'),
+                'duplicate_candidates': duplicates.get(report.id, {}).get('duplicate_candidates', [])
             } for report in reports.items],
             'pagination': {
                 'total': reports.total,
@@ -309,36 +333,30 @@ def verify_report(current_user, report_id):
     try:
         data = request.get_json()
 
-        if not data or 'action' not in data or data['action'] not in ['verified', 'rejected']:
+        if not data or 'action' not in data or data['action'] not in MODERATION_ACTIONS:
             return jsonify({'error': 'Action must be verified or rejected'}), 400
 
-        report = Report.query.get(report_id)
-        if not report:
+        result = moderate_reports(current_user.id, [{
+            'report_id': report_id,
+            'action': data['action'],
+            'notes': data.get('notes', '')
+        }])[0]
+
+        if result['result'] == 'not_found':
             return jsonify({'error': 'Report not found'}), 404
 
-        if report.status != 'pending':
+        if result['result'] == 'already_processed':
             return jsonify({'error': 'Report has already been processed'}), 400
 
-        report.status = data['action']
-        report.updated_at = datetime.utcnow()
-
-        log = VerificationLog(
-            id=str(uuid.uuid4()),
-            report_id=report_id,
-            user_id=current_user.id,
-            action=data['action'],
-            notes=data.get('notes', '')
-        )
-
-        db.session.add(log)
-        db.session.commit()
+        if result['result'] == 'claimed':
+            return jsonify({'error': 'Report is claimed by another moderator'}), 409
 
         return jsonify({
             'message': f'Report {data["action"]} successfully',
             'report': {
-                'id': report.id,
-                'status': report.status,
-                'updated_at': report.updated_at.isoformat()
+                'id': result['report_id'],
+                'status': result['result'],
+                'updated_at': result['updated_at']
             }
         })
 
@@ -346,10 +364,184 @@ def verify_report(current_user, report_id):
         db.session.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
+@api.route('/moderator/reports/bulk-verify', methods=['POST'])
+@role_required('moderator')
+def bulk_verify_reports(current_user):
+    try:
+        data = request.get_json(silent=True) or {}
+
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items must be a non-empty list'}), 400
+
+        if len(items) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'At most {MAX_BULK_ITEMS} items per request'}), 400
+
+        if not all(isinstance(item, dict) for item in items):
+            return jsonify({'error': 'Each item must be an object'}), 400
+
+        results = moderate_reports(current_user.id, items)
+
+        return jsonify({
+            'results': [{
+                'report_id': result['report_id'],
+                'result': result['result'],
+                'updated_at': result.get('updated_at')
+            } for result in results],
+            'processed': sum(1 for result in results if result['result'] in MODERATION_ACTIONS)
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Bulk verification error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/moderator/duplicates/<cluster_id>/resolve', methods=['POST'])
+@role_required('moderator')
+def resolve_duplicate_cluster(current_user, cluster_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        keep = data.get('keep')
+        keep_action = data.get('keep_action')
+        action = data.get('action', 'rejected')
+
+        if action not in MODERATION_ACTIONS or (keep_action and keep_action not in MODERATION_ACTIONS):
+            return jsonify({'error': f'action must be one of: {", ".join(MODERATION_ACTIONS)}'}), 400
+
+        members = cluster_members([cluster_id]).get(cluster_id, [])
+        if not members:
+            return jsonify({'error': 'No pending reports in this cluster'}), 404
+
+        if keep and keep not in members:
+            return jsonify({'error': 'keep must be a pending report in this cluster'}), 400
+
+        if len(members) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'Cluster has more than {MAX_BULK_ITEMS} pending reports'}), 400
+
+        notes = data.get('notes') or (f'Duplicate of {keep}' if keep else 'Resolved as duplicate cluster')
+        items = [{'report_id': report_id, 'action': action, 'notes': notes}
+                 for report_id in members if report_id != keep]
+        if keep and keep_action:
+            items.append({'report_id': keep, 'action': keep_action, 'notes': data.get('keep_notes', '')})
+
+        results = moderate_reports(current_user.id, items) if items else []
+
+        return jsonify({
+            'cluster_id': cluster_id,
+            'kept': keep,
+            'results': [{
+                'report_id': result['report_id'],
+                'result': result['result']
+            } for result in results],
+            'processed': sum(1 for result in results if result['result'] in MODERATION_ACTIONS)
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Duplicate resolution error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/moderator/events', methods=['GET'])
+@role_required('moderator')
+def moderation_event_stream(current_user):
+    try:
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+        return Response(
+            stream_events(last_id),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    except Exception as e:
+        logger.error(f"Event stream error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/moderator/queue/claim', methods=['POST'])
+@role_required('moderator')
+def claim_moderation_queue(current_user):
+    try:
+        data = request.get_json(silent=True) or {}
+
+        count = data.get('count', 10)
+        lease_seconds = data.get('lease_seconds', DEFAULT_LEASE_SECONDS)
+        if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= MAX_CLAIM_COUNT:
+            return jsonify({'error': f'count must be between 1 and {MAX_CLAIM_COUNT}'}), 400
+        if not isinstance(lease_seconds, int) or isinstance(lease_seconds, bool) or not 1 <= lease_seconds <= MAX_LEASE_SECONDS:
+            return jsonify({'error': f'lease_seconds must be between 1 and {MAX_LEASE_SECONDS}'}), 400
+
+        leases = claim_reports(current_user.id, count, lease_seconds)
+
+        return jsonify({
+            'reports': [{
+                'id': lease.report.id,
+                'title': lease.report.title,
+                'category': lease.report.category,
+                'description': lease.report.description,
+                'latitude': lease.report.latitude,
+                'longitude': lease.report.longitude,
+                'language': lease.report.language,
+                'status': lease.report.status,
+                'created_at': lease.report.created_at.isoformat(),
+                'lease_expires_at': lease.expires_at.isoformat()
+            } for lease in leases]
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Queue claim error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/moderator/queue/renew', methods=['POST'])
+@role_required('moderator')
+def renew_moderation_leases(current_user):
+    try:
+        data = request.get_json(silent=True) or {}
+
+        report_ids = data.get('report_ids')
+        lease_seconds = data.get('lease_seconds', DEFAULT_LEASE_SECONDS)
+        if not isinstance(report_ids, list) or not report_ids:
+            return jsonify({'error': 'report_ids must be a non-empty list'}), 400
+        if not isinstance(lease_seconds, int) or isinstance(lease_seconds, bool) or not 1 <= lease_seconds <= MAX_LEASE_SECONDS:
+            return jsonify({'error': f'lease_seconds must be between 1 and {MAX_LEASE_SECONDS}'}), 400
+
+        renewed = renew_leases(current_user.id, report_ids, lease_seconds)
+
+        return jsonify({'renewed': renewed})
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Lease renewal error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/moderator/queue/release', methods=['POST'])
+@role_required('moderator')
+def release_moderation_leases(current_user):
+    try:
+        data = request.get_json(silent=True) or {}
+
+        report_ids = data.get('report_ids')
+        if report_ids is not None and not isinstance(report_ids, list):
+            return jsonify({'error': 'report_ids must be a list'}), 400
+
+        released = release_leases(current_user.id, report_ids)
+
+        return jsonify({'released': released})
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Lease release error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @api.route('/public/reports', methods=['GET'])
 def public_reports():
     try:
         category = request.args.get('category')
+        region = request.args.get('region')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         page = request.args.get('page', 1, type=int)
@@ -360,6 +552,9 @@ def public_reports():
         if category:
             query = query.filter_by(category=category)
 
+        if region:
+            query = query.filter(public_region_filter(region))
+
         if start_date:
             try:
                 start_dt = datetime.fromisoformat(start_date)
@@ -377,16 +572,22 @@ def public_reports():
         reports = query.order_by(Report.created_at.desc()) \
             .paginate(page=page, per_page=per_page, error_out=False)
 
+        report_ids = [report.id for report in reports.items]
+        locations = published_locations(report_ids)
+        regions = public_report_regions(locations)
+
         return jsonify({
             'reports': [{
                 'id': report.id,
                 'title': report.title,
                 'category': report.category,
                 'description': report.description,
-                'latitude': report.latitude,
-                'longitude': report.longitude,
+                'latitude': locations.get(report.id, (None, None, None))[0],
+                'longitude': locations.get(report.id, (None, None, None))[1],
+                'location_precision': locations.get(report.id, (None, None, None))[2],
                 'created_at': report.created_at.isoformat(),
-                'language': report.language
+                'language': report.language,
+                'regions': regions.get(report.id, [])
             } for report in reports.items],
             'pagination': {
                 'total': reports.total,
@@ -399,6 +600,66 @@ def public_reports():
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
+@api.route('/public/regions', methods=['GET'])
+def public_regions():
+    try:
+        index = get_region_index()
+        level = request.args.get('level')
+
+        regions = [region.to_dict() for region in (index.regions.values() if index else [])
+                   if not level or region.level == level]
+
+        return jsonify({'regions': regions})
+
+    except Exception as e:
+        logger.error(f"Region list error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/public/stats/regions', methods=['GET'])
+def public_region_stats():
+    try:
+        filters = {key: request.args.get(key) for key in ('category', 'start_date', 'end_date')}
+
+        try:
+            query = filtered_reports_query(filters)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+
+        return jsonify({
+            'filters': {key: value for key, value in filters.items() if value},
+            'regions': region_counts(query, request.args.get('level'))
+        })
+
+    except Exception as e:
+        logger.error(f"Region stats error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/public/changes', methods=['GET'])
+def public_changes():
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', DEFAULT_CHANGE_LIMIT, type=int)
+
+        if since < 0:
+            return jsonify({'error': 'since must be a non-negative sequence number'}), 400
+
+        limit = max(1, min(limit, MAX_CHANGE_LIMIT))
+        feed = changes_since(since, limit)
+
+        body = json.dumps(feed, separators=(',', ':')).encode('utf-8')
+        response = Response(body, mimetype='application/json')
+        response.headers['Vary'] = 'Accept-Encoding'
+
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response.set_data(gzip.compress(body))
+            response.headers['Content-Encoding'] = 'gzip'
+
+        return response
+
+    except Exception as e:
+        logger.error(f"Change feed error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @api.route('/auth/register/researcher', methods=['POST'])
 def register_researcher():
     try:
@@ -413,7 +674,7 @@ def register_researcher():
             return jsonify({'error': 'Email already registered'}), 400
 
         researcher = User(
-            id=str(uuid.uuid4()),
+            id=generate_id(),
             email=data['email'],
             role='researcher',
             organization=data['organization'],
@@ -442,44 +703,45 @@ def purchase_data(current_user):
         data = request.get_json()
 
         filters = data.get('filters', {})
-        price_per_report = 0.50  # TODO: Make configurable
-
-        query = Report.query.filter_by(status='verified')
-
-        if filters.get('category'):
-            query = query.filter_by(category=filters['category'])
-
-        if filters.get('start_date'):
-            start_dt = datetime.fromisoformat(filters['start_date'])
-            query = query.filter(Report.created_at >= start_dt)
+        mode = data.get('mode', 'full')
 
-        if filters.get('end_date'):
-            end_dt = datetime.fromisoformat(filters['end_date'])
-            query = query.filter(Report.created_at <= end_dt)
+        if mode not in PURCHASE_MODES:
+            return jsonify({'error': f'mode must be one of: {", ".join(PURCHASE_MODES)}'}), 400
 
-        report_count = query.count()
-        total_amount = int(report_count * price_per_report * 100)
+        quote = quote_purchase(current_user.id, filters, mode)
 
-        if total_amount == 0:
+        if quote['total_amount'] == 0:
+            if mode == 'delta':
+                return jsonify({'error': 'No new reports since your last purchase of these filters'}), 400
             return jsonify({'error': 'No reports match the specified criteria'}), 400
 
-        intent = stripe.PaymentIntent.create(
-            amount=total_amount,
-            currency='usd',
-            metadata={
-                'user_id': current_user.id,
-                'report_count': report_count,
-                'filters': json.dumps(filters)
-            }
+        idempotency_key = purchase_idempotency_key(
+            current_user.id, filters_hash(quote['filters']), quote['total_amount'], quote['dataset_version'],
+            request.headers.get('Idempotency-Key')
+        )
+
+        intent = get_gateway().create_intent(
+            quote['total_amount'],
+            intent_metadata(current_user.id, quote),
+            idempotency_key
         )
 
         return jsonify({
-            'client_secret': intent.client_secret,
-            'report_count': report_count,
-            'total_amount': total_amount / 100,
-            'payment_intent_id': intent.id
+            'client_secret': intent['client_secret'],
+            'mode': mode,
+            'filters': quote['filters'],
+            'report_count': quote['report_count'],
+            'total_amount': quote['total_amount'] / 100,
+            'payment_intent_id': intent['id']
         })
 
+    except PaymentUnavailable as e:
+        logger.warning(f"Payment provider unavailable: {str(e)}")
+        return jsonify({'error': 'Payment provider unavailable, please retry shortly'}), 503
+
+    except PaymentError as e:
+        return jsonify({'error': str(e)}), 400
+
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -493,26 +755,23 @@ def confirm_purchase(current_user):
         if not payment_intent_id:
             return jsonify({'error': 'Payment intent ID is required'}), 400
 
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        # Normally the webhook queue has already recorded the purchase; only
+        # fall back to asking the provider when it has not arrived yet.
+        purchase = DataPurchase.query.filter_by(stripe_payment_intent_id=payment_intent_id).first()
+
+        if not purchase:
+            intent = get_gateway().retrieve_intent(payment_intent_id)
 
-        if intent.status != 'succeeded':
-            return jsonify({'error': 'Payment not completed'}), 400
+            if intent['status'] != 'succeeded':
+                return jsonify({'error': 'Payment not completed'}), 400
 
-        if intent.metadata.get('user_id') != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
+            if intent['metadata'].get('user_id') != current_user.id:
+                return jsonify({'error': 'Unauthorized'}), 403
 
-        purchase = DataPurchase(
-            id=str(uuid.uuid4()),
-            user_id=current_user.id,
-            stripe_payment_intent_id=payment_intent_id,
-            amount=intent.amount / 100,
-            report_count=int(intent.metadata.get('report_count', 0)),
-            filters=intent.metadata.get('filters', '{}'),
-            expires_at=datetime.utcnow() + timedelta(hours=24)
-        )
+            purchase = fulfil_purchase(intent)
 
-        db.session.add(purchase)
-        db.session.commit()
+        if purchase.user_id != current_user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
 
         return jsonify({
             'message': 'Purchase confirmed successfully',
@@ -520,14 +779,69 @@ def confirm_purchase(current_user):
             'expires_at': purchase.expires_at.isoformat()
         })
 
+    except PaymentUnavailable as e:
+        logger.warning(f"Payment provider unavailable: {str(e)}")
+        return jsonify({'error': 'Payment provider unavailable, please retry shortly'}), 503
+
+    except PaymentError as e:
+        return jsonify({'error': str(e)}), 400
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
+@api.route('/data/webhook', methods=['POST'])
+def payment_webhook():
+    try:
+        event = get_gateway().parse_webhook(request.get_data(), request.headers.get('Stripe-Signature'))
+        queued = enqueue_payment_event(event)
+
+        return jsonify({'received': True, 'queued': queued})
+
+    except PaymentError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Payment webhook error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api.route('/data/fake-payments/<payment_intent_id>/complete', methods=['POST'])
+@role_required('researcher')
+def complete_fake_payment(current_user, payment_intent_id):
+    try:
+        gateway = get_gateway()
+        if gateway.name != 'fake':
+            return jsonify({'error': 'Not found'}), 404
+
+        intent = gateway.retrieve_intent(payment_intent_id)
+        if intent['metadata'].get('user_id') != current_user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
+
+        event = gateway.complete_payment(payment_intent_id)
+        queued = enqueue_payment_event(gateway.parse_webhook(json.dumps(event).encode('utf-8'), None))
+
+        return jsonify({'event_id': event['id'], 'queued': queued})
+
+    except PaymentError as e:
+        return jsonify({'error': str(e)}), 404
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Fake payment error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @api.route('/data/download/<download_token>', methods=['GET'])
 @role_required('researcher')
 def download_data(current_user, download_token):
     try:
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'format must be one of: {", ".join(EXPORT_FORMATS)}'}), 400
+
+        if not export_format_available(export_format):
+            return jsonify({'error': f'{export_format} export is not available on this server'}), 501
+
         purchase = DataPurchase.query.filter_by(
             id=download_token,
             user_id=current_user.id
@@ -541,62 +855,81 @@ def download_data(current_user, download_token):
 
         filters = json.loads(purchase.filters)
 
-        query = Report.query.filter_by(status='verified')
-
-        if filters.get('category'):
-            query = query.filter_by(category=filters['category'])
-
-        if filters.get('start_date'):
-            start_dt = datetime.fromisoformat(filters['start_date'])
-            query = query.filter(Report.created_at >= start_dt)
-
-        if filters.get('end_date'):
-            end_dt = datetime.fromisoformat(filters['end_date'])
-            query = query.filter(Report.created_at <= end_dt)
-
-        reports = query.all()
-
-        output = BytesIO()
-        writer = csv.writer(output.getvalue().decode('utf-8'))
+        filename = f'civic_reports_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.{EXPORT_FORMATS[export_format]["extension"]}'
+
+        digest, version, cache_key = export_cache_key(filters, export_format)
+        etag = f'"{cache_key}"'
+
+        artifact = download_artifact(purchase.id, export_format, cache_key)
+        if artifact:
+            cache_key = artifact.cache_key
+            start_download(purchase.id, export_format, cache_key, artifact.file_size)
+
+            response = send_file(
+                artifact_path(artifact),
+                mimetype=EXPORT_FORMATS[export_format]['mimetype'],
+                as_attachment=True,
+                download_name=filename,
+                conditional=True,
+                etag=cache_key,
+                last_modified=artifact.created_at
+            )
+            if response.status_code in (200, 206):
+                offset = response.content_range.start if response.content_range else 0
+                response.response = stream_with_context(track_download(purchase.id, response.response, offset))
+            return response
+
+        start_download(purchase.id, export_format, cache_key, None)
+
+        return Response(
+            stream_with_context(track_download(
+                purchase.id,
+                cached_export(filters, export_format, digest, version, cache_key)
+            )),
+            mimetype=EXPORT_FORMATS[export_format]['mimetype'],
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'ETag': etag
+            }
+        )
 
-        writer.writerow([
-            'report_id', 'title', 'category', 'description',
-            'latitude', 'longitude', 'language', 'created_at'
-        ])
+    except Exception as e:
+        logger.error(f"Download error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
 
-        for report in reports:
-            writer.writerow([
-                report.id, report.title, report.category,
-                report.description, report.latitude, report.longitude,
-                report.language, report.created_at.isoformat()
-            ])
+@api.route('/data/download/<download_token>/status', methods=['GET'])
+@role_required('researcher')
+def download_status(current_user, download_token):
+    try:
+        purchase = DataPurchase.query.filter_by(
+            id=download_token,
+            user_id=current_user.id
+        ).first()
 
-        output.seek(0)
+        if not purchase:
+            return jsonify({'error': 'Invalid download token'}), 404
 
-        return send_file(
-            output,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'civic_reports_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
+        return jsonify({'purchase': purchase.to_dict()})
 
     except Exception as e:
+        logger.error(f"Download status error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
+
 @api.route('/health', methods=['GET'])
+@api.route('/health/live', methods=['GET'])
 def health_check():
-    try:
-        User.query.first()
-
-        return jsonify({
-            'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'version': '1.0.0'
-        })
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 500
+    # Liveness only says the process can serve requests; it must never touch
+    # the database, or a busy writer would get healthy workers restarted.
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'version': '1.0.0'
+    })
+
+@api.route('/health/ready', methods=['GET'])
+def readiness_check():
+    result = readiness(refresh_inline=not current_app.config.get('BACKGROUND_TASKS', True))
+    return jsonify(result), 200 if result['status'] == 'ready' else 503
 
 @api.route('/categories', methods=['GET'])
 def get_categories():
@@ -646,7 +979,7 @@ def register():
             return jsonify({'error': 'Password must contain at least one number'}), 400
 
         user = User(
-            id=str(uuid.uuid4()),
+            id=generate_id(),
             email=data['email'],
             role=user_type,
             organization=data.get('organization', 'General User'),
@@ -0,0 +1,73 @@
+from typing import Dict, List
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from models import db
+
+def _missing_autoincrement(table) -> bool:
+    if db.engine.dialect.name != 'sqlite' or not table.dialect_options['sqlite'].get('autoincrement'):
+        return False
+    with db.engine.connect() as connection:
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+        ).scalar()
+    return 'AUTOINCREMENT' not in (sql or '').upper()
+
+def _rebuild_table(table) -> None:
+    # SQLite cannot add AUTOINCREMENT to an existing table; copy the rows
+    # into a fresh one so ids are never reused once old rows are deleted.
+    inspector = inspect(db.engine)
+    old_indexes = [index['name'] for index in inspector.get_indexes(table.name)]
+    columns = ', '.join(
+        column['name'] for column in inspector.get_columns(table.name) if column['name'] in table.columns
+    )
+
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {table.name}_rebuild')
+        for name in old_indexes:
+            connection.exec_driver_sql(f'DROP INDEX {name}')
+        table.create(connection)
+        connection.exec_driver_sql(
+            f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_rebuild'
+        )
+        connection.exec_driver_sql(f'DROP TABLE {table.name}_rebuild')
+
+def init_schema() -> Dict[str, List[str]]:
+    existing = set(inspect(db.engine).get_table_names())
+    db.create_all()
+
+    rebuilt = []
+    for table in db.metadata.sorted_tables:
+        if table.name in existing and _missing_autoincrement(table):
+            _rebuild_table(table)
+            rebuilt.append(table.name)
+
+    # create_all only builds columns and indexes together with a brand new
+    # table, so ones added to models later have to be added to existing
+    # tables. New columns must be nullable for ALTER TABLE to accept them.
+    inspector = inspect(db.engine)
+    added_columns = []
+    created_indexes = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                with db.engine.begin() as connection:
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+                added_columns.append(f'{table.name}.{column.name}')
+        present = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in present:
+                index.create(bind=db.engine)
+                created_indexes.append(index.name)
+
+    return {
+        'rebuilt': rebuilt,
+        'tables': [table.name for table in db.metadata.sorted_tables if table.name not in existing],
+        'columns': added_columns,
+        'indexes': created_indexes
+    }
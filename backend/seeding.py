@@ -0,0 +1,295 @@
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from werkzeug.security import generate_password_hash
+
+from models import db, ID_STORAGE, User
+from refcodes import allocate_codes
+from utils import PASSPHRASE_WORDS, logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEED_BATCH = 50000
+SEED_PASSWORD = 'Seeded-passw0rd!'
+SEED_EMAIL_DOMAIN = 'seed.civicvoice.test'
+# Timestamps are relative to a fixed date so a seed always produces the same
+# rows. Reference codes are the exception: they come from the database's live
+# code sequence and depend on how many were issued before.
+SEED_EPOCH = datetime(2025, 1, 1)
+SEED_CATEGORY_WEIGHTS = {
+    'infrastructure': 0.22, 'corruption': 0.16, 'healthcare': 0.11, 'public_safety': 0.11,
+    'transportation': 0.10, 'education': 0.08, 'environment': 0.08, 'housing': 0.06,
+    'employment': 0.04, 'other': 0.04
+}
+SEED_STATUS_WEIGHTS = {'verified': 0.62, 'rejected': 0.13, 'pending': 0.25}
+# name, latitude, longitude, spread in degrees, share of reports, share in French
+SEED_CLUSTERS = [
+    ('Lagos', 6.5244, 3.3792, 0.08, 0.24, 0.02),
+    ('Nairobi', -1.2921, 36.8219, 0.06, 0.16, 0.01),
+    ('Abidjan', 5.3600, -4.0083, 0.06, 0.12, 0.95),
+    ('Dakar', 14.7167, -17.4677, 0.05, 0.10, 0.90),
+    ('Accra', 5.6037, -0.1870, 0.05, 0.10, 0.02),
+    ('Kinshasa', -4.4419, 15.2663, 0.07, 0.10, 0.93),
+    ('Abuja', 9.0765, 7.3986, 0.05, 0.08, 0.02),
+    ('Rural', 8.0000, 10.0000, 4.00, 0.10, 0.30)
+]
+# Reports per hour of day, relative; submissions peak in the evening.
+SEED_HOURLY_PROFILE = [2, 1, 1, 1, 1, 2, 4, 6, 8, 9, 9, 9, 10, 9, 9, 9, 10, 11, 12, 12, 10, 8, 5, 3]
+SEED_PENDING_DAYS = 30
+SEED_ATTACHMENT_TYPES = {'image/jpeg': ('jpg', 0.6), 'image/png': ('png', 0.25), 'application/pdf': ('pdf', 0.15)}
+SEED_TITLE_SUBJECTS = {
+    'infrastructure': ['Broken streetlights', 'Collapsed culvert', 'Unfinished road project', 'Power outages'],
+    'corruption': ['Bribe demanded at checkpoint', 'Inflated contract', 'Ghost workers on payroll', 'Diverted funds'],
+    'healthcare': ['Clinic without staff', 'Drug shortage', 'Fees charged for free care', 'Closed maternity ward'],
+    'public_safety': ['Unlit junction', 'Armed robbery hotspot', 'Missing police patrols', 'Unsafe market stalls'],
+    'transportation': ['Illegal toll collection', 'Unsafe buses', 'Blocked drainage on highway', 'Fare extortion'],
+    'education': ['Teacher absenteeism', 'Leaking classrooms', 'Exam fees demanded', 'No textbooks delivered'],
+    'environment': ['Illegal dumping', 'Oil spill', 'Sand mining on riverbank', 'Burning waste site'],
+    'housing': ['Forced eviction', 'Unsafe building', 'Land grab', 'Rent extortion'],
+    'employment': ['Unpaid wages', 'Recruitment fees demanded', 'Unsafe factory', 'Job slots sold'],
+    'other': ['Missing public notice', 'Community dispute', 'Water point broken', 'Unlicensed checkpoint']
+}
+SEED_DESCRIPTION_WORDS = (
+    'residents reported the issue to the local office several times without any response and the problem '
+    'has continued for weeks while officials claim funds were released for repairs that never happened'
+).split()
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError('numpy is required for the dataset seeder')
+
+def _uuids(rng, count: int) -> List[Any]:
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    if ID_STORAGE == 'binary':
+        return [row.tobytes() for row in raw]
+    text = raw.tobytes().hex()
+    return [f'{text[i:i + 8]}-{text[i + 8:i + 12]}-{text[i + 12:i + 16]}-{text[i + 16:i + 20]}-{text[i + 20:i + 32]}'
+            for i in range(0, len(text), 32)]
+
+def _timestamps(values) -> List[str]:
+    # SQLAlchemy's SQLite DateTime storage format, rendered in one pass.
+    return [text.replace('T', ' ') for text in np.datetime_as_string(values, unit='us')]
+
+def _choice(rng, weights: Dict[str, Any], count: int):
+    names = list(weights)
+    probabilities = np.array([weights[name] for name in names], dtype=float)
+    return rng.choice(len(names), size=count, p=probabilities / probabilities.sum()), names
+
+def _created_times(rng, count: int, start, days: int):
+    # Volume grows linearly over the window, with the hourly profile on top.
+    growth = np.linspace(1.0, 3.0, days)
+    day = rng.choice(days, size=count, p=growth / growth.sum())
+    hourly = np.array(SEED_HOURLY_PROFILE, dtype=float)
+    hour = rng.choice(24, size=count, p=hourly / hourly.sum())
+    seconds = day.astype(np.int64) * 86400 + hour * 3600 + rng.integers(0, 3600, size=count)
+    return start + (seconds * 1_000_000 + rng.integers(0, 1_000_000, size=count)).astype('timedelta64[us]')
+
+def _passphrases(rng, count: int) -> List[str]:
+    words = np.argsort(rng.random((count, len(PASSPHRASE_WORDS))), axis=1)[:, :3]
+    numbers = rng.integers(1, 1000, size=count)
+    return [f'{PASSPHRASE_WORDS[a]}-{PASSPHRASE_WORDS[b]}-{PASSPHRASE_WORDS[c]}-{number:03d}'
+            for (a, b, c), number in zip(words.tolist(), numbers.tolist())]
+
+def _seed_users(connection, rng, role: str, count: int, seed: int, password_hash: str,
+                created_at: List[str]) -> List[Any]:
+    ids = _uuids(rng, count)
+    connection.executemany(
+        'INSERT INTO users (id, email, password_hash, role, organization, email_verified, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(ids[i], f'{role}-{seed}-{i}@{SEED_EMAIL_DOMAIN}', password_hash, role,
+          f'Seeded {role} organisation {i % 50}', 1, created_at[i]) for i in range(count)]
+    )
+    return ids
+
+def _seed_report_batch(connection, rng, count: int, start, days: int, now, moderator_ids: List[Any],
+                       attachment_rate: float) -> Dict[str, int]:
+    ids = _uuids(rng, count)
+    created = _created_times(rng, count, start, days)
+
+    category_index, categories = _choice(rng, SEED_CATEGORY_WEIGHTS, count)
+    cluster_index = rng.choice(len(SEED_CLUSTERS), size=count,
+                               p=np.array([cluster[4] for cluster in SEED_CLUSTERS]) /
+                               sum(cluster[4] for cluster in SEED_CLUSTERS))
+    clusters = np.array([cluster[1:] for cluster in SEED_CLUSTERS], dtype=float)
+    latitudes = np.clip(clusters[cluster_index, 0] + rng.normal(0, 1, count) * clusters[cluster_index, 2], -90, 90)
+    longitudes = np.clip(clusters[cluster_index, 1] + rng.normal(0, 1, count) * clusters[cluster_index, 2], -180, 180)
+    french = rng.random(count) < clusters[cluster_index, 4]
+
+    # Older reports have almost all been moderated; the pending backlog is recent.
+    status_index, statuses = _choice(rng, SEED_STATUS_WEIGHTS, count)
+    age_days = (now - created).astype('timedelta64[D]').astype(np.int64)
+    pending = statuses.index('pending')
+    stale = (status_index == pending) & (age_days > SEED_PENDING_DAYS) & (rng.random(count) < 0.95)
+    status_index[stale] = np.where(rng.random(int(stale.sum())) < 0.8, statuses.index('verified'),
+                                   statuses.index('rejected'))
+    moderated = status_index != pending
+
+    review_delay = (rng.exponential(36.0, count) * 3600 * 1_000_000).astype('timedelta64[us]')
+    updated = np.where(moderated, np.minimum(created + review_delay, now), created)
+
+    subject_index = rng.integers(0, 4, size=count).tolist()
+    description_length = rng.integers(8, len(SEED_DESCRIPTION_WORDS) - 4, size=count).tolist()
+    description_offset = rng.integers(0, 4, size=count).tolist()
+
+    created_text = _timestamps(created)
+    updated_text = _timestamps(updated)
+    # Draw from the same sequence as live submissions so seeded and real
+    # codes can never collide.
+    codes = allocate_codes(count)
+    passphrases = _passphrases(rng, count)
+    category_list = category_index.tolist()
+    cluster_list = cluster_index.tolist()
+    status_list = status_index.tolist()
+    french_list = french.tolist()
+    latitude_list = latitudes.tolist()
+    longitude_list = longitudes.tolist()
+
+    rows = []
+    for i in range(count):
+        category = categories[category_list[i]]
+        offset = description_offset[i]
+        rows.append((
+            ids[i],
+            f'{SEED_TITLE_SUBJECTS[category][subject_index[i]]} in {SEED_CLUSTERS[cluster_list[i]][0]}',
+            category,
+            ' '.join(SEED_DESCRIPTION_WORDS[offset:offset + description_length[i]]),
+            latitude_list[i],
+            longitude_list[i],
+            statuses[status_list[i]],
+            'fr' if french_list[i] else 'en',
+            codes[i],
+            passphrases[i],
+            created_text[i],
+            updated_text[i]
+        ))
+    connection.executemany(
+        'INSERT INTO reports (id, title, category, description, latitude, longitude, status, language, '
+        'reference_code, passphrase, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        rows
+    )
+
+    moderated_rows = np.flatnonzero(moderated)
+    log_ids = _uuids(rng, len(moderated_rows))
+    moderators = rng.integers(0, len(moderator_ids), size=len(moderated_rows)).tolist()
+    connection.executemany(
+        'INSERT INTO verification_logs (id, report_id, user_id, action, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+        [(log_ids[n], ids[i], moderator_ids[moderators[n]], statuses[status_list[i]], '', updated_text[i])
+         for n, i in enumerate(moderated_rows.tolist())]
+    )
+
+    attached_rows = np.flatnonzero(rng.random(count) < attachment_rate)
+    attachment_ids = _uuids(rng, len(attached_rows))
+    type_index, content_types = _choice(rng, {name: share for name, (_, share) in SEED_ATTACHMENT_TYPES.items()},
+                                        len(attached_rows))
+    sizes = np.clip(rng.lognormal(12.5, 1.0, len(attached_rows)), 1024, 10 * 1024 * 1024).astype(np.int64).tolist()
+    type_list = type_index.tolist()
+    attachments = []
+    for n, i in enumerate(attached_rows.tolist()):
+        content_type = content_types[type_list[n]]
+        filename = f'evidence_{n}.{SEED_ATTACHMENT_TYPES[content_type][0]}'
+        report_id = str(uuid.UUID(bytes=ids[i])) if ID_STORAGE == 'binary' else ids[i]
+        attachments.append((attachment_ids[n], ids[i], filename, f'{report_id}/{filename}',
+                            sizes[n], content_type, created_text[i]))
+    connection.executemany(
+        'INSERT INTO report_attachments (id, report_id, filename, file_path, file_size, content_type, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        attachments
+    )
+
+    return {
+        'reports': count,
+        'verification_logs': len(moderated_rows),
+        'attachments': len(attachments)
+    }
+
+def _seed_purchases(connection, rng, researcher_ids: List[Any], per_researcher: float, seed: int,
+                    start, days: int) -> int:
+    counts = rng.poisson(per_researcher, len(researcher_ids))
+    total = int(counts.sum())
+    if not total:
+        return 0
+
+    owners = np.repeat(np.arange(len(researcher_ids)), counts)
+    ids = _uuids(rng, total)
+    created = start + (rng.integers(0, days * 86400, size=total) * 1_000_000).astype('timedelta64[us]')
+    expires = created + np.timedelta64(24, 'h')
+    category_index, categories = _choice(rng, SEED_CATEGORY_WEIGHTS, total)
+    filtered = rng.random(total) < 0.7
+    report_counts = rng.integers(50, 50000, size=total)
+
+    created_text = _timestamps(created)
+    expires_text = _timestamps(expires)
+    connection.executemany(
+        'INSERT INTO data_purchases (id, user_id, stripe_payment_intent_id, amount, report_count, filters, '
+        'status, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(ids[i], researcher_ids[owners[i]], f'pi_seed_{seed}_{i}', round(float(report_counts[i]) * 0.1, 2),
+          int(report_counts[i]),
+          json.dumps({'category': categories[category_index[i]]} if filtered[i] else {}),
+          'completed', created_text[i], expires_text[i]) for i in range(total)]
+    )
+    return total
+
+def seed_dataset(reports: int, seed: int = 0, moderators: int = 50, researchers: int = 500,
+                 purchases_per_researcher: float = 2.0, attachment_rate: float = 0.2,
+                 days: int = 730, now: Optional[datetime] = None) -> Dict[str, Any]:
+    _require_numpy()
+    if moderators < 1:
+        raise ValueError('At least one moderator is needed to attribute verification logs')
+
+    if User.query.filter(User.email == f'moderator-{seed}-0@{SEED_EMAIL_DOMAIN}').first():
+        raise RuntimeError(f'A dataset for seed {seed} is already present in this database')
+
+    started = time.perf_counter()
+    now = np.datetime64(now or SEED_EPOCH, 'us')
+    start = now - np.timedelta64(days, 'D')
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    counts = {'users': moderators + researchers, 'reports': 0, 'verification_logs': 0,
+              'attachments': 0, 'purchases': 0}
+
+    connection = db.engine.raw_connection()
+    # Detached, so the bulk-load PRAGMAs below go away with the connection
+    # instead of returning to the pool and serving later requests.
+    connection.detach()
+    try:
+        # Bulk-load settings for this connection only: nothing is fsynced
+        # until the end of each batch and sorting stays in memory.
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA synchronous = OFF')
+        cursor.execute('PRAGMA temp_store = MEMORY')
+        cursor.execute('PRAGMA cache_size = -262144')
+
+        rng = np.random.default_rng([seed, 0])
+        user_created = _timestamps(start + (rng.integers(0, days * 86400, size=moderators + researchers)
+                                            * 1_000_000).astype('timedelta64[us]'))
+        moderator_ids = _seed_users(cursor, rng, 'moderator', moderators, seed, password_hash,
+                                    user_created[:moderators])
+        researcher_ids = _seed_users(cursor, rng, 'researcher', researchers, seed, password_hash,
+                                     user_created[moderators:])
+        counts['purchases'] = _seed_purchases(cursor, rng, researcher_ids, purchases_per_researcher,
+                                              seed, start, days)
+        connection.commit()
+
+        for batch, offset in enumerate(range(0, reports, SEED_BATCH)):
+            # One generator per batch keeps the output identical however far
+            # a previous run got, and each batch is its own transaction.
+            rng = np.random.default_rng([seed, batch + 1])
+            result = _seed_report_batch(cursor, rng, min(SEED_BATCH, reports - offset), start, days, now,
+                                        moderator_ids, attachment_rate)
+            connection.commit()
+            for key, value in result.items():
+                counts[key] += value
+            logger.info(f"Seeded {counts['reports']}/{reports} reports")
+    finally:
+        connection.close()
+
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    counts['reports_per_second'] = round(counts['reports'] / counts['seconds']) if counts['seconds'] else 0
+    return counts
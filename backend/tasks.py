@@ -0,0 +1,156 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Any, Optional
+
+from sqlalchemy import and_, insert, or_, select, update
+
+from models import db, TaskRun
+from utils import logger
+
+TASK_POLL_SECONDS = 1.0
+EXCLUSIVE_TASK_SECONDS = int(os.environ.get('EXCLUSIVE_TASK_SECONDS', 3600))
+TASK_LEASE_SECONDS = int(os.environ.get('TASK_LEASE_SECONDS', 900))
+TASK_RETRY_SECONDS = 60
+
+_tasks: List[Dict[str, Any]] = []
+_started = False
+_lock = threading.Lock()
+
+def register_task(name: str, interval: float, func: Callable[[], Any],
+                  exclusive: Optional[bool] = None, dedicated: bool = False) -> None:
+    # Hourly and daily jobs run in one process at a time, whichever claims
+    # them first; everything shorter runs in every worker. Dedicated tasks get
+    # their own thread so a long job on the shared one cannot delay them.
+    if exclusive is None:
+        exclusive = interval >= EXCLUSIVE_TASK_SECONDS and not dedicated
+
+    with _lock:
+        if any(task['name'] == name for task in _tasks):
+            return
+        _tasks.append({'name': name, 'interval': interval, 'func': func, 'exclusive': exclusive,
+                       'dedicated': dedicated, 'next_run': None, 'last_run': None, 'last_error': None})
+
+def task_owner() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def claim_task(name: str, interval: float) -> bool:
+    now = datetime.utcnow()
+    due = and_(
+        TaskRun.name == name,
+        or_(TaskRun.leased_until.is_(None), TaskRun.leased_until < now),
+        or_(TaskRun.last_run_at.is_(None), TaskRun.last_run_at <= now - timedelta(seconds=interval))
+    )
+
+    with db.engine.begin() as connection:
+        if connection.execute(select(TaskRun.name).where(TaskRun.name == name)).first() is None:
+            connection.execute(insert(TaskRun).values(name=name).prefix_with('OR IGNORE', dialect='sqlite'))
+        elif connection.execute(select(TaskRun.name).where(due)).first() is None:
+            return False
+
+        claimed = connection.execute(update(TaskRun).where(due).values(
+            owner=task_owner(),
+            leased_until=now + timedelta(seconds=TASK_LEASE_SECONDS)
+        ))
+        return claimed.rowcount == 1
+
+def release_task(name: str, completed: bool) -> None:
+    values = {'owner': None, 'leased_until': None}
+    if completed:
+        values['last_run_at'] = datetime.utcnow()
+
+    with db.engine.begin() as connection:
+        connection.execute(update(TaskRun)
+                           .where(TaskRun.name == name, TaskRun.owner == task_owner())
+                           .values(**values))
+
+def run_task(task: Dict[str, Any]) -> bool:
+    if task['exclusive'] and not claim_task(task['name'], task['interval']):
+        return False
+
+    completed = False
+    try:
+        task['func']()
+        completed = True
+    finally:
+        if task['exclusive']:
+            db.session.rollback()
+            release_task(task['name'], completed)
+    return True
+
+def run_due_tasks(app) -> None:
+    now = time.monotonic()
+    for task in list(_tasks):
+        if task['dedicated']:
+            continue
+        if task['next_run'] is None:
+            # Nothing runs the moment a process starts, otherwise every
+            # worker boot and recycle would repeat the daily jobs.
+            task['next_run'] = now + task['interval']
+            continue
+        if task['next_run'] > now:
+            continue
+
+        task['next_run'] = now + task['interval']
+        try:
+            with app.app_context():
+                if not run_task(task):
+                    # Another process ran it recently or is running it now.
+                    task['next_run'] = now + min(task['interval'], TASK_RETRY_SECONDS)
+                    continue
+            task['last_error'] = None
+        except Exception as e:
+            task['last_error'] = str(e)
+            logger.error(f"Background task {task['name']} failed: {str(e)}")
+        task['last_run'] = time.time()
+
+def _run_dedicated(app, task: Dict[str, Any]) -> None:
+    # Runs straight away, unlike the shared loop: these are cheap probes
+    # whose first result is needed at startup.
+    while True:
+        started = time.monotonic()
+        try:
+            with app.app_context():
+                task['func']()
+            task['last_error'] = None
+        except Exception as e:
+            task['last_error'] = str(e)
+            logger.error(f"Background task {task['name']} failed: {str(e)}")
+        task['last_run'] = time.time()
+        time.sleep(max(0.0, task['interval'] - (time.monotonic() - started)))
+
+def start_background_tasks(app) -> bool:
+    global _started
+
+    if _started or not app.config.get('BACKGROUND_TASKS', True):
+        return False
+
+    with _lock:
+        if _started:
+            return False
+        _started = True
+
+    def loop():
+        while True:
+            run_due_tasks(app)
+            time.sleep(TASK_POLL_SECONDS)
+
+    thread = threading.Thread(target=loop, name='civicvoice-tasks', daemon=True)
+    thread.start()
+    for task in _tasks:
+        if task['dedicated']:
+            threading.Thread(target=_run_dedicated, args=(app, task),
+                             name=f"civicvoice-{task['name']}", daemon=True).start()
+    logger.info(f"Background tasks started in process {os.getpid()}")
+    return True
+
+def task_status() -> List[Dict[str, Any]]:
+    return [{
+        'name': task['name'],
+        'interval': task['interval'],
+        'exclusive': task['exclusive'],
+        'last_run': task['last_run'],
+        'last_error': task['last_error']
+    } for task in _tasks]
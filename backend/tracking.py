@@ -0,0 +1,104 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from models import db, Report, VerificationLog
+from events import broker
+
+TRACK_CACHE_TTL = float(os.environ.get('TRACK_CACHE_TTL', 30))
+TRACK_NEGATIVE_TTL = float(os.environ.get('TRACK_NEGATIVE_TTL', 10))
+TRACK_CACHE_SIZE = 10000
+
+_track_cache = OrderedDict()
+_track_codes = {}
+_track_lock = threading.Lock()
+_track_stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'invalidations': 0}
+
+def load_tracking(reference_code: str) -> Optional[Dict[str, Any]]:
+    # Report and its status history in one query: the reference code index
+    # finds the report and the (report_id, created_at) index orders its logs.
+    rows = db.session.query(
+        Report.id, Report.passphrase, Report.title, Report.category, Report.status,
+        Report.created_at, Report.updated_at,
+        VerificationLog.action, VerificationLog.notes, VerificationLog.created_at
+    ).outerjoin(VerificationLog, VerificationLog.report_id == Report.id) \
+        .filter(Report.reference_code == reference_code) \
+        .order_by(VerificationLog.created_at.desc()).all()
+
+    if not rows:
+        return None
+
+    first = rows[0]
+    body = {
+        'report': {
+            'id': first[0],
+            'title': first[2],
+            'category': first[3],
+            'status': first[4],
+            'submitted_at': first[5].isoformat(),
+            'last_updated': first[6].isoformat()
+        },
+        'status_history': [{
+            'action': row[7],
+            'notes': row[8],
+            'timestamp': row[9].isoformat()
+        } for row in rows if row[7] is not None]
+    }
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+
+    return {'report_id': first[0], 'passphrase': first[1], 'body': body, 'etag': digest[:32]}
+
+def _store(reference_code: str, entry: Optional[Dict[str, Any]]) -> None:
+    ttl = TRACK_CACHE_TTL if entry else TRACK_NEGATIVE_TTL
+    with _track_lock:
+        _track_cache[reference_code] = (time.monotonic() + ttl, entry)
+        _track_cache.move_to_end(reference_code)
+        if entry:
+            _track_codes[entry['report_id']] = reference_code
+
+        while len(_track_cache) > TRACK_CACHE_SIZE:
+            _, (_, evicted) = _track_cache.popitem(last=False)
+            if evicted:
+                _track_codes.pop(evicted['report_id'], None)
+
+def lookup_tracking(reference_code: str, passphrase: str) -> Optional[Dict[str, Any]]:
+    now = time.monotonic()
+    with _track_lock:
+        cached = _track_cache.get(reference_code)
+        if cached and cached[0] > now:
+            entry = cached[1]
+            _track_stats['hits' if entry else 'negative_hits'] += 1
+        else:
+            cached = None
+            _track_stats['misses'] += 1
+
+    if cached is None:
+        entry = load_tracking(reference_code)
+        _store(reference_code, entry)
+
+    if not entry or not hmac.compare_digest(entry['passphrase'].encode('utf-8'), str(passphrase).encode('utf-8')):
+        return None
+    return entry
+
+def invalidate_tracking(report_ids: List[str]) -> int:
+    removed = 0
+    with _track_lock:
+        for report_id in report_ids:
+            reference_code = _track_codes.pop(report_id, None)
+            if reference_code and _track_cache.pop(reference_code, None):
+                removed += 1
+        _track_stats['invalidations'] += removed
+    return removed
+
+def tracking_cache_stats() -> Dict[str, int]:
+    with _track_lock:
+        return {'size': len(_track_cache), **_track_stats}
+
+# Moderation events reach every worker through the broker poll, so a status
+# change in one process evicts the cached entry in all of them.
+broker.subscribe(lambda events: invalidate_tracking([event['report_id'] for event in events]))
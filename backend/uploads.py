@@ -0,0 +1,183 @@
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, MissingAttachment, ReportAttachment
+from utils import logger, remove_empty_dirs, UPLOAD_FOLDER
+
+UPLOAD_ORPHAN_GRACE_SECONDS = float(os.environ.get('UPLOAD_ORPHAN_GRACE_SECONDS', 3600))
+UPLOAD_QUARANTINE_SECONDS = float(os.environ.get('UPLOAD_QUARANTINE_SECONDS', 7 * 24 * 3600))
+UPLOAD_SWEEP_BATCH = 500
+QUARANTINE_DIR = '.quarantine'
+
+def _scan(root: str) -> Iterator[Tuple[str, os.DirEntry]]:
+    # Iterative scandir keeps memory flat however many report directories
+    # there are; dot entries hold the quarantine and in-flight temp files.
+    pending = [root]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield os.path.relpath(entry.path, root), entry
+        except FileNotFoundError:
+            continue
+
+def _batches(items: Iterator[Any], size: int = UPLOAD_SWEEP_BATCH) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _known_paths(paths: List[str]) -> set:
+    known = set(db.session.execute(
+        select(ReportAttachment.file_path).where(ReportAttachment.file_path.in_(paths))
+    ).scalars())
+    # End the read transaction straight away so the sweep never pins a
+    # snapshot or lock between batches.
+    db.session.rollback()
+    return known
+
+def _move(source: str, target: str, mtime: float) -> bool:
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+        os.utime(target, (mtime, mtime))
+        return True
+    except FileNotFoundError:
+        # Another worker's sweep got there first.
+        return False
+
+def quarantine_orphans(now: float, dry_run: bool = False) -> Dict[str, int]:
+    quarantine_root = os.path.join(UPLOAD_FOLDER, QUARANTINE_DIR)
+    result = {'scanned_files': 0, 'scanned_bytes': 0, 'quarantined': 0, 'quarantined_bytes': 0, 'empty_dirs_removed': 0}
+
+    for batch in _batches(_scan(UPLOAD_FOLDER)):
+        files = []
+        for relative_path, entry in batch:
+            stat = entry.stat(follow_symlinks=False)
+            result['scanned_files'] += 1
+            result['scanned_bytes'] += stat.st_size
+            # save_file_upload writes before the commit, so young files may
+            # belong to a submission that is still in flight.
+            if now - stat.st_mtime >= UPLOAD_ORPHAN_GRACE_SECONDS:
+                files.append((relative_path, entry.path, stat.st_size))
+        if not files:
+            continue
+
+        known = _known_paths([relative_path for relative_path, _, _ in files])
+        for relative_path, path, size in files:
+            if relative_path in known:
+                continue
+            # The file's mtime becomes the quarantine timestamp.
+            if dry_run or _move(path, os.path.join(quarantine_root, relative_path), now):
+                result['quarantined'] += 1
+                result['quarantined_bytes'] += size
+            if not dry_run:
+                result['empty_dirs_removed'] += remove_empty_dirs(os.path.dirname(path), UPLOAD_FOLDER)
+
+    return result
+
+def purge_quarantine(now: float, dry_run: bool = False) -> Dict[str, int]:
+    quarantine_root = os.path.join(UPLOAD_FOLDER, QUARANTINE_DIR)
+    result = {'restored': 0, 'deleted': 0, 'reclaimed_bytes': 0}
+    if not os.path.isdir(quarantine_root):
+        return result
+
+    for batch in _batches(_scan(quarantine_root)):
+        known = _known_paths([relative_path for relative_path, _ in batch])
+        for relative_path, entry in batch:
+            stat = entry.stat(follow_symlinks=False)
+            if relative_path in known:
+                # A row now points at it (restored backup, late commit): put it back.
+                if dry_run or _move(entry.path, os.path.join(UPLOAD_FOLDER, relative_path), stat.st_mtime):
+                    result['restored'] += 1
+            elif now - stat.st_mtime >= UPLOAD_QUARANTINE_SECONDS:
+                if not dry_run:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    remove_empty_dirs(os.path.dirname(entry.path), quarantine_root)
+                result['deleted'] += 1
+                result['reclaimed_bytes'] += stat.st_size
+
+    return result
+
+def flag_missing_files(dry_run: bool = False) -> Dict[str, int]:
+    result = {'checked_rows': 0, 'missing': 0, 'newly_flagged': 0, 'cleared': 0}
+    last_id = None
+
+    while True:
+        query = select(ReportAttachment.id, ReportAttachment.file_path).order_by(ReportAttachment.id) \
+            .limit(UPLOAD_SWEEP_BATCH)
+        if last_id is not None:
+            query = query.where(ReportAttachment.id > last_id)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        flagged = set(db.session.execute(
+            select(MissingAttachment.attachment_id)
+            .where(MissingAttachment.attachment_id.in_([row[0] for row in rows]))
+        ).scalars())
+        db.session.rollback()
+
+        missing = [(attachment_id, file_path) for attachment_id, file_path in rows
+                   if not os.path.exists(os.path.join(UPLOAD_FOLDER, file_path))]
+        missing_ids = {attachment_id for attachment_id, _ in missing}
+        present = [attachment_id for attachment_id in flagged if attachment_id not in missing_ids]
+
+        result['checked_rows'] += len(rows)
+        result['missing'] += len(missing)
+        result['newly_flagged'] += len(missing_ids - flagged)
+        result['cleared'] += len(present)
+
+        if dry_run or not (missing or present):
+            continue
+
+        now = datetime.utcnow()
+        if missing:
+            statement = sqlite_insert(MissingAttachment)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['attachment_id'],
+                set_={'file_path': statement.excluded.file_path, 'last_checked_at': statement.excluded.last_checked_at}
+            ), [{'attachment_id': attachment_id, 'file_path': file_path, 'detected_at': now, 'last_checked_at': now}
+                for attachment_id, file_path in missing])
+        if present:
+            db.session.execute(delete(MissingAttachment).where(MissingAttachment.attachment_id.in_(present)))
+        db.session.commit()
+
+    return result
+
+def sweep_uploads(dry_run: bool = False) -> Dict[str, Any]:
+    if not os.path.isdir(UPLOAD_FOLDER):
+        return {}
+
+    now = time.time()
+    result = {
+        **quarantine_orphans(now, dry_run),
+        **purge_quarantine(now, dry_run),
+        **flag_missing_files(dry_run)
+    }
+    logger.info(f"Upload sweep{' (dry run)' if dry_run else ''}: {result['scanned_files']} files, "
+                f"quarantined {result['quarantined']} orphans ({result['quarantined_bytes']} bytes), "
+                f"deleted {result['deleted']} ({result['reclaimed_bytes']} bytes reclaimed), "
+                f"{result['missing']} attachments missing their file")
+    return result
+
+@event.listens_for(ReportAttachment, 'after_delete')
+def _remove_missing_flag(mapper, connection, target):
+    connection.execute(delete(MissingAttachment).where(MissingAttachment.attachment_id == target.id))
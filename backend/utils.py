@@ -1,17 +1,15 @@
+import importlib
 import uuid
 import os
+import json
 import secrets
-import string
+import time
 from typing import Dict, Any, Optional, Union, List
 from werkzeug.utils import secure_filename
 from datetime import datetime
+from functools import lru_cache
 import logging
 
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
-
 try:
     from email.mime.text import MimeText
     from email.mime.multipart import MimeMultipart
@@ -19,14 +17,24 @@ except ImportError:
     MimeText = None
     MimeMultipart = None
 
-try:
-    import jwt
-except ImportError:
-    jwt = None
+PASSPHRASE_WORDS = [
+    'apple', 'brave', 'chair', 'dance', 'eagle', 'flame', 'grace', 'heart',
+    'ivory', 'jolly', 'kraft', 'lemon', 'music', 'novel', 'ocean', 'peace',
+    'queen', 'river', 'smile', 'tower', 'unity', 'voice', 'water', 'youth'
+]
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=None)
+def optional_import(name: str):
+    # Heavy optional dependencies load on first use, so workers, CLI commands
+    # and scripts that never need them skip the import cost entirely.
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
 UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
 MAX_FILE_SIZE = 10 * 1024 * 1024
 ALLOWED_EXTENSIONS = {
@@ -35,17 +43,22 @@ ALLOWED_EXTENSIONS = {
     'all': {'png', 'jpg', 'jpeg', 'gif', 'webp', 'pdf', 'doc', 'docx', 'txt'}
 }
 
-def generate_reference_code() -> str:
-    return ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
+ID_VERSION = os.environ.get('ID_VERSION', '4')
 
-def generate_passphrase() -> str:
-    words = [
-        'apple', 'brave', 'chair', 'dance', 'eagle', 'flame', 'grace', 'heart',
-        'ivory', 'jolly', 'kraft', 'lemon', 'music', 'novel', 'ocean', 'peace',
-        'queen', 'river', 'smile', 'tower', 'unity', 'voice', 'water', 'youth'
-    ]
+def generate_id() -> str:
+    if ID_VERSION != '7':
+        return str(uuid.uuid4())
 
-    passphrase_words = secrets.SystemRandom().sample(words, 3)
+    # UUIDv7: 48-bit unix ms timestamp, version, then random bits, so
+    # consecutive ids sort by creation time and append to the pk index.
+    timestamp_ms = time.time_ns() // 1_000_000
+    value = (timestamp_ms & 0xFFFFFFFFFFFF) << 80 | int.from_bytes(os.urandom(10), 'big')
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return str(uuid.UUID(int=value))
+
+def generate_passphrase() -> str:
+    passphrase_words = secrets.SystemRandom().sample(PASSPHRASE_WORDS, 3)
     random_number = secrets.randbelow(999) + 1
 
     return f"{'-'.join(passphrase_words)}-{random_number:03d}"
@@ -75,6 +88,7 @@ def validate_file_upload(file) -> Dict[str, Any]:
         if file_size == 0:
             return {'valid': False, 'error': 'File is empty'}
 
+        Image = optional_import('PIL.Image')
         if Image and file.content_type and file.content_type.startswith('image/'):
             try:
                 file.seek(0)
@@ -114,17 +128,25 @@ def save_file_upload(file, report_id: str) -> Optional[str]:
         logger.error(f"File save error: {str(e)}")
         return None
 
+def remove_empty_dirs(path: str, root: str) -> int:
+    removed = 0
+    root = os.path.abspath(root)
+    path = os.path.abspath(path)
+    while path != root and path.startswith(root + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            break
+        removed += 1
+        path = os.path.dirname(path)
+    return removed
+
 def delete_file_upload(file_path: str) -> bool:
     try:
         full_path = os.path.join(UPLOAD_FOLDER, file_path)
         if os.path.exists(full_path):
             os.remove(full_path)
-
-            dir_path = os.path.dirname(full_path)
-            try:
-                os.rmdir(dir_path)
-            except OSError:
-                pass
+            remove_empty_dirs(os.path.dirname(full_path), UPLOAD_FOLDER)
 
         return True
     except Exception as e:
@@ -139,7 +161,7 @@ def create_moderator_account(email: str, password: str, organization: Optional[s
             return {'success': False, 'error': 'Email already exists'}
 
         moderator = User(
-            id=str(uuid.uuid4()),
+            id=generate_id(),
             email=email,
             role='moderator',
             organization=organization,
@@ -170,7 +192,7 @@ def create_researcher_account(email: str, password: str, organization: str) -> D
             return {'success': False, 'error': 'Email already exists'}
 
         researcher = User(
-            id=str(uuid.uuid4()),
+            id=generate_id(),
             email=email,
             role='researcher',
             organization=organization,
@@ -226,6 +248,7 @@ def send_verification_email(email: str, user_id: str) -> bool:
         return False
 
 def generate_verification_token(user_id: str) -> str:
+    jwt = optional_import('jwt')
     if not jwt:
         raise ImportError("PyJWT is required for token generation")
 
@@ -244,6 +267,7 @@ def generate_verification_token(user_id: str) -> str:
     return jwt.encode(payload, secret_key, algorithm='HS256')
 
 def verify_email_token(token: str) -> Dict[str, Any]:
+    jwt = optional_import('jwt')
     if not jwt:
         return {'valid': False, 'error': 'JWT library not available'}
 
@@ -301,7 +325,7 @@ def set_system_setting(key: str, value: Any, description: Optional[str] = None)
                 setting.description = description
         else:
             setting = SystemSettings(
-                id=str(uuid.uuid4()),
+                id=generate_id(),
                 key=key,
                 value=str(value),
                 description=description
@@ -404,22 +428,33 @@ def generate_analytics_report() -> Optional[Dict[str, Any]]:
 def cleanup_expired_downloads() -> int:
     try:
         from models import DataPurchase
+        from exports import evict_artifacts, filters_hash
 
-        expired_purchases = DataPurchase.query.filter(
-            DataPurchase.expires_at < datetime.utcnow()
+        active_purchases = DataPurchase.query.filter(
+            DataPurchase.expires_at >= datetime.utcnow()
         ).all()
 
-        for purchase in expired_purchases:
-            pass
+        referenced = set()
+        pinned = set()
+        for purchase in active_purchases:
+            if purchase.download and purchase.download.status != 'completed':
+                pinned.add(purchase.download.etag)
+            try:
+                referenced.add(filters_hash(json.loads(purchase.filters or '{}')))
+            except ValueError:
+                continue
+
+        result = evict_artifacts(referenced, pinned)
 
-        logger.info(f"Found {len(expired_purchases)} expired download tokens")
-        return len(expired_purchases)
+        logger.info(f"Evicted {result['evicted']} export artifacts, reclaimed {result['reclaimed_bytes']} bytes")
+        return result['evicted']
 
     except Exception as e:
         logger.error(f"Cleanup error: {str(e)}")
         return 0
 
 def generate_password_reset_token(user_id: str) -> str:
+    jwt = optional_import('jwt')
     if not jwt:
         raise ImportError("PyJWT is required for token generation")
 
@@ -438,6 +473,7 @@ def generate_password_reset_token(user_id: str) -> str:
     return jwt.encode(payload, secret_key, algorithm='HS256')
 
 def verify_password_reset_token(token: str) -> Dict[str, Any]:
+    jwt = optional_import('jwt')
     if not jwt:
         return {'valid': False, 'error': 'JWT library not available'}
 